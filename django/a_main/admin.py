@@ -1,10 +1,63 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from .models import CustomerProfile, Appointment, Contact, Content, ContentMedia
+from .models import (
+    CustomerProfile, Appointment, AppointmentReminder, Contact, Content, ContentMedia,
+    MagicLinkToken)
 from django.utils.html import format_html
-from django.urls import reverse
-from django.utils.safestring import mark_safe
+
+from .exports import EXPORTS, export_response
+from .pagination import EstimatedCountPaginator
+from . import search
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist defaults for tables that grow without bound: no second
+    COUNT(*) for the "n total" link, and planner estimates instead of
+    exact counts for big unfiltered lists.  Subclasses list their foreign
+    keys in ``list_select_related``.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class FullTextSearchMixin:
+    """
+    Searches the changelist with ``search_function`` (see a_main.search) on
+    Postgres, where it uses the full-text and trigram indexes.  Elsewhere
+    the ILIKE search over ``search_fields`` is kept.
+    """
+    search_function = None
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if search_term and search.uses_postgres(queryset.db):
+            return type(self).search_function(queryset, search_term), False
+        return super().get_search_results(request, queryset, search_term)
+
+
+def thumbnail_preview(media):
+    # loading="lazy": the browser only fetches previews scrolled into view.
+    if media.file:
+        return format_html('<img src="{}" width="100" loading="lazy" alt="">',
+                           media.thumbnail.url)
+    return ""
+
+
+def export_actions(name):
+    """Admin actions exporting the selected rows through EXPORTS[name]."""
+    export = EXPORTS[name]
+
+    @admin.action(description="Export selected as CSV")
+    def export_csv(modeladmin, request, queryset):
+        return export_response(export, 'csv', queryset)
+
+    @admin.action(description="Export selected as XLSX")
+    def export_xlsx(modeladmin, request, queryset):
+        return export_response(export, 'xlsx', queryset)
+
+    return [export_csv, export_xlsx]
 
 
 class CustomerProfileInline(admin.StackedInline):
@@ -14,25 +67,15 @@ class CustomerProfileInline(admin.StackedInline):
     fk_name = 'user'
     fields = (
         'first_contact', 'recent_contact', 'interest',
-        'first_session', 'custnotes', 'magic_link'
+        'first_session', 'custnotes'
     )
-    readonly_fields = ('first_contact', 'magic_link')
-
-    def magic_link(self, instance):
-        if instance.magic_link_token and instance.magic_link_expires:
-            return format_html(
-                '<a href="{}?token={}" target="_blank">Magic Link</a> (expires {})',
-                # You'll need to set up this URL in your urls.py
-                reverse('magic_link_view'),
-                instance.magic_link_token,
-                instance.magic_link_expires.strftime("%Y-%m-%d %H:%M")
-            )
-        return "Not generated"
-    magic_link.short_description = "Magic Link"
+    readonly_fields = ('first_contact',)
 
 
 class CustomUserAdmin(UserAdmin):
     inlines = (CustomerProfileInline, )
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_display = ('username', 'email', 'first_name', 'last_name',
                     'is_staff', 'get_interest', 'get_first_contact')
     list_select_related = ('profile', )
@@ -52,14 +95,16 @@ class CustomUserAdmin(UserAdmin):
 
 
 @admin.register(CustomerProfile)
-class CustomerProfileAdmin(admin.ModelAdmin):
+class CustomerProfileAdmin(FullTextSearchMixin, LargeTableAdmin):
     list_display = ('user', 'first_contact', 'recent_contact',
                     'interest', 'first_session')
     list_filter = ('interest', 'first_contact', 'first_session')
     search_fields = ('user__username', 'user__first_name',
                      'user__last_name', 'custnotes')
+    search_function = search.search_customers
     raw_id_fields = ('user',)
-    date_hierarchy = 'first_contact'
+    list_select_related = ('user',)
+    actions = export_actions('customers')
 
     fieldsets = (
         (None, {
@@ -71,23 +116,48 @@ class CustomerProfileAdmin(admin.ModelAdmin):
         ('Notes', {
             'fields': ('custnotes',)
         }),
-        ('Magic Link', {
-            'fields': ('magic_link_token', 'magic_link_expires'),
-            'classes': ('collapse',)
-        }),
     )
 
     readonly_fields = ('first_contact',)
 
 
+@admin.register(MagicLinkToken)
+class MagicLinkTokenAdmin(LargeTableAdmin):
+    # Tokens are only stored hashed, so links cannot be shown or made here.
+    list_display = ('user', 'created_at', 'expires_at', 'used_at')
+    list_filter = ('used_at', 'expires_at')
+    search_fields = ('user__username', 'user__email')
+    raw_id_fields = ('user',)
+    list_select_related = ('user',)
+    readonly_fields = ('user', 'created_at', 'expires_at', 'used_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+class AppointmentReminderInline(admin.TabularInline):
+    model = AppointmentReminder
+    extra = 0
+    fields = ('kind', 'sent_at')
+    readonly_fields = ('kind', 'sent_at')
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Appointment)
-class AppointmentAdmin(admin.ModelAdmin):
+class AppointmentAdmin(FullTextSearchMixin, LargeTableAdmin):
     list_display = ('customer', 'date', 'kp_notes_short',
                     'fu_notes_short', 'invoiced', 'paid', 'created_at')
     list_filter = ('invoiced', 'paid', 'date')
     search_fields = ('customer__user__username', 'kp_notes', 'fu_notes')
+    search_function = search.search_appointments
     raw_id_fields = ('customer',)
-    date_hierarchy = 'date'
+    # The customer column prints customer.user.username.
+    list_select_related = ('customer__user',)
+    inlines = (AppointmentReminderInline,)
+    actions = export_actions('appointments')
 
     fieldsets = (
         (None, {
@@ -111,12 +181,13 @@ class AppointmentAdmin(admin.ModelAdmin):
 
 
 @admin.register(Contact)
-class ContactAdmin(admin.ModelAdmin):
+class ContactAdmin(FullTextSearchMixin, LargeTableAdmin):
     list_display = ('name', 'email', 'subject', 'when_sent',
                     'replied', 'when_replied', 'message_short')
     list_filter = ('replied', 'when_sent')
     search_fields = ('name', 'email', 'subject', 'message')
-    date_hierarchy = 'when_sent'
+    search_function = search.search_messages
+    actions = export_actions('messages')
 
     fieldsets = (
         (None, {
@@ -138,15 +209,13 @@ class ContentMediaInline(admin.TabularInline):
     fields = ('file', 'thumbnail_preview', 'media_type', 'caption', 'order')
     readonly_fields = ('thumbnail_preview',)
 
+    @admin.display(description='Preview')
     def thumbnail_preview(self, obj):
-        if obj.file:
-            return mark_safe(f'<img src="{obj.thumbnail.url}" width="100" />')
-        return ""
-    thumbnail_preview.short_description = 'Preview'
+        return thumbnail_preview(obj)
 
 
 @admin.register(Content)
-class ContentAdmin(admin.ModelAdmin):
+class ContentAdmin(LargeTableAdmin):
     list_display = ('title', 'content_type', 'enabled',
                     'order', 'created_at', 'updated_at')
     list_filter = ('content_type', 'enabled')
@@ -165,18 +234,17 @@ class ContentAdmin(admin.ModelAdmin):
 
 
 @admin.register(ContentMedia)
-class ContentMediaAdmin(admin.ModelAdmin):
+class ContentMediaAdmin(LargeTableAdmin):
     list_display = ('content', 'media_type', 'thumbnail_preview',
                     'caption', 'order', 'created_at')
     list_filter = ('media_type',)
     search_fields = ('content__title', 'caption')
+    list_select_related = ('content',)
     date_hierarchy = 'created_at'
 
+    @admin.display(description='Preview')
     def thumbnail_preview(self, obj):
-        if obj.file:
-            return mark_safe(f'<img src="{obj.thumbnail.url}" width="100" />')
-        return ""
-    thumbnail_preview.short_description = 'Preview'
+        return thumbnail_preview(obj)
 
 
 # Unregister the default User admin and register our custom one
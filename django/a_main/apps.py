@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class A_mainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'a_main'
+
+    def ready(self):
+        import a_main.signals
+        from a_main import search
+
+        post_migrate.connect(search.install, sender=self)
@@ -0,0 +1,7 @@
+"""
+Performance regression benchmarks for the a_main site.
+
+Run with ``python manage.py benchmark``.  The suite builds a throwaway
+test database, seeds it with a realistic dataset and compares the results
+against the committed ``baseline.json``.
+"""
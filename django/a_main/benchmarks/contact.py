@@ -0,0 +1,124 @@
+import statistics
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from ..instrumentation import QueryRecorder
+from ..microsoft_graph import MicrosoftGraphEmailSender
+from ..ratelimit import limiter
+from .routes import percentile
+
+
+def _submission(email, i):
+    return {
+        'name': f"Burst Visitor {i}",
+        'email': email,
+        'subject': '[Coaching]',
+        'message': "I saw your campaign and would like to know more. " * 5,
+    }
+
+
+def run_contact_burst(dataset, submissions=300):
+    """
+    Replay a campaign spike against the contact form.
+
+    ``new`` posts come from unseen addresses (user, profile and membership
+    are created); ``repeat`` posts come from existing customers.  Returns
+    metrics in the same shape as the route suite, plus throughput.
+    """
+    client = Client(raise_request_exception=False)
+    url = reverse('contact')
+    existing = [user.email for user in dataset.customers]
+
+    scenarios = {
+        'new': [f"burst{i}@example.com" for i in range(submissions)],
+        'repeat': [existing[i % len(existing)] for i in range(submissions)],
+    }
+
+    results = {}
+    with mock.patch.object(MicrosoftGraphEmailSender, 'send_email', return_value=True):
+        for scenario, emails in scenarios.items():
+            walls, queries, db_times, statuses = [], [], [], set()
+            burst_start = time.perf_counter()
+            for i, email in enumerate(emails):
+                recorder = QueryRecorder()
+                with connection.execute_wrapper(recorder):
+                    start = time.perf_counter()
+                    response = client.post(url, _submission(email, i))
+                    walls.append(time.perf_counter() - start)
+                queries.append(recorder.count)
+                db_times.append(recorder.duration)
+                statuses.add(response.status_code)
+            elapsed = time.perf_counter() - burst_start
+
+            results[f"contact-burst|{scenario}"] = {
+                'status': max(statuses),
+                'queries': statistics.median_low(queries),
+                'cold_queries': queries[0],
+                'db_ms': round(statistics.median(db_times) * 1000, 3),
+                'render_ms': 0.0,
+                'p50_ms': round(percentile(walls, 50) * 1000, 3),
+                'p95_ms': round(percentile(walls, 95) * 1000, 3),
+                'per_second': round(len(emails) / elapsed, 1),
+            }
+    return results
+
+
+def _metrics(samples):
+    walls, queries, statuses = zip(*samples)
+    return {
+        'status': max(statuses),
+        'queries': statistics.median_low(queries),
+        'cold_queries': queries[0],
+        'db_ms': 0.0,
+        'render_ms': 0.0,
+        'p50_ms': round(percentile(walls, 50) * 1000, 3),
+        'p95_ms': round(percentile(walls, 95) * 1000, 3),
+    }
+
+
+def run_contact_flood(submissions=100, flood_ratio=10):
+    """
+    Legitimate contact posts while one address floods the form.
+
+    ``quiet`` is the legitimate posts alone, ``flooded`` the same number
+    interleaved with ``flood_ratio`` bot posts each, half of them filling
+    the honeypot.  ``rejected`` is the bot posts, which should be turned
+    away without a query.  Rate limiting is enabled for this suite only.
+    """
+    client = Client(raise_request_exception=False)
+    url = reverse('contact')
+
+    def post(data, address):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            start = time.perf_counter()
+            response = client.post(url, data, REMOTE_ADDR=address)
+            wall = time.perf_counter() - start
+        return wall, recorder.count, response.status_code
+
+    results = {}
+    with mock.patch.object(MicrosoftGraphEmailSender, 'send_email', return_value=True), \
+            override_settings(RATELIMIT_ENABLED=True, RATELIMIT_PROXY_HOPS=0):
+        cache.clear()
+        limiter.reset()
+        for scenario, flood in (('quiet', 0), ('flooded', flood_ratio)):
+            legit, bots = [], []
+            for i in range(submissions):
+                for j in range(flood):
+                    data = _submission(f"bot{i}-{j}@example.net", j)
+                    if j % 2:
+                        data['website'] = 'http://spam.example.net'
+                    bots.append(post(data, '203.0.113.66'))
+                # Every legitimate visitor has their own address and email.
+                legit.append(post(
+                    _submission(f"{scenario}{i}@example.com", i),
+                    f"10.{flood}.{i // 250}.{i % 250 + 1}"))
+            results[f"contact-flood|{scenario}"] = _metrics(legit)
+            if bots:
+                results['contact-flood|rejected'] = _metrics(bots)
+    return results
@@ -0,0 +1,169 @@
+import io
+import random
+from datetime import timedelta
+
+from PIL import Image
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User, Group
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils.timezone import now
+
+from .. import rollups
+from ..models import CustomerProfile, Appointment, Contact, Content, ContentMedia
+from ..roles import CUSTOMERS_GROUP, MANAGERS_GROUP
+
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+
+class Dataset:
+    """Handles to the seeded objects the route specs need."""
+
+    def __init__(self, customers, customer, manager, superuser, profile, appointment, content):
+        self.customers = customers
+        self.customer = customer
+        self.manager = manager
+        self.superuser = superuser
+        self.profile = profile
+        self.appointment = appointment
+        self.content = content
+
+    def users(self):
+        return {
+            'anonymous': None,
+            'customer': self.customer,
+            'manager': self.manager,
+            'superuser': self.superuser,
+        }
+
+
+def _placeholder_jpeg():
+    buffer = io.BytesIO()
+    Image.new('RGB', (1200, 300), (200, 200, 200)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def seed(customers=2000, appointments=20000, content=300, batch_size=1000, seed_value=0):
+    """
+    Seed the current database with a realistic dataset.
+
+    Everything is written with bulk_create so seeding thousands of customers
+    and tens of thousands of appointments takes seconds rather than minutes.
+    """
+    rng = random.Random(seed_value)
+    current = now()
+    # Hashing is deliberately slow; every seeded user shares one hash.
+    password = make_password(BENCHMARK_PASSWORD)
+
+    customers_group, _ = Group.objects.get_or_create(name=CUSTOMERS_GROUP)
+    managers_group, _ = Group.objects.get_or_create(name=MANAGERS_GROUP)
+
+    User.objects.bulk_create([
+        User(
+            username=f"customer{i}@example.com",
+            email=f"customer{i}@example.com",
+            first_name=f"First{i}",
+            last_name=f"Last{i}",
+            password=password,
+        )
+        for i in range(customers)
+    ], batch_size=batch_size)
+    users = list(User.objects.filter(
+        username__startswith='customer').order_by('id'))
+
+    CustomerProfile.objects.bulk_create([
+        CustomerProfile(
+            user=user,
+            interest=rng.choice(['Coaching', 'HR Advisory', 'Consulting']),
+            recent_contact=current - timedelta(days=rng.randint(0, 365)),
+            first_session=current + timedelta(days=rng.randint(-365, 60)),
+            custnotes=f"Notes for {user.username}. " * rng.randint(1, 20),
+        )
+        for user in users
+    ], batch_size=batch_size)
+    profiles = list(CustomerProfile.objects.order_by('id'))
+
+    Group.user_set.through.objects.bulk_create([
+        Group.user_set.through(user_id=user.id, group_id=customers_group.id)
+        for user in users
+    ], batch_size=batch_size)
+
+    Appointment.objects.bulk_create([
+        Appointment(
+            customer=rng.choice(profiles),
+            date=current + timedelta(hours=rng.randint(-24 * 365, 24 * 90)),
+            kp_notes="Key point. " * rng.randint(0, 50),
+            fu_notes="Follow up. " * rng.randint(0, 50),
+            invoiced=rng.random() < 0.7,
+            paid=rng.random() < 0.5,
+        )
+        for _ in range(appointments)
+    ], batch_size=batch_size)
+
+    Contact.objects.bulk_create([
+        Contact(
+            name=f"First{i} Last{i}",
+            email=f"customer{i}@example.com",
+            subject='Coaching',
+            message="Hello there. " * rng.randint(1, 30),
+            when_sent=current - timedelta(days=rng.randint(0, 365)),
+        )
+        for i in range(customers)
+    ], batch_size=batch_size)
+
+    content_types = [choice[0] for choice in Content.CONTENT_TYPES]
+    Content.objects.bulk_create([
+        Content(
+            title=f"Content {i}",
+            description="Lorem ipsum dolor sit amet. " * rng.randint(1, 40),
+            content_type=content_types[i % len(content_types)],
+            enabled=rng.random() < 0.9,
+            order=i,
+        )
+        for i in range(content)
+    ], batch_size=batch_size)
+    # Real files on disk so thumbnail generation behaves as in production.
+    jpeg = _placeholder_jpeg()
+    ContentMedia.objects.bulk_create([
+        ContentMedia(
+            content=item,
+            file=default_storage.save(
+                f"{item.content_type.lower()}/seed-{item.id}.jpg", ContentFile(jpeg)),
+            caption=item.title,
+        )
+        for item in Content.objects.all()
+    ], batch_size=batch_size)
+
+    customer = users[0]
+    manager = User.objects.create_user(
+        'manager@example.com', 'manager@example.com', BENCHMARK_PASSWORD)
+    manager.groups.add(managers_group)
+    superuser = User.objects.create_superuser(
+        'admin@example.com', 'admin@example.com', BENCHMARK_PASSWORD)
+
+    profile = profiles[0]
+    # Give the first customer a long history so detail pages are realistic.
+    Appointment.objects.bulk_create([
+        Appointment(
+            customer=profile,
+            date=current - timedelta(days=7 * i),
+            kp_notes="Key point. " * 20,
+            fu_notes="Follow up. " * 20,
+        )
+        for i in range(200)
+    ], batch_size=batch_size)
+
+    # bulk_create sends no signals; fill the dashboard rollups directly.
+    rollups.rebuild()
+
+    return Dataset(
+        customers=users,
+        customer=customer,
+        manager=manager,
+        superuser=superuser,
+        profile=profile,
+        appointment=profile.appointments.first(),
+        content=Content.objects.filter(enabled=True).first(),
+    )
@@ -0,0 +1,289 @@
+import gc
+import json
+import statistics
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+from django.db import connection
+from django.template.base import Template
+from django.test import Client
+from django.urls import reverse
+
+from ..instrumentation import QueryRecorder
+from ..microsoft_graph import MicrosoftGraphEmailSender
+from ..models import Content
+from ..pagination import encode_cursor
+
+
+ROLES = ('anonymous', 'customer', 'manager', 'superuser')
+
+
+class RouteSpec:
+    """
+    How to request one named route in a_main.urls.
+
+    ``kwargs`` is a callable receiving the Dataset and returning the URL
+    kwargs; it runs before every iteration so one-shot routes (deletes,
+    magic links) can be handed a fresh object each time.  ``isolated``
+    routes change the client's session and get a fresh client per request.
+    ``data`` is posted as JSON, ``form`` as a urlencoded form; ``data`` may
+    also be a callable receiving the Dataset, like ``kwargs``.  ``query`` is
+    sent as the query string of GET requests, and may be a callable too.
+    """
+
+    def __init__(self, name, method='get', kwargs=None, data=None, form=None,
+                 query=None, isolated=False):
+        self.name = name
+        self.method = method
+        self.kwargs = kwargs or (lambda dataset: {})
+        self.data = data
+        self.form = form
+        self.query = query
+        self.isolated = isolated
+
+
+def _fresh_content(dataset):
+    return {'pk': Content.objects.create(
+        title='Benchmark', description='Deleted by the benchmark').pk}
+
+
+def _status_changes(dataset):
+    # A month of weekly sessions marked invoiced and paid at once.
+    pks = dataset.profile.appointments.values_list('pk', flat=True)[:5]
+    return {'changes': [{'id': pk, 'field': field, 'value': True}
+                        for pk in pks for field in ('invoiced', 'paid')]}
+
+
+def _deep_history_page(dataset):
+    # The cursor of the 150th of the customer's 200 appointments.
+    appointment = dataset.profile.appointments.order_by('-date', '-pk')[149]
+    return {'after': encode_cursor(appointment.date, appointment.pk)}
+
+
+def _fresh_magic_link(dataset):
+    return {'token': dataset.profile.generate_magic_link()}
+
+
+ROUTE_SPECS = {spec.name: spec for spec in [
+    RouteSpec('index'),
+    RouteSpec('contact'),
+    RouteSpec('about'),
+    RouteSpec('faq'),
+    RouteSpec('terms'),
+    RouteSpec('privacy'),
+    RouteSpec('sent'),
+    RouteSpec('send-fail'),
+    RouteSpec('no-permissions'),
+    RouteSpec('logout', method='post', isolated=True),
+    RouteSpec('login'),
+    RouteSpec('managers'),
+    RouteSpec('users'),
+    RouteSpec('campaign-create', method='post',
+              form={'kind': 'MAGIC_LINK', 'audience': 'INACTIVE_30_DAYS'}),
+    RouteSpec('campaign-progress'),
+    RouteSpec('export', kwargs=lambda dataset: {'name': 'customers'}),
+    RouteSpec('search', query={'q': 'follow'}),
+    RouteSpec('customers-list'),
+    RouteSpec('customers-update',
+              kwargs=lambda dataset: {'pk': dataset.profile.pk}),
+    RouteSpec('customer-appointments', query=_deep_history_page,
+              kwargs=lambda dataset: {'pk': dataset.profile.pk}),
+    RouteSpec('appointment-update',
+              kwargs=lambda dataset: {'pk': dataset.appointment.pk}),
+    RouteSpec('appointment-delete',
+              kwargs=lambda dataset: {'pk': dataset.appointment.pk}),
+    RouteSpec('appointment-update-status', method='post',
+              kwargs=lambda dataset: {'pk': dataset.appointment.pk},
+              data={'field': 'paid', 'value': True}),
+    RouteSpec('appointment-bulk-update-status', method='post', data=_status_changes),
+    RouteSpec('send-appointment-invite',
+              kwargs=lambda dataset: {'pk': dataset.appointment.pk}),
+    RouteSpec('download-appointment-ics',
+              kwargs=lambda dataset: {'pk': dataset.appointment.pk}),
+    RouteSpec('content-create'),
+    RouteSpec('content-list'),
+    RouteSpec('content-update',
+              kwargs=lambda dataset: {'pk': dataset.content.pk}),
+    RouteSpec('content-delete', kwargs=_fresh_content),
+    RouteSpec('content-api', kwargs=lambda dataset: {'content_type': 'faq'}),
+    RouteSpec('magic-login', kwargs=_fresh_magic_link, isolated=True),
+    RouteSpec('performance-metrics'),
+]}
+
+
+def a_main_route_names():
+    """Every named route a_main.urls exposes, in declaration order."""
+    from .. import urls
+    return [pattern.name for pattern in urls.urlpatterns if pattern.name]
+
+
+class RenderRecorder:
+    """Times top-level template renders; nested includes are not double counted."""
+
+    def __init__(self):
+        self.duration = 0.0
+        self._depth = 0
+
+    @contextmanager
+    def patch(self):
+        original = Template.render
+        recorder = self
+
+        def render(template, context):
+            recorder._depth += 1
+            start = time.perf_counter()
+            try:
+                return original(template, context)
+            finally:
+                recorder._depth -= 1
+                if recorder._depth == 0:
+                    recorder.duration += time.perf_counter() - start
+
+        with mock.patch.object(Template, 'render', render):
+            yield self
+
+
+def percentile(samples, pct):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method='inclusive')[pct - 1]
+
+
+def _client_for(role, dataset):
+    # Record server errors as a 500 status instead of aborting the run;
+    # compare() then fails them.
+    client = Client(raise_request_exception=False)
+    user = dataset.users()[role]
+    if user is not None:
+        client.force_login(user)
+    return client
+
+
+def measure_route(spec, role, dataset, iterations, client=None):
+    """Request one route ``iterations`` times and summarise the samples."""
+    walls, queries, db_times, render_times = [], [], [], []
+    status = None
+
+    # Like timeit: collect up front and keep the collector out of the timed
+    # section, so a GC pause lands on no particular route.
+    gc.collect()
+    for _ in range(iterations):
+        if spec.isolated or client is None:
+            client = _client_for(role, dataset)
+        # Resolve kwargs outside the timed section; factories may write.
+        url = reverse(spec.name, kwargs=spec.kwargs(dataset))
+        data = spec.data(dataset) if callable(spec.data) else spec.data
+        query = spec.query(dataset) if callable(spec.query) else spec.query
+        queries_recorder = QueryRecorder()
+        render_recorder = RenderRecorder()
+        gc.disable()
+        try:
+            with render_recorder.patch(), connection.execute_wrapper(queries_recorder):
+                start = time.perf_counter()
+                if spec.method == 'post' and data is not None:
+                    response = client.post(
+                        url, json.dumps(data), content_type='application/json')
+                elif spec.method == 'post' and spec.form is not None:
+                    response = client.post(url, spec.form)
+                elif query is not None:
+                    response = getattr(client, spec.method)(url, query)
+                else:
+                    response = getattr(client, spec.method)(url)
+                if response.streaming:
+                    # Streamed bodies are produced as they are read.
+                    b''.join(response.streaming_content)
+                walls.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+        status = response.status_code
+        queries.append(queries_recorder.count)
+        db_times.append(queries_recorder.duration)
+        render_times.append(render_recorder.duration)
+
+    return {
+        'status': status,
+        # Steady-state count; the first request may also fill caches.
+        'queries': statistics.median_low(queries),
+        'cold_queries': queries[0],
+        'db_ms': round(statistics.median(db_times) * 1000, 3),
+        'render_ms': round(statistics.median(render_times) * 1000, 3),
+        'p50_ms': round(percentile(walls, 50) * 1000, 3),
+        'p95_ms': round(percentile(walls, 95) * 1000, 3),
+    }
+
+
+def combine_rounds(rounds):
+    """
+    One result from repeated measurements of the same route.
+
+    Timings are the median across rounds, so one round disturbed by
+    another process does not move the result; the p95 is the median of
+    each round's p95.
+    """
+    last = rounds[-1]
+    return {
+        'status': last['status'],
+        'queries': statistics.median_low(r['queries'] for r in rounds),
+        'cold_queries': rounds[0]['cold_queries'],
+        **{metric: round(statistics.median(r[metric] for r in rounds), 3)
+           for metric in ('db_ms', 'render_ms', 'p50_ms', 'p95_ms')},
+    }
+
+
+def run_routes(dataset, iterations=20, rounds=5, roles=ROLES, names=None):
+    """
+    Measure every a_main route as every role.
+
+    Every route is measured ``rounds`` times, interleaved with the others,
+    and combine_rounds keeps the medians: slow spells on a shared machine
+    then hit each route in at most a round or two.  Returns
+    ``{"<route>|<role>": metrics}``.  Outbound Graph email is replaced with
+    a no-op so routes that send mail can be measured without touching the
+    network.
+    """
+    names = names or a_main_route_names()
+    missing = [name for name in names if name not in ROUTE_SPECS]
+    if missing:
+        raise KeyError(
+            f"No benchmark RouteSpec for route(s): {', '.join(missing)}")
+
+    samples = {}
+    with mock.patch.object(MicrosoftGraphEmailSender, 'send_email', return_value=True):
+        for _ in range(rounds):
+            for role in roles:
+                client = _client_for(role, dataset)
+                for name in names:
+                    samples.setdefault(f"{name}|{role}", []).append(measure_route(
+                        ROUTE_SPECS[name], role, dataset, iterations, client=client))
+    return {key: combine_rounds(measured) for key, measured in samples.items()}
+
+
+def compare(results, baseline, time_tolerance=0.35, time_floor_ms=2.0):
+    """
+    Compare results against a baseline and return a list of regressions.
+
+    Query counts must not grow at all.  Wall time may grow by
+    ``time_tolerance`` (a fraction) plus ``time_floor_ms`` of absolute
+    slack, which keeps sub-millisecond routes from flapping.  A server
+    error is always a regression, even one the baseline recorded.
+    """
+    regressions = []
+    for key, result in results.items():
+        if (result.get('status') or 0) >= 500:
+            regressions.append(f"{key}: server error {result['status']}")
+            continue
+        expected = baseline.get(key)
+        if expected is None:
+            continue
+        if result['status'] != expected['status']:
+            regressions.append(
+                f"{key}: status {expected['status']} -> {result['status']}")
+        if result['queries'] > expected['queries']:
+            regressions.append(
+                f"{key}: queries {expected['queries']} -> {result['queries']}")
+        limit = expected['p95_ms'] * (1 + time_tolerance) + time_floor_ms
+        if result['p95_ms'] > limit:
+            regressions.append(
+                f"{key}: p95 {expected['p95_ms']}ms -> {result['p95_ms']}ms")
+    return regressions
@@ -0,0 +1,113 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+
+from .routes import percentile
+
+# Loaded on first use only; a freshly booted worker should not hold them.
+LAZY_MODULES = ('msal', 'requests', 'ics', 'stripe', 'debug_toolbar')
+
+# What a gunicorn worker does before its first request: load the WSGI
+# application (settings, apps, template warm-up) and the URLconf.
+# RSS comes from /proc: ru_maxrss survives exec and would report the
+# benchmark process that spawned the worker.
+BOOT_SCRIPT = """
+import json, re, sys, time
+start = time.perf_counter()
+from project.wsgi import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+boot_ms = (time.perf_counter() - start) * 1000
+with open('/proc/self/status') as status:
+    rss_kb = int(re.search(r'VmRSS:\\s+(\\d+)', status.read()).group(1))
+print(json.dumps({
+    'boot_ms': boot_ms,
+    'rss_mb': rss_kb / 1024,
+    'loaded': [name for name in %r if name in sys.modules
+               and type(sys.modules[name]).__name__ != '_LazyModule'],
+}))
+""" % (LAZY_MODULES,)
+
+IMPORTTIME_RE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+# Production settings need these set, though nothing is connected to.
+PRODUCTION_ENV = {
+    'PIPELINE': 'production',
+    'ALLOWED_HOSTS': 'localhost',
+    'DATABASE_ENGINE': 'sqlite3',
+    'DATABASE_NAME': ':memory:',
+    'DATABASE_USERNAME': '',
+    'DATABASE_PASSWORD': '',
+    'DATABASE_ADDR': '',
+    'DATABASE_PORT': '',
+}
+
+
+def boot_worker(importtime=False):
+    """Boot a worker in a fresh interpreter with production settings."""
+    env = {**PRODUCTION_ENV, **os.environ, 'PIPELINE': 'production'}
+    command = [sys.executable, *(['-X', 'importtime'] if importtime else []),
+               '-c', BOOT_SCRIPT]
+    process = subprocess.run(command, cwd=settings.BASE_DIR, env=env,
+                             capture_output=True, text=True)
+    if process.returncode:
+        errors = [line for line in process.stderr.splitlines()
+                  if not line.startswith('import time:')]
+        return {'ok': False, 'error': errors[-1] if errors else 'failed'}
+    return {'ok': True, **json.loads(process.stdout.strip().splitlines()[-1]),
+            'importtime': process.stderr}
+
+
+def top_imports(importtime_log, count=10):
+    """
+    The ``count`` most expensive packages as ``[package, ms]``.
+
+    Each package is charged the cumulative time of its costliest import,
+    which includes whatever that import pulled in.  Interpreter start-up
+    (everything up to ``site``) and ``project`` (the boot itself) are left
+    out.
+    """
+    _, _, boot_log = importtime_log.rpartition('| site\n')
+    totals = {}
+    for _, cumulative, _, name in IMPORTTIME_RE.findall(boot_log):
+        package = name.split('.')[0]
+        if package != 'project':
+            totals[package] = max(totals.get(package, 0), int(cumulative))
+    slowest = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:count]
+    return [[package, round(us / 1000, 1)] for package, us in slowest]
+
+
+def run_startup(boots=5):
+    """
+    Worker boot time and memory.
+
+    Boots ``boots`` fresh interpreters for the timings and RSS, plus one
+    under ``-X importtime`` for the slowest imports.  ``lazy_loaded``
+    lists any of LAZY_MODULES that startup imported after all.
+    """
+    samples = [boot_worker() for _ in range(boots)]
+    failed = [sample for sample in samples if not sample['ok']]
+    if failed:
+        return {'startup|worker': {
+            'status': 500, 'queries': 0, 'cold_queries': 0, 'db_ms': 0.0,
+            'render_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'error': failed[0]['error']}}
+
+    walls = [sample['boot_ms'] for sample in samples]
+    profile = boot_worker(importtime=True)
+    return {'startup|worker': {
+        'status': 200,
+        'queries': 0,
+        'cold_queries': 0,
+        'db_ms': 0.0,
+        'render_ms': 0.0,
+        'p50_ms': round(percentile(walls, 50), 3),
+        'p95_ms': round(percentile(walls, 95), 3),
+        'rss_mb': round(statistics.median(sample['rss_mb'] for sample in samples), 1),
+        'lazy_loaded': sorted(set().union(*(sample['loaded'] for sample in samples))),
+        'top_imports': top_imports(profile.get('importtime', '')),
+    }}
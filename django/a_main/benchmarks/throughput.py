@@ -0,0 +1,55 @@
+import statistics
+import time
+
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from ..instrumentation import QueryRecorder
+from .routes import percentile
+
+PUBLIC_PAGES = ('index', 'about', 'faq', 'terms', 'privacy')
+
+
+def run_anonymous_throughput(requests=500):
+    """
+    Requests per second for cookieless visitors of the public pages.
+
+    ``fresh`` is a first visit that renders the page, ``revalidate`` a
+    returning visitor (or a CDN) sending the ETag it holds.  Each scenario
+    cycles through PUBLIC_PAGES; results have the route suite's shape plus
+    throughput.
+    """
+    client = Client(raise_request_exception=False)
+    urls = [reverse(name) for name in PUBLIC_PAGES]
+    etags = {url: client.get(url).get('ETag', '') for url in urls}
+
+    results = {}
+    for scenario in ('fresh', 'revalidate'):
+        walls, queries, db_times, statuses = [], [], [], set()
+        run_start = time.perf_counter()
+        for i in range(requests):
+            url = urls[i % len(urls)]
+            headers = {'HTTP_IF_NONE_MATCH': etags[url]} if scenario == 'revalidate' else {}
+            client.cookies.clear()
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                start = time.perf_counter()
+                response = client.get(url, **headers)
+                walls.append(time.perf_counter() - start)
+            queries.append(recorder.count)
+            db_times.append(recorder.duration)
+            statuses.add(response.status_code)
+        elapsed = time.perf_counter() - run_start
+
+        results[f"anonymous-pages|{scenario}"] = {
+            'status': max(statuses),
+            'queries': statistics.median_low(queries),
+            'cold_queries': queries[0],
+            'db_ms': round(statistics.median(db_times) * 1000, 3),
+            'render_ms': 0.0,
+            'p50_ms': round(percentile(walls, 50) * 1000, 3),
+            'p95_ms': round(percentile(walls, 95) * 1000, 3),
+            'per_second': round(requests / elapsed, 1),
+        }
+    return results
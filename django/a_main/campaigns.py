@@ -0,0 +1,148 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.urls import reverse
+from django.utils.timezone import now
+
+from .emails import render_email
+from .microsoft_graph import MicrosoftGraphEmailSender
+from .models import Campaign, CampaignMessage, CustomerProfile, MagicLinkToken
+
+logger = logging.getLogger(__name__)
+
+# Claimed messages not finished within this time are handed out again,
+# so a worker that dies mid-batch does not strand its recipients.
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+# kind: (email template, subject)
+EMAILS = {
+    'MAGIC_LINK': ('a_main/email/magic_link', "Your Magic Login Link"),
+    'REMINDER': ('a_main/email/reminder', "A reminder from Your-Voyage"),
+}
+
+
+def audience_filter(audience, at=None):
+    """The Q selecting ``audience`` among CustomerProfiles."""
+    at = at or now()
+    if audience == 'UPCOMING_FIRST_SESSION':
+        return Q(first_session__gte=at, first_session__lt=at + timedelta(days=14))
+    if audience == 'INACTIVE_30_DAYS':
+        return (Q(user__last_login__isnull=True)
+                | Q(user__last_login__lt=at - timedelta(days=30)))
+    return Q()
+
+
+def audience_sizes():
+    """Recipients per audience, counted in one query."""
+    at = now()
+    return CustomerProfile.objects.aggregate(**{
+        audience: Count('pk', filter=audience_filter(audience, at))
+        for audience, _ in Campaign.AUDIENCES
+    })
+
+
+@transaction.atomic
+def create_campaign(kind, audience, created_by=None):
+    """
+    Queue ``kind`` emails to everyone in ``audience``.
+
+    Only writes the queue: one campaign row and one message row per
+    recipient, in bulk.  run_campaigns does the sending.
+    """
+    customer_ids = list(
+        CustomerProfile.objects
+        .filter(audience_filter(audience))
+        .values_list('pk', flat=True)
+    )
+    campaign = Campaign.objects.create(
+        kind=kind, audience=audience, created_by=created_by,
+        total=len(customer_ids),
+        **({} if customer_ids else {'status': 'DONE', 'finished_at': now()}),
+    )
+    CampaignMessage.objects.bulk_create(
+        [CampaignMessage(campaign=campaign, customer_id=customer_id)
+         for customer_id in customer_ids],
+        batch_size=1000,
+    )
+    return campaign
+
+
+def claim_batch(batch_size=50):
+    """
+    Claim up to ``batch_size`` queued messages for this worker.
+
+    On Postgres concurrent workers skip each other's locked rows, so
+    several can drain the same queue.
+    """
+    at = now()
+    with transaction.atomic():
+        claimable = (
+            CampaignMessage.objects
+            .filter(Q(status='PENDING')
+                    | Q(status='CLAIMED', claimed_at__lt=at - CLAIM_TIMEOUT))
+            .order_by('pk')
+        )
+        if connection.features.has_select_for_update_skip_locked:
+            claimable = claimable.select_for_update(skip_locked=True)
+        ids = list(claimable.values_list('pk', flat=True)[:batch_size])
+        CampaignMessage.objects.filter(pk__in=ids).update(status='CLAIMED', claimed_at=at)
+    return list(
+        CampaignMessage.objects
+        .filter(pk__in=ids)
+        .select_related('campaign', 'customer__user')
+        .order_by('pk')
+    )
+
+
+def send_batch(messages, sender=None):
+    """
+    Send a claimed batch and record the outcome.
+
+    Tokens for the whole batch are created in one INSERT and statuses are
+    written back with one bulk_update, so the query count per batch does
+    not grow with its size.  Login links are only minted here, so no
+    plaintext token ever sits in the queue.
+    """
+    if not messages:
+        return
+    sender = sender or MicrosoftGraphEmailSender()
+    campaign_ids = {message.campaign_id for message in messages}
+    Campaign.objects.filter(pk__in=campaign_ids, status='QUEUED').update(status='SENDING')
+
+    tokens = MagicLinkToken.objects.issue_many(
+        {message.customer.user_id for message in messages})
+
+    outcome = {campaign_id: {'sent': 0, 'failed': 0} for campaign_id in campaign_ids}
+    for message in messages:
+        user = message.customer.user
+        template, subject = EMAILS[message.campaign.kind]
+        login_path = reverse('magic-login', kwargs={'token': tokens[user.pk]})
+        body = render_email(template, {
+            'name': user.get_full_name() or user.username,
+            'login_url': f"{settings.EMAIL_SITE_URL}{login_path}",
+            'first_session': message.customer.first_session,
+        })
+        try:
+            sent = sender.send_email(
+                to_email=user.email, subject=subject, is_html=True,
+                message=body.html, text_message=body.text)
+            message.error = '' if sent else 'Rejected by mail server'
+        except Exception as exc:
+            logger.exception('Campaign email to %s failed', user.email)
+            sent = False
+            message.error = str(exc)[:255]
+        message.status = 'SENT' if sent else 'FAILED'
+        message.sent_at = now() if sent else None
+        outcome[message.campaign_id]['sent' if sent else 'failed'] += 1
+
+    CampaignMessage.objects.bulk_update(messages, ['status', 'sent_at', 'error'])
+    for campaign_id, counts in outcome.items():
+        Campaign.objects.filter(pk=campaign_id).update(
+            sent=F('sent') + counts['sent'], failed=F('failed') + counts['failed'])
+    (Campaign.objects
+     .filter(pk__in=campaign_ids, status='SENDING')
+     .exclude(messages__status__in=['PENDING', 'CLAIMED'])
+     .update(status='DONE', finished_at=now()))
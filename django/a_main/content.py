@@ -0,0 +1,210 @@
+import functools
+import os
+from collections import namedtuple
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, Max, Prefetch
+
+from .models import Content, ContentMedia
+
+
+# Lightweight, picklable snapshots of Content/ContentMedia rows for the
+# public pages.  They hold only what the templates need, so they are cheap
+# to build and safe to put in a cache.
+MediaItem = namedtuple('MediaItem', ['id', 'media_type', 'url', 'caption'])
+
+
+class ContentItem:
+    __slots__ = ('id', 'content_type', 'title', 'description',
+                 'order', 'updated_at', 'media')
+
+    def __init__(self, id, content_type, title, description, order, updated_at, media):
+        self.id = id
+        self.content_type = content_type
+        self.title = title
+        self.description = description
+        self.order = order
+        self.updated_at = updated_at
+        self.media = media
+
+    @property
+    def images(self):
+        return tuple(media for media in self.media if media.media_type == 'IMAGE')
+
+    @property
+    def image_url(self):
+        return self.media[0].url if self.media else None
+
+    def __repr__(self):
+        return f"<ContentItem {self.content_type}:{self.id} {self.title!r}>"
+
+
+def ordered_media_prefetch():
+    """Prefetch for Content.media_files in display order."""
+    return Prefetch(
+        'media_files',
+        queryset=ContentMedia.objects.order_by('order', '-created_at'),
+    )
+
+
+def load_content(*content_types):
+    """
+    Load all enabled content of the given types along with their media.
+
+    Always runs exactly two queries (one for content, one for media) no
+    matter how many types or items are requested.  Returns a dict keyed by
+    content type; every requested type is present, even when empty.
+    """
+    items = (
+        Content.objects
+        .filter(content_type__in=content_types, enabled=True)
+        .order_by('order', '-created_at')
+        .prefetch_related(ordered_media_prefetch())
+    )
+
+    loaded = {content_type: [] for content_type in content_types}
+    for item in items:
+        media = tuple(
+            MediaItem(m.id, m.media_type, m.file.url, m.caption)
+            # .all() reads from the prefetch cache, .first() would not
+            for m in item.media_files.all()
+        )
+        loaded[item.content_type].append(ContentItem(
+            item.id, item.content_type, item.title, item.description,
+            item.order, item.updated_at, media,
+        ))
+    return loaded
+
+
+def build_content_elements(items):
+    """
+    Flatten content into the image/text element stream used by the
+    about/faq/terms/privacy templates, alternating image alignment.
+    """
+    image_position = 0
+    content_elements = []
+
+    for item in items:
+        # Add images first with their alignment
+        for media in item.images:
+            alignment = 'left' if image_position % 2 == 0 else 'right'
+            content_elements.append({
+                'type': 'image',
+                'media': media,
+                'alignment': alignment
+            })
+            image_position += 1
+
+        # Then add the text content
+        if item.title or item.description:
+            content_elements.append({
+                'type': 'text',
+                'item': item
+            })
+
+    return content_elements
+
+
+# Fields of a content item in the JSON API, in output order.
+API_FIELDS = ('id', 'type', 'title', 'description', 'order', 'updated_at', 'media')
+
+
+def api_cache_key(content_type):
+    return f"content-api:{content_type}"
+
+
+CONTENT_VERSION_KEY = 'content-version'
+
+
+def forget_cached_content():
+    """Drop the content version and every API document (types may change)."""
+    cache.delete_many([CONTENT_VERSION_KEY, *(
+        api_cache_key(content_type) for content_type, _ in Content.CONTENT_TYPES)])
+
+
+def content_version():
+    """
+    ``(version, last_modified)`` of all content, from the shared cache.
+
+    Every public page shows the header cards as well as its own type, so
+    one version covers them all.  A miss is computed on the primary: a
+    lagging replica would leave an old version in the cache.
+    """
+    stamp = cache.get(CONTENT_VERSION_KEY)
+    if stamp is None:
+        totals = (Content.objects.using(DEFAULT_DB_ALIAS)
+                  .aggregate(last_modified=Max('updated_at'), count=Count('pk')))
+        last_modified = totals['last_modified']
+        micros = int(last_modified.timestamp() * 1_000_000) if last_modified else 0
+        stamp = (f"{micros:x}.{totals['count']}", last_modified)
+        cache.set(CONTENT_VERSION_KEY, stamp, timeout=None)
+    return stamp
+
+
+@functools.cache
+def templates_stamp():
+    """Newest template mtime in seconds; a deploy changing the pages changes it."""
+    root = os.path.join(apps.get_app_config('a_main').path, 'templates')
+    return max((int(os.stat(os.path.join(directory, filename)).st_mtime)
+                for directory, _, files in os.walk(root) for filename in files),
+               default=0)
+
+
+def build_api_content(content_type):
+    """
+    The API document for one content type, built from the database.
+
+    ``version`` and ``last_modified`` are derived from the newest
+    ``updated_at`` and the item count, so an edit, a disabled or deleted
+    item and (through the parent's updated_at) any media change all give
+    a new version.
+    """
+    items = []
+    last_modified = None
+    for item in (Content.objects
+                 .filter(content_type=content_type, enabled=True)
+                 .order_by('order', '-created_at')
+                 .prefetch_related(ordered_media_prefetch())):
+        if last_modified is None or item.updated_at > last_modified:
+            last_modified = item.updated_at
+        items.append({
+            'id': item.id,
+            'type': item.content_type,
+            'title': item.title,
+            'description': item.description,
+            'order': item.order,
+            'updated_at': item.updated_at.isoformat(),
+            'media': [
+                {
+                    'id': m.id,
+                    'type': m.media_type,
+                    'url': m.file.url,
+                    'thumbnail': m.thumbnail.url,
+                    'caption': m.caption,
+                }
+                for m in item.media_files.all()
+            ],
+        })
+    stamp = int(last_modified.timestamp() * 1_000_000) if last_modified else 0
+    return {
+        'version': f"{stamp:x}.{len(items)}",
+        'last_modified': last_modified,
+        'items': items,
+    }
+
+
+def load_api_content(content_type):
+    """
+    The API document for one content type, from the shared cache.
+
+    Kept until forget_cached_content() runs on a Content or ContentMedia
+    change, so repeated requests cost no queries at all.
+    """
+    key = api_cache_key(content_type)
+    document = cache.get(key)
+    if document is None:
+        document = build_api_content(content_type)
+        cache.set(key, document, timeout=None)
+    return document
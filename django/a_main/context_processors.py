@@ -0,0 +1,35 @@
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from .models import Content
+from .roles import get_roles
+
+
+# Name of the {% cache %} fragment holding the header's product menu.
+HEADER_CARDS_FRAGMENT = 'header_cards'
+
+
+def load_header_cards():
+    return list(Content.objects.filter(
+        content_type='CARD',
+        enabled=True
+    ).order_by('order', '-created_at').values('id', 'title'))
+
+
+def forget_header_cards():
+    cache.delete(make_template_fragment_key(HEADER_CARDS_FRAGMENT))
+
+
+def header(request):
+    """
+    Data for header.html on every page.
+
+    ``header_cards`` is passed uncalled: the template only calls it when
+    the cached menu fragment has expired, so most requests skip the query.
+    The role flags, not ``user``, decide what the header shows, so pages
+    for visitors without a session never touch request.user.
+    """
+    return {
+        'header_cards': load_header_cards,
+        **get_roles(request).as_context(),
+    }
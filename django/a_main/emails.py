@@ -0,0 +1,145 @@
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.template import Context, loader
+from django.utils import timezone
+from django.utils.autoreload import file_changed
+from django.utils.safestring import mark_safe
+
+
+EmailBody = namedtuple('EmailBody', ['html', 'text'])
+
+LAYOUT = 'a_main/email/layout'
+
+# Stands in for the message body while the layout is rendered once.
+CONTENT_MARKER = '<!--email-content-->'
+
+INLINE_STYLE_RE = re.compile(r'<style data-inline>(.*?)</style>\s*', re.S)
+CSS_RULE_RE = re.compile(r'([^{}]+)\{([^{}]*)\}')
+CLASS_TAG_RE = re.compile(r'<[a-zA-Z][^<>]*?\bclass="([^"]*)"[^<>]*>')
+STYLE_ATTR_RE = re.compile(r'\sstyle="([^"]*)"')
+
+
+def parse_inline_rules(css):
+    """Map class name -> declarations for the ``.class`` rules in ``css``."""
+    rules = {}
+    for selectors, declarations in CSS_RULE_RE.findall(css):
+        declarations = ' '.join(declarations.split()).strip().rstrip(';')
+        for selector in selectors.split(','):
+            selector = selector.strip()
+            if re.fullmatch(r'\.[\w-]+', selector):
+                name = selector[1:]
+                rules[name] = f"{rules[name]}; {declarations}" if name in rules else declarations
+    return rules
+
+
+def inline_css(source, rules):
+    """
+    Copy the rules of each element's classes into its style attribute.
+
+    Only single-class selectors are supported, which is all the email
+    layout uses.  A style already on the element comes last and wins.
+    Classes are kept for the @media rules of clients that honour them.
+    """
+    def replace(match):
+        tag = match.group(0)
+        declarations = [rules[name] for name in match.group(1).split() if name in rules]
+        if not declarations:
+            return tag
+        style = '; '.join(declarations)
+        existing = STYLE_ATTR_RE.search(tag)
+        if existing:
+            return (tag[:existing.start()]
+                    + f' style="{style}; {existing.group(1)}"'
+                    + tag[existing.end():])
+        end = -2 if tag.endswith('/>') else -1
+        return f'{tag[:end]} style="{style}"{tag[end:]}'
+    return CLASS_TAG_RE.sub(replace, source)
+
+
+class EmailRenderer:
+    """
+    Renders transactional emails as an HTML and a plaintext part.
+
+    Each email is a pair of templates, ``<name>.html`` and ``<name>.txt``,
+    holding only the per-message body.  The shared layout around it is
+    rendered once per process and year, and its CSS is inlined into both
+    the layout and the body templates when they are first compiled, so a
+    send only renders the body.
+    """
+
+    def __init__(self, layout=LAYOUT):
+        self.layout = layout
+        self.clear()
+
+    def clear(self):
+        self._shells = {}
+        self._templates = {}
+        self._rules = None
+
+    def _source(self, template_name):
+        # Through the template loaders, so the cached loader does the I/O.
+        template = loader.get_template(template_name)
+        return template, template.template.source
+
+    def _inline_rules(self):
+        if self._rules is None:
+            _, source = self._source(f"{self.layout}.html")
+            match = INLINE_STYLE_RE.search(source)
+            self._rules = parse_inline_rules(match.group(1)) if match else {}
+        return self._rules
+
+    def _compile(self, name, extension):
+        key = (name, extension)
+        template = self._templates.get(key)
+        if template is None:
+            template, source = self._source(f"{name}.{extension}")
+            if extension == 'html':
+                source = inline_css(INLINE_STYLE_RE.sub('', source), self._inline_rules())
+                template = template.template.engine.from_string(source)
+            else:
+                template = template.template
+            self._templates[key] = template
+        return template
+
+    def _shell(self, extension):
+        """The layout split around its content, rendered once per year."""
+        year = timezone.now().year
+        key = (extension, year)
+        shell = self._shells.get(key)
+        if shell is None:
+            template = self._compile(self.layout, extension)
+            rendered = template.render(Context({
+                'content': mark_safe(CONTENT_MARKER),
+                'site_url': getattr(settings, 'EMAIL_SITE_URL', ''),
+                'year': year,
+            }))
+            head, _, tail = rendered.partition(CONTENT_MARKER)
+            shell = self._shells[key] = (head, tail)
+        return shell
+
+    def render(self, name, context):
+        """Render the ``name`` email for one recipient."""
+        parts = []
+        for extension in ('html', 'txt'):
+            head, tail = self._shell(extension)
+            body = self._compile(name, extension).render(Context(context))
+            parts.append(f"{head}{body.strip()}{tail}")
+        return EmailBody(*parts)
+
+
+renderer = EmailRenderer()
+
+
+def render_email(name, context):
+    return renderer.render(name, context)
+
+
+def _template_changed(sender, file_path, **kwargs):
+    # The dev server reloads templates without restarting; follow suit.
+    if file_path.suffix in ('.html', '.txt'):
+        renderer.clear()
+
+
+file_changed.connect(_template_changed)
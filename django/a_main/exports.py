@@ -0,0 +1,135 @@
+import csv
+import tempfile
+from datetime import datetime
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.timezone import localdate, localtime
+
+from .models import Appointment, Contact, CustomerProfile
+
+CHUNK_SIZE = 2000
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Spreadsheets run cells starting with these as formulas.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Export:
+    """
+    A table to export: a base queryset and ``(header, lookup)`` columns.
+
+    Rows are read with values_list(), so related columns are joined in
+    the same query and no model instances are built, and streamed with
+    iterator(), so only one chunk is ever held in memory.
+    """
+
+    def __init__(self, name, queryset, columns):
+        self.name = name
+        self.queryset = queryset
+        self.headers = [header for header, _ in columns]
+        self.lookups = [lookup for _, lookup in columns]
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    def rows(self, queryset=None):
+        queryset = self.get_queryset() if queryset is None else queryset
+        for row in (queryset.order_by('pk').values_list(*self.lookups)
+                    .iterator(chunk_size=CHUNK_SIZE)):
+            yield [cell(value) for value in row]
+
+    def filename(self, extension):
+        return f"{self.name}-{localdate():%Y%m%d}.{extension}"
+
+
+def cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return localtime(value).strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+EXPORTS = {export.name: export for export in [
+    Export('customers', CustomerProfile.objects, [
+        ('Username', 'user__username'),
+        ('Email', 'user__email'),
+        ('First name', 'user__first_name'),
+        ('Last name', 'user__last_name'),
+        ('Interest', 'interest'),
+        ('First contact', 'first_contact'),
+        ('Recent contact', 'recent_contact'),
+        ('First session', 'first_session'),
+        ('Notes', 'custnotes'),
+    ]),
+    Export('appointments', Appointment.objects, [
+        ('Id', 'pk'),
+        ('Customer', 'customer__user__username'),
+        ('Email', 'customer__user__email'),
+        ('Date', 'date'),
+        ('Invoiced', 'invoiced'),
+        ('Paid', 'paid'),
+        ('Key points', 'kp_notes'),
+        ('Follow up', 'fu_notes'),
+    ]),
+    Export('messages', Contact.objects, [
+        ('Name', 'name'),
+        ('Email', 'email'),
+        ('Subject', 'subject'),
+        ('Message', 'message'),
+        ('Sent', 'when_sent'),
+        ('Replied', 'replied'),
+        ('Replied at', 'when_replied'),
+    ]),
+]}
+
+
+class Echo:
+    """A file-like csv.writer target that hands each line straight back."""
+
+    def write(self, value):
+        return value
+
+
+def csv_response(export, queryset=None):
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow(export.headers)
+        for row in export.rows(queryset):
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{export.filename("csv")}"'
+    return response
+
+
+def xlsx_response(export, queryset=None):
+    """
+    The export as a workbook.  openpyxl's write-only mode streams rows to
+    a temporary file as they are appended, so memory stays flat; the file
+    is then sent in blocks and removed once closed.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(export.name.title())
+    sheet.append(export.headers)
+    for row in export.rows(queryset):
+        sheet.append(row)
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return FileResponse(output, as_attachment=True,
+                        filename=export.filename('xlsx'),
+                        content_type=XLSX_CONTENT_TYPE)
+
+
+def export_response(export, file_format='csv', queryset=None):
+    if file_format == 'xlsx':
+        return xlsx_response(export, queryset)
+    return csv_response(export, queryset)
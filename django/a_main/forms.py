@@ -1,10 +1,13 @@
 from django import forms
+from django.db import IntegrityError, transaction
 from django.utils.timezone import now
-from django.contrib.auth.models import User, Group
+from django.contrib.auth.models import User
 from django.contrib.auth.forms import AuthenticationForm
 from django.utils.html import format_html
 
-from .models import Contact, CustomerProfile, Appointment, Content, ContentMedia
+from .models import Campaign, Contact, CustomerProfile, Appointment, Content, ContentMedia
+from . import roles
+from .roles import CUSTOMERS_GROUP
 
 # from .utils import enqueue_email
 from .utils import send_contact_email
@@ -22,6 +25,16 @@ class LoginForm(AuthenticationForm):
 
 
 class ContactForm(forms.ModelForm):
+    # Honeypot: hidden from people, filled in by bots.  ContactView turns
+    # such posts away before the form is even built.
+    website = forms.CharField(
+        required=False,
+        widget=forms.TextInput(attrs={
+            'autocomplete': 'off',
+            'tabindex': '-1',
+        })
+    )
+
     class Meta:
         model = Contact
         fields = ('name', 'email', 'subject', 'message')
@@ -60,51 +73,68 @@ class ContactForm(forms.ModelForm):
             self.fields['subject'].initial = subject
 
     def save(self, commit=True):
-        instance = super().save(commit=commit)
-
-        if commit:
-            self._process_contact_submission(instance)
+        if not commit:
+            return super().save(commit=False)
+
+        # One unit of work: the message, the customer's user, profile and
+        # group membership are written together or not at all.
+        try:
+            with transaction.atomic():
+                instance = super().save(commit=True)
+                self._process_contact_submission(instance)
+        except IntegrityError:
+            # The cached customers group id is stale (the group was deleted
+            # in another process); look it up again and retry once.
+            roles.forget_group_ids()
+            self.instance.pk = None
+            self.instance._state.adding = True
+            with transaction.atomic():
+                instance = super().save(commit=True)
+                self._process_contact_submission(instance)
 
         return instance
 
     def _process_contact_submission(self, instance):
-        """Handle all post-save operations for a contact submission"""
+        """
+        Upsert the customer behind a contact submission.
+
+        Runs a fixed three queries however often the address has written
+        in: each write is a single INSERT ... ON CONFLICT that returns the
+        row id.  Emails go out only once the transaction has committed.
+        """
         email = self.cleaned_data['email']
         name = self.cleaned_data['name']
         interest = self.cleaned_data['subject']
-
-        # Create or get user
-        user, created = User.objects.get_or_create(
+        # The contact's own timestamp, so the rollup day its post_save
+        # flagged also covers a profile created here without signals.
+        contacted_at = instance.when_sent
+
+        # Create or get user.  Existing users are left untouched; the
+        # no-op update on username only exists to get the id back.
+        name_parts = name.split(' ')
+        user = User(
             username=email,
-            defaults={
-                'email': email,
-                'first_name': name.split(' ')[0],
-                'last_name': ' '.join(name.split(' ')[1:]) if len(name.split(' ')) > 1 else '',
-            }
+            email=email,
+            first_name=name_parts[0],
+            last_name=' '.join(name_parts[1:]),
         )
-
-        # Create or update user profile
-        from .models import CustomerProfile
-        profile, profile_created = CustomerProfile.objects.get_or_create(
-            user=user,
-            defaults={
-                'first_contact': now(),
-                'interest': interest,
-                'recent_contact': now()
-            }
+        User.objects.bulk_create(
+            [user], update_conflicts=True,
+            unique_fields=['username'], update_fields=['username'])
+
+        # Create the profile, or bump recent_contact on an existing one.
+        profile = CustomerProfile(
+            user_id=user.pk,
+            first_contact=contacted_at,
+            recent_contact=contacted_at,
+            interest=interest,
         )
-
-        if not profile_created:
-            # Update recent contact for existing users
-            profile.recent_contact = now()
-            profile.save()
-
-        if profile_created:
-            profile.generate_magic_link()
+        CustomerProfile.objects.bulk_create(
+            [profile], update_conflicts=True,
+            unique_fields=['user'], update_fields=['recent_contact'])
 
         # Add to customers group
-        customers_group, _ = Group.objects.get_or_create(name='Customers')
-        user.groups.add(customers_group)
+        joined = roles.join_group(user.pk, CUSTOMERS_GROUP)
 
         class ContactContext:
             def __init__(self, instance, name, email, interest):
@@ -115,7 +145,11 @@ class ContactForm(forms.ModelForm):
 
         context = ContactContext(instance, name, email, interest)
 
-        send_contact_email(context)
+        # The insert skips m2m_changed, so invalidate roles by hand; only
+        # someone who had logged in can hold stale ones.
+        if joined:
+            transaction.on_commit(lambda: roles.invalidate(user.pk))
+        transaction.on_commit(lambda: send_contact_email(context))
 
 
 class CustomerUpdateForm(forms.ModelForm):
@@ -169,6 +203,22 @@ class CustomerUpdateForm(forms.ModelForm):
                     '<span class="text-muted">{}</span>', "Customer's primary interest or focus area")
 
 
+class CampaignForm(forms.ModelForm):
+    class Meta:
+        model = Campaign
+        fields = ['kind', 'audience']
+
+    def __init__(self, *args, audience_sizes=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['kind'].widget.attrs.update({'class': 'form-select'})
+        self.fields['audience'].widget.attrs.update({'class': 'form-select'})
+        if audience_sizes is not None:
+            self.fields['audience'].choices = [
+                (value, f"{label} ({audience_sizes[value]})")
+                for value, label in Campaign.AUDIENCES
+            ]
+
+
 class AppointmentForm(forms.ModelForm):
     class Meta:
         model = Appointment
@@ -0,0 +1,140 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+# Upper bounds (ms) of the latency histogram buckets; the last is +Inf.
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_current_timings = ContextVar('request_timings', default=None)
+
+
+class QueryRecorder:
+    """connection.execute_wrapper hook counting queries and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class RequestTimings:
+    """Everything measured for one request, in seconds."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = QueryRecorder()
+        self.render = 0.0
+        self.outbound = {}
+
+    def add_outbound(self, service, duration):
+        self.outbound[service] = self.outbound.get(service, 0.0) + duration
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.start
+
+
+def current_timings():
+    """The RequestTimings of the request being handled, if any."""
+    return _current_timings.get()
+
+
+@contextmanager
+def track_request():
+    timings = RequestTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+@contextmanager
+def timed(service):
+    """
+    Attribute the wrapped block to an outbound ``service`` (e.g. 'graph',
+    'stripe') on the current request.  Outside a request this is a no-op.
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_outbound(service, time.perf_counter() - start)
+
+
+class Histogram:
+    """Cumulative latency histogram, cheap enough to update per request."""
+
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value_ms):
+        self.counts[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, value_ms)] += 1
+        self.count += 1
+        self.sum += value_ms
+
+
+class HistogramRegistry:
+    """Per-process histograms keyed by (metric, url name)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, metric, url_name, value_ms):
+        key = (metric, url_name)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value_ms)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                key: (list(h.counts), h.count, h.sum)
+                for key, h in self._histograms.items()
+            }
+
+    def render_prometheus(self):
+        """Export the histograms in the Prometheus text exposition format."""
+        lines = []
+        seen = set()
+        for (metric, url_name), (counts, count, total) in sorted(self.snapshot().items()):
+            name = f"django_request_{metric}_ms"
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket in zip(HISTOGRAM_BUCKETS_MS + ('+Inf',), counts):
+                cumulative += bucket
+                lines.append(
+                    f'{name}_bucket{{url_name="{url_name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_count{{url_name="{url_name}"}} {count}')
+            lines.append(f'{name}_sum{{url_name="{url_name}"}} {total:.3f}')
+        return '\n'.join(lines) + '\n'
+
+
+histograms = HistogramRegistry()
@@ -0,0 +1,26 @@
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """
+    The module ``name``, executed only when one of its attributes is used.
+
+    For SDKs that only a few requests need (msal, requests, ics, stripe):
+    a worker that never sends an email or talks to Stripe never pays for
+    importing them.  Uses importlib's LazyLoader, so the module is a real
+    module afterwards and can be patched in tests as usual.
+    """
+    try:
+        return sys.modules[name]
+    except KeyError:
+        pass
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,161 @@
+import json
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_test_environment, teardown_test_environment)
+
+from a_main.benchmarks import contact
+from a_main.benchmarks import dataset as benchmark_dataset
+from a_main.benchmarks import routes
+from a_main.benchmarks import startup
+from a_main.benchmarks import throughput
+
+SUITES = ('routes', 'contact', 'flood', 'anonymous', 'startup')
+
+
+DEFAULT_BASELINE = Path(routes.__file__).resolve().parent / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database and benchmark every a_main route, '
+            'contact form bursts and floods, anonymous page throughput and '
+            'worker startup, failing on regressions against the committed baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suite', action='append', dest='suites',
+                            choices=SUITES,
+                            help='Only run this suite (repeatable)')
+        parser.add_argument('--customers', type=int, default=2000)
+        parser.add_argument('--appointments', type=int, default=20000)
+        parser.add_argument('--content', type=int, default=300)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--rounds', type=int, default=5,
+                            help='Times each route is measured; timings are the median round')
+        parser.add_argument('--submissions', type=int, default=300,
+                            help='Contact form posts per burst scenario')
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Requests per anonymous throughput scenario')
+        parser.add_argument('--boots', type=int, default=5,
+                            help='Fresh worker boots timed by the startup suite')
+        parser.add_argument('--route', action='append', dest='route_names',
+                            help='Only benchmark this route (repeatable)')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Write the results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.35,
+                            help='Allowed fractional p95 growth (default 0.35)')
+        parser.add_argument('--output', help='Also write results to this JSON file')
+
+    def handle(self, *args, **options):
+        if options['verbosity'] < 2:
+            # Keep the per-request log lines out of the report.
+            logging.getLogger('a_main.performance').setLevel(logging.WARNING)
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+        # Rate limiting would turn repeated requests into 429s; only the
+        # flood suite measures it, and enables it itself.
+        benchmark_settings = override_settings(
+            MEDIA_ROOT=media_root, RATELIMIT_ENABLED=False)
+        benchmark_settings.enable()
+        try:
+            self.stdout.write('Seeding benchmark dataset...')
+            dataset = benchmark_dataset.seed(
+                customers=options['customers'],
+                appointments=options['appointments'],
+                content=options['content'],
+            )
+            suites = options['suites'] or SUITES
+            results = {}
+            if 'routes' in suites:
+                results['routes'] = routes.run_routes(
+                    dataset,
+                    iterations=options['iterations'],
+                    rounds=options['rounds'],
+                    names=options['route_names'],
+                )
+            if 'contact' in suites:
+                results['contact'] = contact.run_contact_burst(
+                    dataset, submissions=options['submissions'])
+            if 'flood' in suites:
+                results['flood'] = contact.run_contact_flood(
+                    submissions=max(options['submissions'] // 3, 1))
+            if 'anonymous' in suites:
+                results['anonymous'] = throughput.run_anonymous_throughput(
+                    requests=options['requests'])
+            if 'startup' in suites:
+                results['startup'] = startup.run_startup(boots=options['boots'])
+        finally:
+            benchmark_settings.disable()
+            shutil.rmtree(media_root, ignore_errors=True)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.report(results)
+
+        if options['output']:
+            self.write_json(options['output'], results)
+
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline']:
+            # A baseline must not make a server error the expected status.
+            errors = [error for suite_results in results.values()
+                      for error in routes.compare(suite_results, {})]
+            if errors:
+                for error in errors:
+                    self.stderr.write(error)
+                raise CommandError('Not writing a baseline with server errors')
+            # Keep the suites that were not run this time.
+            baseline = (json.loads(baseline_path.read_text())
+                        if baseline_path.exists() else {})
+            baseline.update(results)
+            self.write_json(baseline_path, baseline)
+            self.stdout.write(self.style.SUCCESS(
+                f'Baseline written to {baseline_path}'))
+            return
+
+        if not baseline_path.exists():
+            raise CommandError(
+                f'No baseline at {baseline_path}; run with --update-baseline first')
+
+        baseline = json.loads(baseline_path.read_text())
+        regressions = []
+        for suite, suite_results in results.items():
+            regressions += routes.compare(
+                suite_results, baseline.get(suite, {}),
+                time_tolerance=options['tolerance'])
+        if regressions:
+            for regression in regressions:
+                self.stderr.write(regression)
+            raise CommandError(f'{len(regressions)} performance regression(s)')
+        self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
+
+    def report(self, results):
+        for suite, suite_results in results.items():
+            self.stdout.write(f'\n[{suite}]')
+            self.stdout.write(
+                f"{'route|role':<45}{'status':>7}{'queries':>8}{'db ms':>9}"
+                f"{'render':>9}{'p50 ms':>9}{'p95 ms':>9}")
+            for key, metrics in suite_results.items():
+                self.stdout.write(
+                    f"{key:<45}{metrics['status']:>7}{metrics['queries']:>8}"
+                    f"{metrics['db_ms']:>9.2f}{metrics['render_ms']:>9.2f}"
+                    f"{metrics['p50_ms']:>9.2f}{metrics['p95_ms']:>9.2f}"
+                    + (f"{metrics['per_second']:>9.1f}/s" if 'per_second' in metrics else '')
+                    + (f"{metrics['rss_mb']:>9.1f}MB" if 'rss_mb' in metrics else ''))
+                if metrics.get('error'):
+                    self.stdout.write(f"  error: {metrics['error']}")
+                if metrics.get('lazy_loaded'):
+                    self.stdout.write(self.style.WARNING(
+                        f"  imported at startup: {', '.join(metrics['lazy_loaded'])}"))
+                for package, ms in metrics.get('top_imports', ()):
+                    self.stdout.write(f"  {package:<43}{ms:>9.1f} ms")
+
+    def write_json(self, path, results):
+        Path(path).write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
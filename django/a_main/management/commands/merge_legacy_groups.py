@@ -0,0 +1,25 @@
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from a_main import roles
+
+
+class Command(BaseCommand):
+    help = 'Move members of legacy role groups into the canonical ones (run on deploy)'
+
+    def handle(self, *args, **options):
+        membership = User.groups.through
+        for legacy_name, name in roles.LEGACY_GROUPS.items():
+            with transaction.atomic():
+                legacy = Group.objects.filter(name=legacy_name).first()
+                if legacy is None:
+                    continue
+                user_ids = list(legacy.user_set.values_list('pk', flat=True))
+                membership.objects.bulk_create(
+                    [membership(user_id=user_id, group_id=roles.group_id(name))
+                     for user_id in user_ids],
+                    ignore_conflicts=True)
+                # Its pre_delete signal invalidates the members' roles.
+                legacy.delete()
+            self.stdout.write(f'Moved {len(user_ids)} users from {legacy_name!r} to {name!r}')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from a_main.models import MagicLinkToken
+
+
+class Command(BaseCommand):
+    help = 'Delete expired and used magic link tokens (run daily from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows deleted per DELETE statement')
+
+    def handle(self, *args, **options):
+        deleted = MagicLinkToken.objects.purge(batch_size=options['batch_size'])
+        self.stdout.write(f'Purged {deleted} magic link tokens')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from a_main import rollups
+
+
+class Command(BaseCommand):
+    help = ('Recompute the dashboard rollups of days flagged by recent writes. '
+            'Run from cron every few minutes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute every day from the first recorded activity')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            refreshed = rollups.rebuild(options['batch_size'])
+        else:
+            refreshed = rollups.refresh(options['batch_size'])
+        if options['verbosity'] >= 1:
+            self.stdout.write(f'Refreshed {refreshed} days')
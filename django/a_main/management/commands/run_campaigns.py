@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from a_main.campaigns import claim_batch, send_batch
+from a_main.microsoft_graph import MicrosoftGraphEmailSender
+
+
+class Command(BaseCommand):
+    help = ('Send queued campaign emails in batches.  Runs as its own '
+            'process next to the web workers; several may run at once.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--sleep', type=float, default=5.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        sender = MicrosoftGraphEmailSender()
+        while True:
+            batch = claim_batch(options['batch_size'])
+            if not batch:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+            send_batch(batch, sender)
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'Sent batch of {len(batch)}')
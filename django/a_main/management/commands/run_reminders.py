@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from a_main.microsoft_graph import MicrosoftGraphEmailSender
+from a_main.reminders import send_due_reminders
+
+
+class Command(BaseCommand):
+    help = ('Email appointment reminders 24 hours and 1 hour ahead.  Runs '
+            'as its own process; each tick only scans the due windows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--sleep', type=float, default=60.0,
+                            help='Seconds between ticks once nothing is due')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once nothing is due')
+
+    def handle(self, *args, **options):
+        sender = MicrosoftGraphEmailSender()
+        while True:
+            sent = send_due_reminders(options['batch_size'], sender)
+            if options['verbosity'] >= 2 and sent:
+                self.stdout.write(f'Sent {sent} reminders')
+            if sent:
+                continue
+            if options['once']:
+                return
+            time.sleep(options['sleep'])
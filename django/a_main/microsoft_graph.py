@@ -1,8 +1,16 @@
-import msal
-import requests
 import base64
+import logging
 from typing import List, Optional
 from decouple import config
+from django.core.mail import EmailMultiAlternatives
+
+from .instrumentation import timed
+from .lazy import lazy_import
+
+msal = lazy_import('msal')
+requests = lazy_import('requests')
+
+logger = logging.getLogger(__name__)
 
 
 class MicrosoftGraphEmailSender:
@@ -11,17 +19,22 @@ class MicrosoftGraphEmailSender:
         self.CLIENT_SECRET = config("CLIENT_SECRET")
         self.TENANT_ID = config("TENANT_ID")
         self.USER_EMAIL = config("EMAIL_HOST_USER")  # Sender email
+        self._app = None
 
     def _acquire_token(self) -> Optional[str]:
         """Get an access token for Microsoft Graph API."""
-        authority_url = f'https://login.microsoftonline.com/{self.TENANT_ID}'
-        app = msal.ConfidentialClientApplication(
-            authority=authority_url,
-            client_id=self.CLIENT_ID,
-            client_credential=self.CLIENT_SECRET
-        )
-        token = app.acquire_token_for_client(
-            scopes=["https://graph.microsoft.com/.default"])
+        # One MSAL app per sender, so its token cache serves every email
+        # sent through the same sender (e.g. a campaign batch).
+        if self._app is None:
+            authority_url = f'https://login.microsoftonline.com/{self.TENANT_ID}'
+            self._app = msal.ConfidentialClientApplication(
+                authority=authority_url,
+                client_id=self.CLIENT_ID,
+                client_credential=self.CLIENT_SECRET
+            )
+        with timed('graph'):
+            token = self._app.acquire_token_for_client(
+                scopes=["https://graph.microsoft.com/.default"])
         return token.get("access_token")
 
     @staticmethod
@@ -38,7 +51,8 @@ class MicrosoftGraphEmailSender:
         attachments: Optional[List[str]] = None,
         bcc_recipients: Optional[List[str]] = None,
         cc_recipients: Optional[List[str]] = None,
-        is_html: bool = False  # Add this new parameter
+        is_html: bool = False,  # Add this new parameter
+        text_message: Optional[str] = None
     ) -> bool:
         """
         Send an email via Microsoft Graph API.
@@ -49,14 +63,21 @@ class MicrosoftGraphEmailSender:
             message: Email body content.
             attachments: List of file paths to attach.
             is_html: Whether the message content is HTML (default: False)
+            text_message: Plaintext alternative of an HTML message; the
+                email is then sent as multipart/alternative MIME.
         """
         access_token = self._acquire_token()
         if not access_token:
-            print("Failed to acquire access token.")
+            logger.error("Failed to acquire a Microsoft Graph access token")
             return False
 
         endpoint = f'https://graph.microsoft.com/v1.0/users/{self.USER_EMAIL}/sendMail'
 
+        if is_html and text_message is not None:
+            return self._send_mime(
+                endpoint, access_token, to_email, subject, message,
+                text_message, attachments, bcc_recipients, cc_recipients)
+
         # Prepare email payload
         email_msg = {
             "message": {
@@ -101,18 +122,54 @@ class MicrosoftGraphEmailSender:
                 })
 
         # Send the email
-        response = requests.post(
-            endpoint,
-            headers={
-                'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/json'
-            },
-            json=email_msg
+        with timed('graph'):
+            response = requests.post(
+                endpoint,
+                headers={
+                    'Authorization': f'Bearer {access_token}',
+                    'Content-Type': 'application/json'
+                },
+                json=email_msg
+            )
+
+        if response.ok:
+            logger.info("Email sent to %s", to_email)
+            return True
+        else:
+            logger.error("Sending email to %s failed (%s): %s",
+                         to_email, response.status_code, response.text)
+            return False
+
+    def _send_mime(self, endpoint, access_token, to_email, subject, html_message,
+                   text_message, attachments, bcc_recipients, cc_recipients) -> bool:
+        """Send an HTML + plaintext email through Graph's MIME upload."""
+        email = EmailMultiAlternatives(
+            subject=subject,
+            body=text_message,
+            from_email=self.USER_EMAIL,
+            to=[to_email],
+            cc=cc_recipients or [],
+            # Graph reads Bcc from the MIME headers and strips it on send.
+            headers={'Bcc': ', '.join(bcc_recipients)} if bcc_recipients else None,
         )
+        email.attach_alternative(html_message, 'text/html')
+        for file_path in attachments or []:
+            email.attach_file(file_path)
+
+        with timed('graph'):
+            response = requests.post(
+                endpoint,
+                headers={
+                    'Authorization': f'Bearer {access_token}',
+                    'Content-Type': 'text/plain'
+                },
+                data=base64.b64encode(email.message().as_bytes())
+            )
 
         if response.ok:
-            print(f"Email sent successfully to {to_email}!")
+            logger.info("Email sent to %s", to_email)
             return True
         else:
-            print(f"Failed to send email. Error: {response.json()}")
+            logger.error("Sending email to %s failed (%s): %s",
+                         to_email, response.status_code, response.text)
             return False
@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse, HttpResponseBadRequest
+
+from .instrumentation import current_timings, histograms, track_request
+from .profiling import PROFILERS, profile_filename
+from .routers import choose_replica, current_routing, routing_reads
+
+logger = logging.getLogger('a_main.performance')
+
+
+class PerformanceMiddleware:
+    """
+    Measures DB, template render and outbound HTTP time per request.
+
+    Emits a Server-Timing header, one structured log line per request and
+    feeds the per-URL-name histograms exported by the metrics view.  Place
+    it first in MIDDLEWARE (after WhiteNoise) so it sees the whole request
+    and renders TemplateResponses last.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'PERFORMANCE_SERVER_TIMING', True)
+
+    def __call__(self, request):
+        with track_request() as timings, ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(timings.queries))
+            response = self.get_response(request)
+
+        total = timings.total
+        match = request.resolver_match
+        url_name = match.url_name if match and match.url_name else 'unresolved'
+
+        histograms.observe('duration', url_name, total * 1000)
+        histograms.observe('db', url_name, timings.queries.duration * 1000)
+
+        if self.server_timing:
+            response['Server-Timing'] = self.server_timing_header(timings, total)
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'event': 'request',
+                'method': request.method,
+                'path': request.path,
+                'url_name': url_name,
+                'status': response.status_code,
+                'total_ms': round(total * 1000, 2),
+                'db_queries': timings.queries.count,
+                'db_ms': round(timings.queries.duration * 1000, 2),
+                'render_ms': round(timings.render * 1000, 2),
+                **{f'{service}_ms': round(duration * 1000, 2)
+                   for service, duration in timings.outbound.items()},
+            }))
+        return response
+
+    def process_template_response(self, request, response):
+        # Render here rather than in the handler so the render can be timed.
+        # As the outermost middleware this hook runs after all others.
+        timings = current_timings()
+        start = time.perf_counter()
+        response.render()
+        if timings is not None:
+            timings.render += time.perf_counter() - start
+        return response
+
+    @staticmethod
+    def server_timing_header(timings, total):
+        parts = [
+            f'db;dur={timings.queries.duration * 1000:.1f};desc="{timings.queries.count} queries"',
+            f'render;dur={timings.render * 1000:.1f}',
+        ]
+        parts += [
+            f'{service};dur={duration * 1000:.1f}'
+            for service, duration in timings.outbound.items()
+        ]
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+
+class ReplicaMiddleware:
+    """
+    Sends the reads of safe requests to a read replica.
+
+    Only views that set ``use_replica = True`` and admin changelists are
+    routed; everything else reads from the primary.  A request that writes
+    pins itself to the primary from then on, and sets a cookie keeping the
+    client on the primary for REPLICA_STICKY_SECONDS, so whoever just saved
+    something never reads from a replica that has not caught up yet.  Place
+    it before SessionMiddleware so session saves count as writes.
+    """
+
+    PIN_COOKIE = 'primary_pin'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sticky_seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 15)
+
+    def __call__(self, request):
+        with routing_reads() as routing:
+            response = self.get_response(request)
+        if routing.wrote:
+            response.set_cookie(self.PIN_COOKIE, '1', max_age=self.sticky_seconds,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        routing = current_routing()
+        if (routing is not None and request.method in ('GET', 'HEAD')
+                and self.PIN_COOKIE not in request.COOKIES
+                and self.wants_replica(request, view_func)):
+            routing.alias = choose_replica()
+
+    @staticmethod
+    def wants_replica(request, view_func):
+        view = getattr(view_func, 'view_class', view_func)
+        if getattr(view, 'use_replica', False):
+            return True
+        match = request.resolver_match
+        return bool(match and match.namespace == 'admin'
+                    and match.url_name and match.url_name.endswith('_changelist'))
+
+
+class ProfilerMiddleware:
+    """
+    Lets superusers profile a single request in production.
+
+    Enabled per request with ``?_profile=sample`` (or ``=1``) /
+    ``?_profile=cprofile``, or the same values in an ``X-Profile`` header.
+    The page is replaced by the profile as a download and, when
+    PROFILER_ROOT is set, a copy is written there.  A site-wide fixed window
+    (PROFILER_RATE_LIMIT = (count, seconds)) caps how often it can run.
+    Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = request.GET.get('_profile') or request.headers.get('X-Profile')
+        if not mode or not request.user.is_superuser:
+            return self.get_response(request)
+
+        mode = 'sample' if mode == '1' else mode
+        if mode not in PROFILERS:
+            return HttpResponseBadRequest(
+                f"Unknown profile mode; use one of: {', '.join(PROFILERS)}")
+
+        if not self.allow():
+            logger.warning('Profiler rate limit reached; serving %s unprofiled',
+                           request.path)
+            response = self.get_response(request)
+            response['X-Profile-Status'] = 'rate-limited'
+            return response
+
+        factory, content_type, extension, serialize = PROFILERS[mode]
+        with factory() as profiler:
+            response = self.get_response(request)
+        data = serialize(profiler)
+
+        filename = profile_filename(request, extension)
+        profile_root = getattr(settings, 'PROFILER_ROOT', None)
+        if profile_root:
+            os.makedirs(profile_root, exist_ok=True)
+            with open(os.path.join(profile_root, filename), 'wb') as profile_file:
+                profile_file.write(data)
+
+        profile_response = HttpResponse(data, content_type=content_type)
+        profile_response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        profile_response['X-Profile-Status'] = f'profiled; status={response.status_code}'
+        return profile_response
+
+    @staticmethod
+    def allow():
+        limit, window = getattr(settings, 'PROFILER_RATE_LIMIT', (10, 3600))
+        key = f"profiler:window:{int(time.time() // window)}"
+        cache.add(key, 0, timeout=window)
+        try:
+            return cache.incr(key) <= limit
+        except ValueError:
+            # Key expired between add() and incr(); start a new window.
+            cache.set(key, 1, timeout=window)
+            return True
@@ -1,37 +1,140 @@
-from django.db import models
+import hashlib
+import logging
+import secrets
+
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connection, models, transaction
+from django.db.models import Q
 from django.utils.timezone import now
 from django.contrib.auth.models import User, Group
 from django.core.files.base import ContentFile
-from django.utils.crypto import get_random_string
+from imagekit.cachefiles.strategies import Optimistic
 from imagekit.models import ImageSpecField
 from imagekit.processors import ResizeToFill
 from datetime import timedelta
 
+logger = logging.getLogger(__name__)
+
 
 class CustomerProfile(models.Model):
     user = models.OneToOneField(
         User, on_delete=models.CASCADE, related_name='profile')
-    first_contact = models.DateTimeField(default=now, editable=False)
+    first_contact = models.DateTimeField(default=now, editable=False, db_index=True)
     recent_contact = models.DateTimeField(blank=True, null=True)
     interest = models.CharField(max_length=100)
     first_session = models.DateTimeField(blank=True, null=True)
     custnotes = models.TextField(
         blank=True, null=True, verbose_name="Customer General Notes")
-
-    # Magic link for future possible user interaction
-    magic_link_token = models.CharField(max_length=100, blank=True, null=True)
-    magic_link_expires = models.DateTimeField(blank=True, null=True)
+    # Filled by a database trigger on Postgres; see a_main.search.
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def generate_magic_link(self):
-        self.magic_link_token = get_random_string(50)
-        self.magic_link_expires = now() + timedelta(hours=24)
-        self.save()
-        return self.magic_link_token
+        """Issue a new login link token for this customer."""
+        return MagicLinkToken.objects.issue(self.user_id)
 
     def __str__(self):
         return f"{self.user.username}'s profile"
 
 
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class MagicLinkTokenManager(models.Manager):
+
+    def issue(self, user_id, lifetime=timedelta(hours=24)):
+        """Store a new token for ``user_id`` and return it in the clear."""
+        return self.issue_many([user_id], lifetime)[user_id]
+
+    def issue_many(self, user_ids, lifetime=timedelta(hours=24)):
+        """One token per user in a single INSERT; returns {user_id: token}."""
+        expires_at = now() + lifetime
+        tokens = {user_id: secrets.token_urlsafe(32) for user_id in user_ids}
+        self.bulk_create([
+            self.model(user_id=user_id, token_hash=hash_token(token),
+                       expires_at=expires_at)
+            for user_id, token in tokens.items()
+        ])
+        return tokens
+
+    def consume(self, token):
+        """
+        Mark ``token`` used and return its user id, or None when it is
+        unknown, expired or already used.
+
+        One UPDATE ... RETURNING on the unique hash index, so it costs the
+        same at any table size and two concurrent requests can never both
+        consume the same token.
+        """
+        token_hash = hash_token(token)
+        at = now()
+        if connection.vendor == 'postgresql' or (
+                connection.vendor == 'sqlite'
+                and connection.features.can_return_columns_from_insert):
+            meta = self.model._meta
+            quote = connection.ops.quote_name
+
+            def column(name):
+                return quote(meta.get_field(name).column)
+
+            stamp = connection.ops.adapt_datetimefield_value(at)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {quote(meta.db_table)} SET {column('used_at')} = %s "
+                    f"WHERE {column('token_hash')} = %s AND {column('used_at')} IS NULL "
+                    f"AND {column('expires_at')} > %s RETURNING {column('user')}",
+                    [stamp, token_hash, stamp])
+                row = cursor.fetchone()
+            return row[0] if row else None
+
+        # No UPDATE ... RETURNING: lock the row, then mark it.
+        with transaction.atomic():
+            user_id = (
+                self.select_for_update()
+                .filter(token_hash=token_hash, used_at__isnull=True, expires_at__gt=at)
+                .values_list('user_id', flat=True)
+                .first()
+            )
+            if user_id is not None:
+                self.filter(token_hash=token_hash).update(used_at=at)
+            return user_id
+
+    def purge(self, batch_size=5000):
+        """Delete expired and used tokens in batches; returns the count."""
+        dead = self.filter(Q(expires_at__lte=now()) | Q(used_at__isnull=False))
+        deleted = 0
+        while True:
+            batch = list(dead.values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                return deleted
+            deleted += self.filter(pk__in=batch).delete()[0]
+
+
+class MagicLinkToken(models.Model):
+    """
+    A single-use login link.  Only a SHA-256 of the token is stored; the
+    token itself exists in the emailed URL alone.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='magic_link_tokens')
+    token_hash = models.CharField(max_length=64, unique=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    used_at = models.DateTimeField(blank=True, null=True)
+
+    objects = MagicLinkTokenManager()
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @property
+    def is_active(self):
+        return self.used_at is None and self.expires_at > now()
+
+    def __str__(self):
+        return f"Magic link for {self.user} (expires {self.expires_at:%Y-%m-%d %H:%M})"
+
+
 class Appointment(models.Model):
     customer = models.ForeignKey(
         CustomerProfile,
@@ -45,6 +148,7 @@ class Appointment(models.Model):
         blank=True, null=True, verbose_name="Follow Up Actions")
     invoiced = models.BooleanField(default=False)
     paid = models.BooleanField(default=False)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     # You might want to track when the appointment was created/modified
     created_at = models.DateTimeField(auto_now_add=True)
@@ -55,6 +159,39 @@ class Appointment(models.Model):
 
     class Meta:
         ordering = ['-date']  # Most recent appointments first
+        indexes = [
+            # The reminder scheduler's due-window scan.
+            models.Index(fields=['date'], name='appointment_date_idx'),
+            # A customer's first appointment, for the conversion rollup, and
+            # the keyset pages of their history.
+            models.Index(fields=['customer', 'date', 'id'], name='appointment_customer_date_idx'),
+        ]
+
+
+class AppointmentReminder(models.Model):
+    """
+    A reminder sent (or being sent) for an appointment.  One row per
+    appointment and kind; the unique pair is what keeps run_reminders from
+    sending the same reminder twice.
+    """
+    KINDS = [
+        ('24H', '24 hours before'),
+        ('1H', '1 hour before'),
+    ]
+
+    appointment = models.ForeignKey(
+        Appointment, on_delete=models.CASCADE, related_name='reminders')
+    kind = models.CharField(max_length=3, choices=KINDS)
+    sent_at = models.DateTimeField(default=now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['appointment', 'kind'],
+                                    name='unique_appointment_reminder'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} reminder for appointment {self.appointment_id}"
 
 
 class Contact(models.Model):
@@ -62,9 +199,10 @@ class Contact(models.Model):
     email = models.EmailField(verbose_name='E-Mail')
     subject = models.CharField(max_length=255, verbose_name='Subject')
     message = models.TextField(verbose_name='Message')
-    when_sent = models.DateTimeField(default=now, editable=False)
+    when_sent = models.DateTimeField(default=now, editable=False, db_index=True)
     replied = models.BooleanField(default=False)
     when_replied = models.DateTimeField(blank=True, null=True)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -112,6 +250,22 @@ def content_media_upload_path(instance, filename):
     return f'{content_type}/{filename}'
 
 
+class GenerateThumbnailOnSave(Optimistic):
+    """
+    Generate thumbnails when an upload is saved, and trust they exist after.
+
+    Rendering a thumbnail URL then never touches storage.  A source that
+    cannot be read is logged rather than failing the save; run
+    ``manage.py generateimages`` to fill in missing thumbnails.
+    """
+
+    def on_source_saved(self, file):
+        try:
+            file.generate()
+        except (OSError, ValueError) as exc:
+            logger.warning('Could not generate thumbnail %s: %s', file.name, exc)
+
+
 class ContentMedia(models.Model):
     MEDIA_TYPES = [
         ('IMAGE', 'Image'),
@@ -133,7 +287,8 @@ class ContentMedia(models.Model):
         source='file',
         processors=[ResizeToFill(400, 300)],
         format='JPEG',
-        options={'quality': 80}
+        options={'quality': 80},
+        cachefile_strategy=GenerateThumbnailOnSave,
     )
     caption = models.CharField(max_length=255, blank=True)
     order = models.PositiveIntegerField(default=0)
@@ -146,3 +301,117 @@ class ContentMedia(models.Model):
 
     def __str__(self):
         return f"Media for {self.content.title}"
+
+
+class Campaign(models.Model):
+    """A bulk email to a filtered set of customers, sent by run_campaigns."""
+    KINDS = [
+        ('MAGIC_LINK', 'Magic login link'),
+        ('REMINDER', 'Session reminder'),
+    ]
+    AUDIENCES = [
+        ('ALL', 'All customers'),
+        ('UPCOMING_FIRST_SESSION', 'First session in the next 14 days'),
+        ('INACTIVE_30_DAYS', 'No login in 30 days'),
+    ]
+    STATUSES = [
+        ('QUEUED', 'Queued'),
+        ('SENDING', 'Sending'),
+        ('DONE', 'Done'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    audience = models.CharField(max_length=30, choices=AUDIENCES)
+    status = models.CharField(max_length=10, choices=STATUSES, default='QUEUED')
+    created_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, blank=True, null=True,
+        related_name='campaigns')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    # Progress counters, bumped with F() once per batch by the worker.
+    total = models.PositiveIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @property
+    def processed(self):
+        return self.sent + self.failed
+
+    @property
+    def percent(self):
+        return round(100 * self.processed / self.total) if self.total else 100
+
+    def __str__(self):
+        return f"{self.get_kind_display()} to {self.get_audience_display()}"
+
+
+class CampaignMessage(models.Model):
+    """One recipient of a campaign; doubles as the worker's queue entry."""
+    STATUSES = [
+        ('PENDING', 'Pending'),
+        ('CLAIMED', 'Claimed'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    ]
+
+    campaign = models.ForeignKey(
+        Campaign, on_delete=models.CASCADE, related_name='messages')
+    customer = models.ForeignKey(
+        CustomerProfile, on_delete=models.CASCADE, related_name='campaign_messages')
+    status = models.CharField(max_length=10, choices=STATUSES, default='PENDING')
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    error = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's claim query.
+            models.Index(fields=['status', 'id'], name='campaignmsg_queue_idx'),
+        ]
+
+
+class DailyRollup(models.Model):
+    """
+    Per-day totals behind the managers dashboard, kept by a_main.rollups.
+
+    Signals only flag a day ``dirty``; refresh_rollups recomputes flagged
+    days from that day's rows alone.
+    """
+    day = models.DateField(unique=True)
+    appointments = models.PositiveIntegerField(default=0)
+    invoiced = models.PositiveIntegerField(default=0)
+    invoiced_unpaid = models.PositiveIntegerField(default=0)
+    contacts = models.PositiveIntegerField(default=0)
+    new_customers = models.PositiveIntegerField(default=0)
+    # Customers whose first ever appointment falls on this day.
+    first_appointments = models.PositiveIntegerField(default=0)
+    dirty = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-day']
+        indexes = [
+            models.Index(fields=['day'], condition=models.Q(dirty=True),
+                         name='dailyrollup_dirty_idx'),
+        ]
+
+    def __str__(self):
+        return f"Rollup for {self.day}"
+
+
+class RoleVersion(models.Model):
+    """
+    When a user's groups last changed, kept by a_main.roles.
+
+    Loaded in the same query as the user itself, so checking that the
+    group names remembered in a session are current costs nothing.
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='role_version')
+    stamp = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Role version of {self.user_id}"
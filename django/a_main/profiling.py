@@ -0,0 +1,88 @@
+import cProfile
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of the thread that started it from a background
+    thread.  No signals are involved, so it works under gunicorn sync
+    workers and the threaded dev server alike.
+
+    The result is in the "collapsed stack" format understood by
+    flamegraph.pl, speedscope and inferno: one ``frame;frame;frame count``
+    line per distinct stack.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._target = None
+
+    def __enter__(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(
+            target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_frame_files = {__file__}
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                if code.co_filename not in own_frame_files:
+                    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                    stack.append(f"{module}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(
+            f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class CProfiler:
+    """Deterministic profile as a pstats dump (snakeviz, flameprof, gprof2dot)."""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+
+    def dump(self):
+        self.profile.create_stats()
+        return marshal.dumps(self.profile.stats)
+
+
+PROFILERS = {
+    # mode: (factory, content type, file extension, serializer)
+    'sample': (SamplingProfiler, 'text/plain', 'collapsed',
+               lambda profiler: profiler.collapsed().encode()),
+    'cprofile': (CProfiler, 'application/octet-stream', 'prof',
+                 lambda profiler: profiler.dump()),
+}
+
+
+def profile_filename(request, extension):
+    match = request.resolver_match
+    name = match.url_name if match and match.url_name else 'request'
+    return f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.{extension}"
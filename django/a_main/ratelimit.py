@@ -0,0 +1,183 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+
+class Rule:
+    """
+    At most ``limit`` requests per ``window`` seconds per value of ``scope``.
+
+    ``scope`` is 'ip' or the name of a POST field (e.g. 'email').  Rules
+    only apply to the listed HTTP ``methods``.
+    """
+
+    def __init__(self, name, scope, limit, window, methods=('POST',)):
+        self.name = name
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+        self.methods = methods
+
+    def key(self, request):
+        if self.scope == 'ip':
+            value = client_ip(request)
+        else:
+            value = request.POST.get(self.scope, '').strip().lower()
+        if not value:
+            return None
+        # Hashed so arbitrary user input is always a valid cache key.
+        digest = hashlib.blake2b(value.encode(), digest_size=12).hexdigest()
+        return f"{self.name}:{self.scope}:{digest}"
+
+
+def client_ip(request):
+    """
+    The client address, trusting RATELIMIT_PROXY_HOPS reverse proxies that
+    append to X-Forwarded-For (nginx's $proxy_add_x_forwarded_for).
+    """
+    hops = getattr(settings, 'RATELIMIT_PROXY_HOPS', 0)
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if hops and forwarded:
+        addresses = [a.strip() for a in forwarded.split(',')]
+        if len(addresses) >= hops:
+            return addresses[-hops]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class SlidingWindowLimiter:
+    """
+    Approximate sliding window over two fixed windows in the shared cache.
+
+    The estimate weights the previous window by how much of it still
+    overlaps the sliding window.  Keys found over the limit are also
+    remembered in-process until their window ends, so a flood against one
+    worker is turned away without touching the cache at all.
+
+    Counts are only exact on a cache with an atomic incr (LocMem,
+    memcached, Redis).  Avoid the DatabaseCache: its incr is a read then a
+    write, so concurrent hits undercount, and each counted hit costs
+    several queries.  Production points RATELIMIT_CACHE at a per-process
+    LocMem cache instead, so hits cost no query and each worker enforces
+    the limits on its own.
+    """
+
+    MAX_LOCAL_BLOCKS = 10000
+
+    def __init__(self, cache_alias='default'):
+        self.cache_alias = cache_alias
+        self._blocked = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _blocked_until(self, key, now):
+        until = self._blocked.get(key)
+        if until is not None and until <= now:
+            with self._lock:
+                self._blocked.pop(key, None)
+            return None
+        return until
+
+    def block(self, key, window, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            if len(self._blocked) >= self.MAX_LOCAL_BLOCKS:
+                self._blocked = {k: v for k, v in self._blocked.items() if v > now}
+            if len(self._blocked) < self.MAX_LOCAL_BLOCKS:
+                self._blocked[key] = now + window
+
+    def hit(self, key, limit, window, weight=1):
+        """Count a request against ``key``; False when over the limit."""
+        now = time.time()
+        if self._blocked_until(key, now):
+            return False
+
+        current = int(now // window)
+        current_key = f"ratelimit:{key}:{current}"
+        previous_key = f"ratelimit:{key}:{current - 1}"
+        counts = self.cache.get_many([current_key, previous_key])
+        overlap = 1 - (now % window) / window
+        estimate = counts.get(previous_key, 0) * overlap + counts.get(current_key, 0)
+        if estimate + weight > limit:
+            self.block(key, window - now % window, now)
+            return False
+
+        # Windows outlive themselves by one window to serve as "previous".
+        # The read above says which of add and incr will succeed, so only
+        # a race with another worker pays for both.
+        if current_key in counts or not self.cache.add(current_key, weight, timeout=window * 2):
+            try:
+                self.cache.incr(current_key, weight)
+            except ValueError:
+                self.cache.set(current_key, weight, timeout=window * 2)
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._blocked.clear()
+
+
+limiter = SlidingWindowLimiter(getattr(settings, 'RATELIMIT_CACHE', 'default'))
+
+
+class RateLimitMixin:
+    """
+    Rejects abusive traffic in dispatch(), before the view does any work.
+
+    Views list their ``ratelimit_rules``.  A view may also name a
+    ``honeypot_field``: a hidden input humans never fill in.  A filled
+    honeypot uses up the sender's IP allowance at once and gets
+    ``honeypot_response()``, which looks like success to the bot.
+    """
+    ratelimit_rules = ()
+    honeypot_field = None
+
+    def dispatch(self, request, *args, **kwargs):
+        # Checked even with RATELIMIT_ENABLED off: it is not a limit.
+        if (self.honeypot_field and request.method == 'POST'
+                and request.POST.get(self.honeypot_field)):
+            return self.trap_honeypot(request)
+        if getattr(settings, 'RATELIMIT_ENABLED', True):
+            rejected = self.check_rate_limits(request)
+            if rejected is not None:
+                return rejected
+        return super().dispatch(request, *args, **kwargs)
+
+    def trap_honeypot(self, request):
+        if getattr(settings, 'RATELIMIT_ENABLED', True):
+            for rule in self.ratelimit_rules:
+                if rule.scope != 'ip':
+                    continue
+                key = rule.key(request)
+                if key is None:
+                    continue
+                limiter.hit(key, rule.limit, rule.window, weight=rule.limit)
+                limiter.block(key, rule.window)
+        return self.honeypot_response()
+
+    def check_rate_limits(self, request):
+        for rule in self.ratelimit_rules:
+            if request.method not in rule.methods:
+                continue
+            key = rule.key(request)
+            if key is None:
+                continue
+            if not limiter.hit(key, rule.limit, rule.window):
+                return self.ratelimited_response(rule)
+        return None
+
+    def honeypot_response(self):
+        return HttpResponse(status=204)
+
+    def ratelimited_response(self, rule):
+        response = HttpResponse(
+            "Too many requests. Please try again later.",
+            status=429, content_type='text/plain')
+        response['Retry-After'] = str(rule.window)
+        return response
@@ -0,0 +1,106 @@
+import logging
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from django.utils.timezone import localtime, now
+
+from .emails import render_email
+from .microsoft_graph import MicrosoftGraphEmailSender
+from .models import Appointment, AppointmentReminder
+
+logger = logging.getLogger(__name__)
+
+# kind: how long before the appointment it is sent, largest first.
+REMINDERS = [
+    ('24H', timedelta(hours=24)),
+    ('1H', timedelta(hours=1)),
+]
+
+
+def windows():
+    """
+    (kind, start, end) offsets from now for each reminder kind.
+
+    Each window ends where the next smaller one begins, so an appointment
+    booked at short notice only gets the reminders still ahead of it.
+    """
+    offsets = [offset for _, offset in REMINDERS[1:]] + [timedelta(0)]
+    return [(kind, start, end)
+            for (kind, end), start in zip(REMINDERS, offsets)]
+
+
+def due_appointments(kind, start, end, at=None):
+    """
+    Appointments in the ``kind`` window that have not had that reminder.
+
+    A range scan on the date index plus a lookup on the unique
+    (appointment, kind) index per row, so the cost depends on how many
+    appointments fall in the window, not on the size of either table.
+    """
+    at = at or now()
+    sent = AppointmentReminder.objects.filter(appointment=OuterRef('pk'), kind=kind)
+    return (
+        Appointment.objects
+        .filter(date__gte=at + start, date__lt=at + end)
+        .exclude(Exists(sent))
+        .select_related('customer__user')
+        .order_by('date')
+    )
+
+
+def send_due_reminders(batch_size=50, sender=None, at=None):
+    """
+    Send up to ``batch_size`` due reminders of each kind; returns how many
+    were sent.
+
+    Reminder rows are written before sending, so a second scheduler
+    racing this one hits the unique constraint instead of emailing twice.
+    Rows of failed sends are removed again and retried on the next tick
+    while the appointment is still in the window.
+    """
+    at = at or now()
+    sender = sender or MicrosoftGraphEmailSender()
+    total = 0
+    for kind, start, end in windows():
+        appointments = list(due_appointments(kind, start, end, at)[:batch_size])
+        if not appointments:
+            continue
+        try:
+            with transaction.atomic():
+                AppointmentReminder.objects.bulk_create([
+                    AppointmentReminder(appointment=appointment, kind=kind, sent_at=at)
+                    for appointment in appointments
+                ])
+        except IntegrityError:
+            logger.warning('%s reminders claimed by another scheduler', kind)
+            continue
+
+        failed = []
+        for appointment in appointments:
+            if send_reminder(appointment, kind, sender):
+                total += 1
+            else:
+                failed.append(appointment.pk)
+        if failed:
+            AppointmentReminder.objects.filter(
+                appointment_id__in=failed, kind=kind).delete()
+    return total
+
+
+def send_reminder(appointment, kind, sender):
+    user = appointment.customer.user
+    date = localtime(appointment.date)
+    body = render_email('a_main/email/appointment_reminder', {
+        'name': user.get_full_name() or user.username,
+        'date': appointment.date,
+        'kind': kind,
+    })
+    try:
+        return sender.send_email(
+            to_email=user.email,
+            subject=f"Your-Voyage Appointment Reminder: {date:%Y-%m-%d %H:%M}",
+            is_html=True, message=body.html, text_message=body.text)
+    except Exception:
+        logger.exception('Reminder email to %s failed', user.email)
+        return False
@@ -0,0 +1,203 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, User
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection
+from django.utils.functional import LazyObject
+
+from .models import RoleVersion
+
+
+# Canonical group names.  Everything that creates or checks a role group
+# must use these so views, forms and seed data agree.
+CUSTOMERS_GROUP = 'Customers Group'
+MANAGERS_GROUP = 'Managers Group'
+
+# Groups older code created instead, and the canonical group their members
+# belong in; merged by the merge_legacy_groups command.
+LEGACY_GROUPS = {'Customers': CUSTOMERS_GROUP}
+
+SESSION_KEY = '_role_group_names'
+
+# Group ids never change once created, so each process looks them up once.
+# Cleared by the Group signals in a_main.signals.
+_group_ids = {}
+
+
+class Roles:
+    """Role flags resolved from a user's group names."""
+
+    __slots__ = ('user_id', 'group_names', 'is_superuser')
+
+    def __init__(self, user_id, group_names, is_superuser):
+        self.user_id = user_id
+        self.group_names = frozenset(group_names)
+        self.is_superuser = is_superuser
+
+    @property
+    def is_authenticated(self):
+        return self.user_id is not None
+
+    @property
+    def is_customer(self):
+        return CUSTOMERS_GROUP in self.group_names
+
+    @property
+    def is_manager(self):
+        return MANAGERS_GROUP in self.group_names
+
+    @property
+    def is_manager_or_superuser(self):
+        return self.is_manager or self.is_superuser
+
+    def as_context(self):
+        return {
+            'is_authenticated': self.is_authenticated,
+            'is_customer': self.is_customer,
+            'is_manager': self.is_manager,
+            'is_superuser': self.is_superuser,
+            'is_manager_or_superuser': self.is_manager_or_superuser,
+        }
+
+
+ANONYMOUS_ROLES = Roles(None, (), False)
+
+
+def group_id(name):
+    """Id of the named role group, creating the group on first use."""
+    try:
+        return _group_ids[name]
+    except KeyError:
+        group, _ = Group.objects.get_or_create(name=name)
+        _group_ids[name] = group.pk
+        return group.pk
+
+
+def forget_group_ids():
+    _group_ids.clear()
+
+
+def join_group(user_id, name):
+    """
+    Add ``user_id`` to the named role group, as m2m signals would not.
+
+    Returns True when that may change the roles of a live session: the
+    membership is new and the user has logged in before.  The caller then
+    invalidates them.  One INSERT ... ON CONFLICT DO NOTHING RETURNING, so
+    brand-new and repeat customers cost nothing more than the insert;
+    without RETURNING every call counts as a change.
+    """
+    membership = User.groups.through
+    group = group_id(name)
+    if connection.vendor == 'postgresql' or (
+            connection.vendor == 'sqlite'
+            and connection.features.can_return_columns_from_insert):
+        quote = connection.ops.quote_name
+
+        def column(model, name):
+            return quote(model._meta.get_field(name).column)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(membership._meta.db_table)} "
+                f"({column(membership, 'user')}, {column(membership, 'group')}) "
+                f"VALUES (%s, %s) ON CONFLICT DO NOTHING "
+                f"RETURNING (SELECT {column(User, 'last_login')} IS NOT NULL "
+                f"FROM {quote(User._meta.db_table)} WHERE {column(User, 'id')} = %s)",
+                [user_id, group, user_id])
+            row = cursor.fetchone()
+        return bool(row and row[0])
+
+    membership.objects.bulk_create(
+        [membership(user_id=user_id, group_id=group)], ignore_conflicts=True)
+    return True
+
+
+class RoleVersionBackend(ModelBackend):
+    """
+    ModelBackend whose request.user comes with its RoleVersion joined in,
+    so get_roles can validate the session's group names without a query.
+    """
+
+    def get_user(self, user_id):
+        try:
+            user = User._default_manager.select_related('role_version').get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+
+def role_version(user):
+    """The stamp of ``user``'s last group change, 0 if never changed."""
+    try:
+        return user.role_version.stamp
+    except ObjectDoesNotExist:
+        return 0
+
+
+def invalidate(*user_ids):
+    """Force the next request of these users to reload their groups."""
+    stamp = time.time_ns()
+    RoleVersion.objects.bulk_create(
+        [RoleVersion(user_id=user_id, stamp=stamp) for user_id in user_ids],
+        update_conflicts=True, unique_fields=['user'], update_fields=['stamp'])
+
+
+def _load_group_names(request, user):
+    """
+    Group names from the session when still valid, else from the database.
+
+    A stored entry is valid for the same user and the same role version,
+    which is bumped whenever their groups change.  The version arrives
+    joined to the user, so a valid entry costs no query and the session is
+    only written again after a change.
+    """
+    version = role_version(user)
+    session = getattr(request, 'session', None)
+    stored = session.get(SESSION_KEY) if session is not None else None
+    if stored and stored['user'] == user.pk and stored['version'] == version:
+        return stored['names']
+
+    names = list(user.groups.values_list('name', flat=True))
+    if session is not None:
+        session[SESSION_KEY] = {
+            'user': user.pk,
+            'version': version,
+            'names': names,
+        }
+    return names
+
+
+def lacks_session(request):
+    """
+    True when the request cannot belong to a logged-in user.
+
+    That is, it sent no session cookie and nothing logged a user in during
+    it (login() replaces the lazy request.user).  Lets anonymous traffic
+    skip building the session and user objects altogether.
+    """
+    return (settings.SESSION_COOKIE_NAME not in request.COOKIES
+            and isinstance(getattr(request, 'user', None), LazyObject))
+
+
+def get_roles(request):
+    """
+    Resolve the roles of ``request.user``.
+
+    Memoized on the request, so every role check after the first in a
+    request is free; across requests the group names come from the session.
+    Visitors without a session cookie never load a session or user.
+    """
+    if lacks_session(request):
+        return ANONYMOUS_ROLES
+    user = request.user
+    if not user.is_authenticated:
+        return ANONYMOUS_ROLES
+
+    roles = getattr(request, '_roles', None)
+    if roles is None or roles.user_id != user.pk:
+        roles = Roles(user.pk, _load_group_names(request, user), user.is_superuser)
+        request._roles = roles
+    return roles
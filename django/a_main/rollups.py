@@ -0,0 +1,149 @@
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, Exists, Max, Min, OuterRef, Q, Sum
+from django.utils.timezone import localdate, make_aware
+
+from .models import Appointment, Contact, CustomerProfile, DailyRollup
+
+COUNT_FIELDS = ['appointments', 'invoiced', 'invoiced_unpaid', 'contacts',
+                'new_customers', 'first_appointments']
+
+
+def day_range(day):
+    """The aware [start, end) datetimes of ``day`` in the current timezone."""
+    return (make_aware(datetime.combine(day, time.min)),
+            make_aware(datetime.combine(day + timedelta(days=1), time.min)))
+
+
+def mark_dirty(days):
+    """
+    Flag ``days`` for recomputation, creating their rows, in one query.
+
+    Outside a transaction bulk_create also opens one, so a lone save pays
+    two: an appointment status change runs 6 queries instead of 4.  The
+    bulk status endpoint and contact posts flag inside their own
+    transaction and pay one.
+    """
+    days = {day for day in days if day is not None}
+    if days:
+        DailyRollup.objects.bulk_create(
+            [DailyRollup(day=day, dirty=True) for day in days],
+            update_conflicts=True, unique_fields=['day'], update_fields=['dirty'])
+
+
+def mark_dirty_at(*moments):
+    mark_dirty(localdate(moment) for moment in moments if moment is not None)
+
+
+def appointment_days(customer_id, pk=None):
+    """
+    The customer's first appointment and, given ``pk``, that appointment's
+    stored date: the days an insert, move or delete can change.
+    """
+    days = Appointment.objects.filter(customer_id=customer_id).aggregate(
+        first=Min('date'), current=Min('date', filter=Q(pk=pk)))
+    return [days['first'], days['current']]
+
+
+def compute(day):
+    """A day's totals, read only from that day's rows."""
+    start, end = day_range(day)
+    on_day = Appointment.objects.filter(date__gte=start, date__lt=end).order_by()
+    # Aliases may not shadow the model's own invoiced field.
+    totals = on_day.aggregate(
+        all=Count('pk'),
+        billed=Count('pk', filter=Q(invoiced=True)),
+        unpaid=Count('pk', filter=Q(invoiced=True, paid=False)),
+    )
+    counts = {
+        'appointments': totals['all'],
+        'invoiced': totals['billed'],
+        'invoiced_unpaid': totals['unpaid'],
+    }
+    earlier = Appointment.objects.filter(customer=OuterRef('customer'), date__lt=start)
+    counts['first_appointments'] = (
+        on_day.exclude(Exists(earlier)).values('customer').distinct().count())
+    counts['contacts'] = Contact.objects.filter(
+        when_sent__gte=start, when_sent__lt=end).count()
+    counts['new_customers'] = CustomerProfile.objects.filter(
+        first_contact__gte=start, first_contact__lt=end).count()
+    return counts
+
+
+def refresh(batch_size=500):
+    """
+    Recompute every dirty day; returns how many were refreshed.
+
+    A day is marked clean before it is computed, so a write landing
+    meanwhile flags it again and the next run picks it up.
+    """
+    refreshed = 0
+    while True:
+        days = list(DailyRollup.objects.filter(dirty=True)
+                    .order_by('day').values_list('day', flat=True)[:batch_size])
+        if not days:
+            return refreshed
+        DailyRollup.objects.filter(day__in=days).update(dirty=False)
+        DailyRollup.objects.bulk_create(
+            [DailyRollup(day=day, dirty=False, **compute(day)) for day in days],
+            update_conflicts=True, unique_fields=['day'],
+            update_fields=COUNT_FIELDS + ['updated_at'])
+        refreshed += len(days)
+
+
+def rebuild(batch_size=500):
+    """Flag every day from the first recorded activity on, then refresh."""
+    bounds = [
+        Appointment.objects.aggregate(first=Min('date'), last=Max('date')),
+        Contact.objects.aggregate(first=Min('when_sent'), last=Max('when_sent')),
+        CustomerProfile.objects.aggregate(first=Min('first_contact'), last=Max('first_contact')),
+    ]
+    firsts = [localdate(b['first']) for b in bounds if b['first']]
+    if not firsts:
+        return 0
+    day = min(firsts)
+    last = max([localdate()] + [localdate(b['last']) for b in bounds if b['last']])
+    days = []
+    while day <= last:
+        days.append(day)
+        day += timedelta(days=1)
+    for i in range(0, len(days), batch_size):
+        mark_dirty(days[i:i + batch_size])
+    return refresh(batch_size)
+
+
+def dashboard(weeks=12, today=None):
+    """
+    Weekly totals for the last ``weeks`` weeks plus the all-time figures.
+
+    Two queries over DailyRollup, whatever the size of the history.
+    """
+    today = today or localdate()
+    this_week = today - timedelta(days=today.weekday())
+    start = this_week - timedelta(weeks=weeks - 1)
+    rows = {week: dict.fromkeys(COUNT_FIELDS, 0)
+            for week in (start + timedelta(weeks=i) for i in range(weeks))}
+    for rollup in (DailyRollup.objects
+                   .filter(day__gte=start, day__lt=this_week + timedelta(weeks=1))
+                   .values('day', *COUNT_FIELDS)):
+        week = rows[rollup['day'] - timedelta(days=rollup['day'].weekday())]
+        for field in COUNT_FIELDS:
+            week[field] += rollup[field]
+
+    totals = DailyRollup.objects.aggregate(
+        invoiced_unpaid=Sum('invoiced_unpaid'),
+        new_customers=Sum('new_customers'),
+        first_appointments=Sum('first_appointments'),
+        updated_at=Max('updated_at'),
+    )
+    return {
+        'weeks': [{'start': week, **counts} for week, counts in sorted(rows.items(), reverse=True)],
+        'invoiced_unpaid': totals['invoiced_unpaid'] or 0,
+        'conversion': conversion(totals['first_appointments'], totals['new_customers']),
+        'updated_at': totals['updated_at'],
+    }
+
+
+def conversion(converted, customers):
+    """Percentage of new customers who went on to a first appointment."""
+    return round(100 * (converted or 0) / customers, 1) if customers else None
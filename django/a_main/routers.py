@@ -0,0 +1,75 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Always read from the primary: a login is read back by the very next
+# request, and the database cache holds rate limits and role versions.
+PRIMARY_ONLY_APPS = {'sessions', 'django_cache'}
+
+_current_routing = ContextVar('read_routing', default=None)
+
+
+class ReadRouting:
+    """Where the reads of one request go, and whether it has written."""
+
+    __slots__ = ('alias', 'wrote')
+
+    def __init__(self, alias=DEFAULT_DB_ALIAS):
+        self.alias = alias
+        self.wrote = False
+
+
+def current_routing():
+    return _current_routing.get()
+
+
+@contextmanager
+def routing_reads(alias=DEFAULT_DB_ALIAS):
+    routing = ReadRouting(alias)
+    token = _current_routing.set(routing)
+    try:
+        yield routing
+    finally:
+        _current_routing.reset(token)
+
+
+def choose_replica():
+    """A random alias from DATABASE_REPLICAS, or the primary when none."""
+    replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+    return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    """
+    Writes go to the primary; reads go where ReplicaMiddleware sent them.
+
+    Outside a request (management commands, workers) and after the first
+    write of a request everything reads from the primary, as does anything
+    inside a transaction on it.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = _current_routing.get()
+        if (routing is None or routing.wrote
+                or model._meta.app_label in PRIMARY_ONLY_APPS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return routing.alias
+
+    def db_for_write(self, model, **hints):
+        routing = _current_routing.get()
+        # Filling the cache is not a write anyone reads back from a replica.
+        if routing is not None and model._meta.app_label != 'django_cache':
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,143 @@
+from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, Q
+
+from .models import Appointment, Contact, CustomerProfile
+
+CONFIG = 'english'
+
+# Weighted text columns behind each model's search_vector.
+VECTORS = {
+    CustomerProfile: [('interest', 'B'), ('custnotes', 'C')],
+    Appointment: [('kp_notes', 'B'), ('fu_notes', 'B')],
+    Contact: [('name', 'A'), ('subject', 'B'), ('message', 'C')],
+}
+
+# Columns matched by substring; trigram indexes make these ILIKEs fast.
+TRIGRAM_COLUMNS = {
+    User: ['username', 'email', 'first_name', 'last_name'],
+    Contact: ['email'],
+}
+
+NAME_LOOKUPS = ['username', 'email', 'first_name', 'last_name']
+
+
+def uses_postgres(alias='default'):
+    return connections[alias].vendor == 'postgresql'
+
+
+def _vector_sql(model, row):
+    return ' || '.join(
+        f"setweight(to_tsvector('{CONFIG}', coalesce({row}{model._meta.get_field(name).column}, '')), '{weight}')"
+        for name, weight in VECTORS[model])
+
+
+def install(using='default', **kwargs):
+    """
+    Create the Postgres side of search: a trigger per model filling
+    search_vector on every write (bulk_create and update() included), GIN
+    indexes over the vectors and trigram indexes for name/email matching.
+
+    Idempotent; runs after every migrate.  Other databases have nothing to
+    install and fall back to ILIKE.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for model in VECTORS:
+            table = model._meta.db_table
+            columns = ', '.join(quote(model._meta.get_field(name).column) for name, _ in VECTORS[model])
+            cursor.execute(f"""
+                CREATE OR REPLACE FUNCTION {table}_search_vector() RETURNS trigger AS $$
+                BEGIN
+                    NEW.search_vector := {_vector_sql(model, 'NEW.')};
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql""")
+            cursor.execute(f"DROP TRIGGER IF EXISTS {table}_search_vector ON {quote(table)}")
+            cursor.execute(f"""
+                CREATE TRIGGER {table}_search_vector
+                BEFORE INSERT OR UPDATE OF {columns} ON {quote(table)}
+                FOR EACH ROW EXECUTE FUNCTION {table}_search_vector()""")
+            cursor.execute(
+                f"UPDATE {quote(table)} SET search_vector = {_vector_sql(model, '')} "
+                f"WHERE search_vector IS NULL")
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_search_idx "
+                f"ON {quote(table)} USING gin (search_vector)")
+
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for model, names in TRIGRAM_COLUMNS.items():
+            table = model._meta.db_table
+            for name in names:
+                column = model._meta.get_field(name).column
+                # upper(): what Django's icontains compares on Postgres.
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {table}_{column}_trgm "
+                    f"ON {quote(table)} USING gin (upper({quote(column)}) gin_trgm_ops)")
+
+
+def _text_filter(queryset, term, fields):
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__icontains': term})
+    return queryset.filter(condition)
+
+
+def _query(term):
+    return SearchQuery(term, config=CONFIG, search_type='websearch')
+
+
+def _ranked(queryset, term, condition=Q()):
+    """Rows matching ``term`` or ``condition``, best text match first."""
+    query = _query(term)
+    return (queryset.filter(condition | Q(search_vector=query))
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank'))
+
+
+def _matching_users(term):
+    return _text_filter(User.objects.all(), term, NAME_LOOKUPS).values('pk')
+
+
+def search_customers(queryset, term):
+    """Customers by notes and interest, or by name, username or email."""
+    if not uses_postgres(queryset.db):
+        return _text_filter(queryset, term, ['interest', 'custnotes'] + [
+            f'user__{lookup}' for lookup in NAME_LOOKUPS])
+    # Each side is an index scan on its own table; an OR across the join
+    # could use neither index.
+    return queryset.filter(Q(user__in=_matching_users(term)) | Q(search_vector=_query(term)))
+
+
+def search_appointments(queryset, term):
+    """
+    Appointments by key points and follow-up notes, best match first, or
+    by their customer's name, username or email.
+    """
+    if not uses_postgres(queryset.db):
+        return _text_filter(queryset, term, ['kp_notes', 'fu_notes'] + [
+            f'customer__user__{lookup}' for lookup in NAME_LOOKUPS])
+    # As for customers: the user side is its own trigram index scan.
+    return _ranked(queryset, term, Q(customer__user__in=_matching_users(term)))
+
+
+def search_messages(queryset, term):
+    """Contact messages by name, subject and text, or by sender address."""
+    if not uses_postgres(queryset.db):
+        return _text_filter(queryset, term, ['name', 'email', 'subject', 'message'])
+    return queryset.filter(Q(search_vector=_query(term)) | Q(email__icontains=term))
+
+
+def global_search(term, limit=20):
+    """The first ``limit`` matches of each kind, for the managers' search box."""
+    return {
+        'customers': list(search_customers(
+            CustomerProfile.objects.select_related('user'), term)[:limit]),
+        'appointments': list(search_appointments(
+            Appointment.objects.select_related('customer__user'), term)[:limit]),
+        'messages': list(search_messages(Contact.objects.all(), term)[:limit]),
+    }
@@ -0,0 +1,95 @@
+# a_main/signals.py
+from django.contrib.auth.models import User, Group
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils.timezone import now
+
+from . import roles, rollups
+from .content import forget_cached_content
+from .context_processors import forget_header_cards
+from .models import Appointment, Contact, Content, ContentMedia, CustomerProfile
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles_on_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        # user.groups.add/remove/clear
+        roles.invalidate(instance.pk)
+    elif action == 'pre_clear':
+        # group.user_set.clear()
+        roles.invalidate(*instance.user_set.values_list('pk', flat=True))
+    elif pk_set:
+        # group.user_set.add/remove
+        roles.invalidate(*pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_roles_on_group_change(sender, instance, **kwargs):
+    roles.forget_group_ids()
+    if instance.pk:
+        roles.invalidate(*instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+def forget_cached_content_on_change(sender, instance, **kwargs):
+    forget_header_cards()
+    forget_cached_content()
+
+
+@receiver(post_save, sender=ContentMedia)
+@receiver(post_delete, sender=ContentMedia)
+def touch_content_on_media_change(sender, instance, raw=False, **kwargs):
+    # Media has no updated_at of its own; bump the parent's so everything
+    # versioned on Content.updated_at sees the change.
+    if not raw:
+        Content.objects.filter(pk=instance.content_id).update(updated_at=now())
+    forget_header_cards()
+    forget_cached_content()
+
+
+# Rollups: flag the days a write touches; refresh_rollups recomputes them.
+
+def _moves_date(update_fields):
+    return update_fields is None or 'date' in update_fields
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_appointment_rollup_days(sender, instance, raw=False, update_fields=None, **kwargs):
+    # New appointments too: one earlier than the customer's first moves
+    # the first appointment off its old day.
+    if not raw and _moves_date(update_fields):
+        instance._rollup_days = rollups.appointment_days(instance.customer_id, instance.pk)
+
+
+@receiver(post_save, sender=Appointment)
+def flag_appointment_rollup_days(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    moments = [instance.date, *getattr(instance, '_rollup_days', ())]
+    if created or _moves_date(update_fields):
+        # The customer's first appointment may have changed.
+        moments.append(rollups.appointment_days(instance.customer_id)[0])
+    rollups.mark_dirty_at(*moments)
+
+
+@receiver(post_delete, sender=Appointment)
+def flag_deleted_appointment_rollup_days(sender, instance, **kwargs):
+    rollups.mark_dirty_at(instance.date, rollups.appointment_days(instance.customer_id)[0])
+
+
+@receiver(post_save, sender=Contact)
+@receiver(post_delete, sender=Contact)
+def flag_contact_rollup_day(sender, instance, created=True, raw=False, **kwargs):
+    if created and not raw:
+        rollups.mark_dirty_at(instance.when_sent)
+
+
+@receiver(post_save, sender=CustomerProfile)
+@receiver(post_delete, sender=CustomerProfile)
+def flag_customer_rollup_day(sender, instance, created=True, raw=False, **kwargs):
+    if created and not raw:
+        rollups.mark_dirty_at(instance.first_contact)
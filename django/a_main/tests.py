@@ -0,0 +1,1530 @@
+import base64
+import csv
+import io
+import json
+import marshal
+import re
+import time
+from datetime import datetime, timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.sessions.models import Session
+from django.db import connection, connections, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.functional import empty
+from django.utils.timezone import localdate, make_aware, now
+
+from .benchmarks import routes, startup
+from .content import build_content_elements, content_version, load_content
+from .emails import EmailRenderer, inline_css, parse_inline_rules
+from .exports import EXPORTS
+from .instrumentation import histograms, timed, track_request
+from .lazy import lazy_import
+from .pagination import EstimatedCountPaginator, decode_cursor, encode_cursor, estimated_count
+from .microsoft_graph import MicrosoftGraphEmailSender
+from .middleware import ReplicaMiddleware
+from . import roles
+from .forms import ContactForm
+from .models import (
+    Appointment, AppointmentReminder, Campaign, CampaignMessage, Contact, Content,
+    ContentMedia, CustomerProfile, DailyRollup, MagicLinkToken)
+from . import campaigns, reminders, rollups, search, views
+from .profiling import SamplingProfiler
+from .ratelimit import SlidingWindowLimiter, client_ip, limiter
+from .roles import CUSTOMERS_GROUP, MANAGERS_GROUP, get_roles
+from .utils import send_contact_email
+from .warmup import template_names, warm_templates
+
+
+def make_content(content_type, count, media_per_item=1, **kwargs):
+    items = []
+    for i in range(count):
+        content = Content.objects.create(
+            title=f"{content_type.title()} {i}",
+            description=f"Description {i}",
+            content_type=content_type,
+            order=count - i,
+            **kwargs
+        )
+        # bulk_create: the files do not exist, so skip thumbnail generation.
+        ContentMedia.objects.bulk_create([
+            ContentMedia(content=content, file=f"{content_type.lower()}/{i}-{m}.jpg", order=m)
+            for m in range(media_per_item)
+        ])
+        items.append(content)
+    return items
+
+
+class ContentLoaderTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_content('CARD', 5, media_per_item=2)
+        make_content('BANNER', 3)
+        make_content('ABOUT', 4, media_per_item=3)
+        make_content('CARD', 2, enabled=False)
+
+    def test_two_queries_regardless_of_types(self):
+        with self.assertNumQueries(2):
+            loaded = load_content('CARD', 'BANNER', 'ABOUT', 'FAQ')
+        self.assertEqual(len(loaded['CARD']), 5)
+        self.assertEqual(len(loaded['BANNER']), 3)
+        self.assertEqual(len(loaded['ABOUT']), 4)
+        self.assertEqual(loaded['FAQ'], [])
+
+    def test_disabled_content_is_skipped(self):
+        loaded = load_content('CARD')
+        self.assertTrue(all(
+            Content.objects.get(pk=item.id).enabled for item in loaded['CARD']
+        ))
+
+    def test_content_and_media_are_ordered(self):
+        cards = load_content('CARD')['CARD']
+        self.assertEqual([card.order for card in cards], [1, 2, 3, 4, 5])
+        for card in cards:
+            self.assertEqual(card.image_url, card.media[0].url)
+            self.assertTrue(card.media[0].url.endswith('-0.jpg'))
+
+    def test_content_elements_alternate_alignment(self):
+        elements = build_content_elements(load_content('ABOUT')['ABOUT'])
+        images = [e for e in elements if e['type'] == 'image']
+        self.assertEqual(len(images), 12)
+        self.assertEqual(
+            [e['alignment'] for e in images[:3]], ['left', 'right', 'left'])
+        self.assertEqual(
+            len([e for e in elements if e['type'] == 'text']), 4)
+
+
+class PublicPageQueryCountTests(TestCase):
+    """
+    Pin the number of queries each public page runs for an anonymous
+    visitor.  A change here means a page started doing per-row lookups.
+    Counts are with the header menu fragment and content version already
+    cached.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for content_type, _ in Content.CONTENT_TYPES:
+            make_content(content_type, 6, media_per_item=2)
+
+    def setUp(self):
+        cache.clear()
+        self.client.get(reverse('sent'))
+        content_version()
+
+    def assertPageQueries(self, url_name, num):
+        url = reverse(url_name)
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_index(self):
+        # cards + banners (2)
+        response = self.assertPageQueries('index', 2)
+        self.assertEqual(len(response.context['cards']), 6)
+        self.assertEqual(len(response.context['banners']), 6)
+
+    def test_content_pages(self):
+        # content and media (2)
+        for url_name in ('about', 'faq', 'terms', 'privacy'):
+            with self.subTest(url_name=url_name):
+                self.assertPageQueries(url_name, 2)
+
+    def test_contact(self):
+        self.assertPageQueries('contact', 0)
+
+    def test_login(self):
+        self.assertPageQueries('login', 0)
+
+    def test_sent(self):
+        self.assertPageQueries('sent', 0)
+
+    def test_no_permissions(self):
+        self.assertPageQueries('no-permissions', 0)
+
+    def test_query_count_independent_of_content_volume(self):
+        make_content('CARD', 20, media_per_item=3)
+        make_content('FAQ', 20, media_per_item=3)
+        self.client.get(reverse('sent'))  # re-cache the invalidated menu
+        content_version()
+        self.assertPageQueries('index', 2)
+        self.assertPageQueries('faq', 2)
+
+    def test_header_menu_cached_until_content_changes(self):
+        cache.clear()
+        self.assertPageQueries('sent', 1)
+        response = self.assertPageQueries('sent', 0)
+        self.assertContains(response, 'Card 0')
+
+        Content.objects.filter(content_type='CARD').first().delete()
+        self.assertPageQueries('sent', 1)
+        Content.objects.create(title='New Card', content_type='CARD', order=0)
+        response = self.assertPageQueries('sent', 1)
+        self.assertContains(response, 'New Card')
+
+class BenchmarkHarnessTests(TestCase):
+
+    def test_every_route_has_a_spec(self):
+        self.assertEqual(
+            set(routes.a_main_route_names()) - set(routes.ROUTE_SPECS), set())
+
+    def test_compare_flags_regressions(self):
+        baseline = {'index|anonymous': {
+            'status': 200, 'queries': 2, 'p95_ms': 10.0}}
+        ok = {'index|anonymous': {'status': 200, 'queries': 2, 'p95_ms': 15.0}}
+        slower = {'index|anonymous': {'status': 200, 'queries': 2, 'p95_ms': 16.0}}
+        more_queries = {'index|anonymous': {
+            'status': 200, 'queries': 3, 'p95_ms': 10.0}}
+        self.assertEqual(routes.compare(ok, baseline), [])
+        self.assertEqual(len(routes.compare(slower, baseline)), 1)
+        self.assertEqual(len(routes.compare(more_queries, baseline)), 1)
+
+    def test_server_errors_always_fail(self):
+        failing = {'index|anonymous': {'status': 500, 'queries': 2, 'p95_ms': 10.0}}
+        self.assertEqual(routes.compare(failing, {}), ['index|anonymous: server error 500'])
+        self.assertEqual(len(routes.compare(failing, {'index|anonymous': failing['index|anonymous']})), 1)
+
+    def test_send_fail_page_renders(self):
+        self.assertEqual(self.client.get(reverse('send-fail')).status_code, 200)
+
+    def test_rounds_keep_the_median_timing(self):
+        rounds = [{'status': 200, 'queries': 2, 'cold_queries': 3, 'db_ms': 1.0,
+                   'render_ms': 1.0, 'p50_ms': 5.0, 'p95_ms': p95}
+                  for p95 in (6.0, 40.0, 7.0)]
+        combined = routes.combine_rounds(rounds)
+        self.assertEqual(combined['p95_ms'], 7.0)
+        self.assertEqual(combined['cold_queries'], 3)
+
+
+class PerformanceMiddlewareTests(TestCase):
+
+    def setUp(self):
+        histograms.reset()
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('faq'))
+        header = response['Server-Timing']
+        self.assertIn('db;dur=', header)
+        self.assertRegex(header, r'desc="\d+ queries"')
+        self.assertIn('render;dur=', header)
+        self.assertIn('total;dur=', header)
+
+    @override_settings(PERFORMANCE_SERVER_TIMING=False)
+    def test_server_timing_can_be_turned_off(self):
+        response = self.client.get(reverse('faq'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(histograms.snapshot()[('duration', 'faq')][1], 1)
+
+    def test_outbound_time_is_attributed(self):
+        with track_request() as timings:
+            with timed('graph'):
+                pass
+            with timed('graph'):
+                pass
+        self.assertIn('graph', timings.outbound)
+        # Outside a request timed() is a harmless no-op.
+        with timed('stripe'):
+            pass
+
+    def test_histograms_exported_per_url_name(self):
+        self.client.get(reverse('faq'))
+        self.client.get(reverse('faq'))
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('performance-metrics'))
+        body = response.content.decode()
+        self.assertIn(
+            'django_request_duration_ms_count{url_name="faq"} 2', body)
+        self.assertIn('le="+Inf"', body)
+
+    def test_metrics_require_superuser_or_token(self):
+        self.assertEqual(
+            self.client.get(reverse('performance-metrics')).status_code, 403)
+        with self.settings(METRICS_TOKEN='secret'):
+            response = self.client.get(
+                reverse('performance-metrics'),
+                HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+
+class ProfilerMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'pw')
+        cls.user = User.objects.create_user('user', 'user@example.com', 'pw')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_ignored_for_non_superusers(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('faq') + '?_profile=1')
+        self.assertNotIn('X-Profile-Status', response)
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+
+    def test_sampling_profile_download(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('faq'), HTTP_X_PROFILE='sample')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['X-Profile-Status'].startswith('profiled'))
+        self.assertIn('.collapsed', response['Content-Disposition'])
+
+    def test_cprofile_download(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('faq') + '?_profile=cprofile')
+        stats = marshal.loads(response.content)
+        self.assertTrue(stats)
+
+    def test_rate_limited(self):
+        self.client.force_login(self.admin)
+        with self.settings(PROFILER_RATE_LIMIT=(1, 60)):
+            first = self.client.get(reverse('faq') + '?_profile=1')
+            with self.assertLogs('a_main.performance', 'WARNING'):
+                second = self.client.get(reverse('faq') + '?_profile=1')
+        self.assertTrue(first['X-Profile-Status'].startswith('profiled'))
+        self.assertEqual(second['X-Profile-Status'], 'rate-limited')
+        self.assertContains(second, 'Frequently Asked Questions')
+
+
+class SamplingProfilerTests(TestCase):
+
+    def test_collapsed_stacks(self):
+        def busy():
+            end = time.perf_counter() + 0.05
+            while time.perf_counter() < end:
+                pass
+
+        with SamplingProfiler(interval=0.001) as profiler:
+            busy()
+        collapsed = profiler.collapsed()
+        self.assertIn('tests:busy:', collapsed)
+        stack, count = collapsed.splitlines()[0].rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+
+
+class RoleResolutionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.managers = Group.objects.create(name=MANAGERS_GROUP)
+        cls.customers = Group.objects.create(name=CUSTOMERS_GROUP)
+        cls.manager = User.objects.create_user('manager', password='pw')
+        cls.manager.groups.add(cls.managers)
+
+    def setUp(self):
+        cache.clear()
+
+    def request_as(self, user, session):
+        # As AuthenticationMiddleware loads it: through the backend.
+        request = RequestFactory().get('/')
+        request.user = roles.RoleVersionBackend().get_user(user.pk)
+        request.session = session
+        return request
+
+    def test_repeated_checks_are_free(self):
+        request = self.request_as(self.manager, {})
+        with self.assertNumQueries(1):
+            roles = get_roles(request)
+        with self.assertNumQueries(0):
+            self.assertTrue(get_roles(request).is_manager)
+            self.assertFalse(get_roles(request).is_customer)
+        self.assertTrue(roles.is_manager_or_superuser)
+
+    def test_session_cache_survives_requests(self):
+        session = {}
+        for expected_queries in (1, 0, 0):
+            request = self.request_as(self.manager, session)
+            with self.assertNumQueries(expected_queries):
+                self.assertTrue(get_roles(request).is_manager)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'django_cache'}})
+    def test_session_cache_needs_no_cache_queries(self):
+        # Production's cache is a table; role checks must not read it.
+        call_command('createcachetable', verbosity=0)
+        session = {}
+        get_roles(self.request_as(self.manager, session))
+        request = self.request_as(self.manager, session)
+        with self.assertNumQueries(0):
+            self.assertTrue(get_roles(request).is_manager)
+
+    def test_membership_change_invalidates_session_cache(self):
+        session = {}
+        self.assertFalse(get_roles(self.request_as(self.manager, session)).is_customer)
+
+        self.customers.user_set.add(self.manager)
+        self.assertTrue(get_roles(self.request_as(self.manager, session)).is_customer)
+
+        self.manager.groups.clear()
+        self.assertFalse(get_roles(self.request_as(self.manager, session)).is_manager)
+
+    def test_manager_page_checks_groups_once(self):
+        self.client.force_login(self.manager)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('managers'))
+        self.assertEqual(response.status_code, 200)
+        group_queries = [q for q in queries if 'auth_group' in q['sql']]
+        self.assertEqual(len(group_queries), 1)
+        self.assertTrue(response.context['is_manager_or_superuser'])
+
+    def test_login_redirects_by_role(self):
+        response = self.client.post(
+            reverse('login'), {'username': 'manager', 'password': 'pw'})
+        self.assertRedirects(response, reverse('managers'))
+
+    def test_legacy_customers_are_merged(self):
+        legacy = Group.objects.create(name='Customers')
+        old, both = User.objects.create_user('old'), User.objects.create_user('both')
+        legacy.user_set.add(old, both)
+        self.customers.user_set.add(both)
+        session = {}
+        self.assertFalse(get_roles(self.request_as(old, session)).is_customer)
+
+        out = StringIO()
+        call_command('merge_legacy_groups', stdout=out)
+        self.assertIn("Moved 2 users from 'Customers'", out.getvalue())
+        self.assertFalse(Group.objects.filter(name='Customers').exists())
+        self.assertEqual(set(self.customers.user_set.all()), {old, both})
+        self.assertTrue(get_roles(self.request_as(old, session)).is_customer)
+        call_command('merge_legacy_groups', stdout=StringIO())
+
+    def test_sessions_from_the_model_backend_stay_logged_in(self):
+        self.client.force_login(self.manager, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get(reverse('managers')).status_code, 200)
+
+
+class ContactSubmissionTests(TestCase):
+
+    def setUp(self):
+        roles.forget_group_ids()
+        self.group_id = roles.group_id(CUSTOMERS_GROUP)
+        patcher = mock.patch('a_main.forms.send_contact_email')
+        self.send_contact_email = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self, email='jane@example.com', name='Jane Q Public'):
+        form = ContactForm(data={
+            'name': name, 'email': email,
+            'subject': '[Coaching]', 'message': 'Hello',
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.save()
+
+    def test_fixed_query_count(self):
+        # contact + rollup flag + user + profile + membership, in one savepoint
+        for email in ('new@example.com', 'new@example.com', 'other@example.com'):
+            with self.subTest(email=email), self.assertNumQueries(7):
+                self.submit(email=email)
+
+    def test_creates_customer(self):
+        self.submit()
+        user = User.objects.get(username='jane@example.com')
+        self.assertEqual((user.first_name, user.last_name), ('Jane', 'Q Public'))
+        self.assertTrue(user.groups.filter(name=CUSTOMERS_GROUP).exists())
+        self.assertEqual(user.profile.interest, '[Coaching]')
+
+    def test_repeat_contact_updates_recent_contact_only(self):
+        self.submit()
+        profile = CustomerProfile.objects.get(user__username='jane@example.com')
+        self.submit(name='Someone Else')
+        updated = CustomerProfile.objects.get(pk=profile.pk)
+        self.assertGreater(updated.recent_contact, profile.recent_contact)
+        self.assertEqual(updated.user.first_name, 'Jane')
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(Contact.objects.count(), 2)
+
+    def test_email_sent_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.submit()
+            self.send_contact_email.assert_not_called()
+        for callback in callbacks:
+            callback()
+        self.send_contact_email.assert_called_once()
+
+    def test_roles_invalidated_only_for_new_members_who_logged_in(self):
+        manager = User.objects.create_user('manager@example.com', 'manager@example.com',
+                                           last_login=now())
+        for email, invalidated in (('jane@example.com', False), ('jane@example.com', False),
+                                   ('manager@example.com', True),
+                                   ('manager@example.com', False)):
+            with self.subTest(email=email), mock.patch.object(roles, 'invalidate') as invalidate:
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.submit(email=email)
+                self.assertEqual(invalidate.called, invalidated)
+        self.assertTrue(manager.groups.filter(name=CUSTOMERS_GROUP).exists())
+
+
+class ContactSubmissionCommitTests(TransactionTestCase):
+
+    @mock.patch('a_main.forms.send_contact_email')
+    def test_stale_group_id_is_recovered(self, send_contact_email):
+        # Foreign keys are checked at COMMIT, so this needs real commits.
+        roles.forget_group_ids()
+        group_id = roles.group_id(CUSTOMERS_GROUP)
+        roles._group_ids[CUSTOMERS_GROUP] = group_id + 1000
+        form = ContactForm(data={
+            'name': 'Jane', 'email': 'jane@example.com',
+            'subject': '[Coaching]', 'message': 'Hello',
+        })
+        self.assertTrue(form.is_valid())
+        form.save()
+        self.assertEqual(roles.group_id(CUSTOMERS_GROUP), group_id)
+        self.assertEqual(Contact.objects.count(), 1)
+        send_contact_email.assert_called_once()
+
+
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        limiter.reset()
+        self.addCleanup(limiter.reset)
+        roles.forget_group_ids()
+        patcher = mock.patch('a_main.forms.send_contact_email')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def contact(self, email='jane@example.com', address='198.51.100.7', **extra):
+        return self.client.post(reverse('contact'), {
+            'name': 'Jane Q Public', 'email': email,
+            'subject': '[Coaching]', 'message': 'Hello', **extra,
+        }, REMOTE_ADDR=address)
+
+    def test_sliding_window_counts_previous_window(self):
+        local = SlidingWindowLimiter()
+        with mock.patch('a_main.ratelimit.time.time', return_value=1000.0):
+            for _ in range(4):
+                self.assertTrue(local.hit('k', limit=4, window=100))
+        # Halfway into the next window half of the old hits still count.
+        with mock.patch('a_main.ratelimit.time.time', return_value=1150.0):
+            self.assertTrue(local.hit('k', limit=4, window=100))
+            self.assertTrue(local.hit('k', limit=4, window=100))
+            self.assertFalse(local.hit('k', limit=4, window=100))
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'django_cache'}})
+    def test_database_cache_pays_for_one_write_per_hit(self):
+        call_command('createcachetable', verbosity=0)
+        # Real time: the cache's expiry comes from the same clock.
+        local = SlidingWindowLimiter()
+        self.assertTrue(local.hit('k', limit=3, window=3600))
+        # get_many, then incr's read and write; no failed add first.
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(local.hit('k', limit=3, window=3600))
+        self.assertFalse([q for q in queries if q['sql'].startswith('INSERT')])
+        self.assertTrue(local.hit('k', limit=3, window=3600))
+        self.assertFalse(local.hit('k', limit=3, window=3600))
+
+    def test_blocked_key_skips_cache(self):
+        local = SlidingWindowLimiter()
+        self.assertTrue(local.hit('k', limit=1, window=60))
+        self.assertFalse(local.hit('k', limit=1, window=60))
+        with mock.patch.object(cache, 'get_many') as get_many:
+            self.assertFalse(local.hit('k', limit=1, window=60))
+        get_many.assert_not_called()
+
+    def test_contact_limited_per_ip_before_any_query(self):
+        for i in range(5):
+            self.assertEqual(self.contact(email=f"v{i}@example.com").status_code, 302)
+        with self.assertNumQueries(0):
+            response = self.contact(email='v6@example.com')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        # Another visitor is unaffected.
+        self.assertEqual(self.contact(address='198.51.100.8').status_code, 302)
+
+    def test_contact_limited_per_email(self):
+        for i in range(3):
+            self.assertEqual(self.contact(address=f"198.51.100.{i}").status_code, 302)
+        self.assertEqual(self.contact(address='198.51.100.9').status_code, 429)
+
+    def test_honeypot_looks_like_success_and_blocks_ip(self):
+        with self.assertNumQueries(0):
+            response = self.contact(website='http://spam.example.net')
+        self.assertRedirects(response, reverse('sent'), fetch_redirect_response=False)
+        self.assertFalse(Contact.objects.exists())
+        self.assertEqual(self.contact(email='real@example.com').status_code, 429)
+
+    @override_settings(RATELIMIT_ENABLED=False)
+    def test_honeypot_applies_with_rate_limits_off(self):
+        response = self.contact(website='http://spam.example.net')
+        self.assertRedirects(response, reverse('sent'), fetch_redirect_response=False)
+        self.assertFalse(Contact.objects.exists())
+        self.assertEqual(self.contact(email='real@example.com').status_code, 302)
+
+    def test_honeypot_without_client_address_counts_nothing(self):
+        with mock.patch.object(limiter, 'hit') as hit, mock.patch.object(limiter, 'block') as block:
+            response = self.contact(address='', website='http://spam.example.net')
+        self.assertEqual(response.status_code, 302)
+        hit.assert_not_called()
+        block.assert_not_called()
+
+    def test_login_limited_per_username(self):
+        for i in range(10):
+            self.client.post(reverse('login'), {'username': 'jane', 'password': 'x'},
+                             REMOTE_ADDR=f"198.51.100.{i}")
+        response = self.client.post(reverse('login'), {'username': 'JANE', 'password': 'x'},
+                                    REMOTE_ADDR='198.51.100.99')
+        self.assertEqual(response.status_code, 429)
+
+    def test_client_ip_trusts_configured_proxy_hops(self):
+        request = RequestFactory().get(
+            '/', REMOTE_ADDR='127.0.0.1',
+            HTTP_X_FORWARDED_FOR='6.6.6.6, 198.51.100.7')
+        self.assertEqual(client_ip(request), '127.0.0.1')
+        with self.settings(RATELIMIT_PROXY_HOPS=1):
+            self.assertEqual(client_ip(request), '198.51.100.7')
+
+
+class EmailRenderingTests(TestCase):
+
+    def setUp(self):
+        self.renderer = EmailRenderer()
+        self.context = {
+            'name': "Jane <O'Brien>", 'email': 'jane@example.com',
+            'interest': '[Coaching]', 'message': 'Line one\nLine two',
+        }
+
+    def test_renders_html_and_text_parts(self):
+        body = self.renderer.render('a_main/contact/contact_host', self.context)
+        self.assertIn('Jane &lt;O&#x27;Brien&gt; has reached out', body.html)
+        self.assertIn('Line one<br>Line two', body.html)
+        self.assertIn('Your-Voyage.life All rights reserved', body.html)
+        self.assertTrue(body.text.startswith("Jane <O'Brien> has reached out"))
+        self.assertIn('Line one\nLine two', body.text)
+        self.assertNotIn('<', body.text.replace("<O'Brien>", ''))
+
+    def test_css_is_inlined_and_inline_block_dropped(self):
+        body = self.renderer.render('a_main/contact/contact_user', self.context)
+        self.assertNotIn('data-inline', body.html)
+        self.assertIn('<h1 class="em_h1" style="margin:0 0 20px 0;', body.html)
+        self.assertIn('<body class="em_body" style="margin:0;', body.html)
+        # Media queries cannot be inlined and stay in the head.
+        self.assertIn('@media', body.html)
+
+    def test_layout_and_templates_built_once(self):
+        self.renderer.render('a_main/contact/contact_user', self.context)
+        with mock.patch('a_main.emails.loader.get_template') as get_template:
+            body = self.renderer.render('a_main/contact/contact_user', {'name': 'Sam', 'interest': 'x'})
+        get_template.assert_not_called()
+        self.assertIn('Hello Sam,', body.html)
+
+    def test_inline_css_merges_with_existing_style(self):
+        rules = parse_inline_rules('.a { color: red; } .b, .c { margin: 0 }')
+        self.assertEqual(rules, {'a': 'color: red', 'b': 'margin: 0', 'c': 'margin: 0'})
+        self.assertEqual(
+            inline_css('<p class="a b" style="color: blue">x</p><br class="c"/>', rules),
+            '<p class="a b" style="color: red; margin: 0; color: blue">x</p>'
+            '<br class="c" style="margin: 0"/>')
+
+    def test_contact_email_sends_both_parts(self):
+        contact = Contact(name='Jane', email='jane@example.com',
+                          subject='[Coaching]', message='Hello there')
+        context = SimpleNamespace(instance=contact, name='Jane',
+                                  email='jane@example.com', interest='[Coaching]')
+        with mock.patch.object(MicrosoftGraphEmailSender, 'send_email',
+                               return_value=True) as send_email:
+            send_contact_email(context)
+        self.assertEqual(send_email.call_count, 2)
+        for call in send_email.call_args_list:
+            self.assertIn('<html', call.kwargs['message'])
+            self.assertIn('Jane', call.kwargs['text_message'])
+
+    def test_graph_sender_uploads_multipart_mime(self):
+        sender = MicrosoftGraphEmailSender()
+        with mock.patch.object(sender, '_acquire_token', return_value='token'), \
+                mock.patch('a_main.microsoft_graph.requests.post') as post:
+            post.return_value.ok = True
+            self.assertTrue(sender.send_email(
+                to_email='jane@example.com', subject='Hi', message='<p>Hi</p>',
+                text_message='Hi', is_html=True, bcc_recipients=['host@example.com']))
+        kwargs = post.call_args.kwargs
+        self.assertEqual(kwargs['headers']['Content-Type'], 'text/plain')
+        mime = base64.b64decode(kwargs['data']).decode()
+        self.assertIn('multipart/alternative', mime)
+        self.assertIn('Content-Type: text/html', mime)
+        self.assertIn('Bcc: host@example.com', mime)
+
+
+class TemplateWarmupTests(TestCase):
+
+    def test_compiles_every_app_template(self):
+        names = list(template_names('a_main'))
+        self.assertIn('header.html', names)
+        self.assertIn('a_main/contact/contact_user.txt', names)
+        self.assertEqual(warm_templates(('a_main',)), len(names))
+
+
+class MagicLinkTokenTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('jane', 'jane@example.com')
+        cls.profile = CustomerProfile.objects.create(user=cls.user, interest='x')
+
+    def setUp(self):
+        cache.clear()
+        limiter.reset()
+
+    def test_only_hash_is_stored(self):
+        token = self.profile.generate_magic_link()
+        stored = MagicLinkToken.objects.get()
+        self.assertNotEqual(stored.token_hash, token)
+        self.assertFalse(MagicLinkToken.objects.filter(token_hash__contains=token).exists())
+        self.assertTrue(stored.is_active)
+
+    def test_consume_is_single_query_and_single_use(self):
+        token = self.profile.generate_magic_link()
+        with self.assertNumQueries(1):
+            self.assertEqual(MagicLinkToken.objects.consume(token), self.user.pk)
+        self.assertIsNone(MagicLinkToken.objects.consume(token))
+        self.assertIsNotNone(MagicLinkToken.objects.get().used_at)
+
+    def test_expired_and_unknown_tokens_rejected(self):
+        token = MagicLinkToken.objects.issue(self.user.pk, lifetime=timedelta(seconds=-1))
+        self.assertIsNone(MagicLinkToken.objects.consume(token))
+        self.assertIsNone(MagicLinkToken.objects.consume('not-a-token'))
+
+    def test_several_links_per_user(self):
+        first = self.profile.generate_magic_link()
+        second = self.profile.generate_magic_link()
+        self.assertEqual(MagicLinkToken.objects.consume(first), self.user.pk)
+        self.assertEqual(MagicLinkToken.objects.consume(second), self.user.pk)
+
+    def test_login_view(self):
+        token = self.profile.generate_magic_link()
+        url = reverse('magic-login', kwargs={'token': token})
+        self.assertRedirects(self.client.get(url), reverse('users'),
+                             fetch_redirect_response=False)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.pk)
+        self.client.logout()
+        self.assertRedirects(self.client.get(url), reverse('login'),
+                             fetch_redirect_response=False)
+
+    def test_purge_removes_dead_tokens_only(self):
+        live = self.profile.generate_magic_link()
+        used = self.profile.generate_magic_link()
+        MagicLinkToken.objects.consume(used)
+        for _ in range(3):
+            MagicLinkToken.objects.issue(self.user.pk, lifetime=timedelta(seconds=-1))
+        out = StringIO()
+        call_command('purge_magic_links', batch_size=2, stdout=out)
+        self.assertIn('Purged 4', out.getvalue())
+        self.assertEqual(MagicLinkToken.objects.consume(live), self.user.pk)
+
+
+class CampaignTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        at = now()
+        cls.manager = User.objects.create_user('boss', 'boss@example.com', 'pw')
+        cls.manager.groups.add(Group.objects.get_or_create(name=MANAGERS_GROUP)[0])
+        cls.profiles = []
+        for i in range(6):
+            user = User.objects.create_user(
+                f'c{i}', f'c{i}@example.com',
+                last_login=at - timedelta(days=60 if i % 2 else 1))
+            cls.profiles.append(CustomerProfile.objects.create(
+                user=user, interest='x',
+                first_session=at + timedelta(days=3) if i < 2 else None))
+
+    def setUp(self):
+        roles.forget_group_ids()
+        self.sender = mock.Mock()
+        self.sender.send_email.return_value = True
+
+    def test_audiences(self):
+        self.assertEqual(campaigns.audience_sizes(), {
+            'ALL': 6, 'UPCOMING_FIRST_SESSION': 2, 'INACTIVE_30_DAYS': 3})
+
+    def test_create_only_queues(self):
+        # savepoint, recipients, campaign, messages, release
+        with self.assertNumQueries(5):
+            campaign = campaigns.create_campaign('MAGIC_LINK', 'ALL', self.manager)
+        self.assertEqual(campaign.total, 6)
+        self.assertEqual(campaign.messages.filter(status='PENDING').count(), 6)
+        self.assertFalse(MagicLinkToken.objects.exists())
+
+    def test_empty_audience_is_done_at_once(self):
+        Campaign.objects.all().delete()
+        CustomerProfile.objects.update(first_session=None)
+        campaign = campaigns.create_campaign('REMINDER', 'UPCOMING_FIRST_SESSION')
+        self.assertEqual((campaign.status, campaign.total), ('DONE', 0))
+
+    def test_batches_send_with_fixed_queries_and_track_progress(self):
+        campaign = campaigns.create_campaign('REMINDER', 'ALL', self.manager)
+        self.sender.send_email.side_effect = [True, False, True, True, True, True]
+
+        batch = campaigns.claim_batch(4)
+        self.assertEqual(len(batch), 4)
+        # The claimed rows are not handed out twice.
+        self.assertEqual(len(campaigns.claim_batch(4)), 2)
+        CampaignMessage.objects.filter(status='CLAIMED', pk__gt=batch[-1].pk).update(status='PENDING')
+
+        # status, tokens, bulk_update, counters, done check
+        with self.assertNumQueries(5):
+            campaigns.send_batch(batch, self.sender)
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.sent, campaign.failed), ('SENDING', 3, 1))
+        self.assertEqual(campaign.percent, 67)
+        self.assertEqual(MagicLinkToken.objects.count(), 4)
+
+        campaigns.send_batch(campaigns.claim_batch(4), self.sender)
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.sent, campaign.failed), ('DONE', 5, 1))
+        self.assertIsNotNone(campaign.finished_at)
+
+        # The emailed link logs the customer in.
+        text = self.sender.send_email.call_args.kwargs['text_message']
+        login_path = text.split('https://dyvlife.your-voyage.life')[1].split()[0]
+        response = self.client.get(login_path)
+        self.assertRedirects(response, reverse('users'), fetch_redirect_response=False)
+
+    def test_stale_claims_are_retried(self):
+        campaigns.create_campaign('MAGIC_LINK', 'ALL')
+        campaigns.claim_batch(10)
+        self.assertEqual(campaigns.claim_batch(10), [])
+        CampaignMessage.objects.update(claimed_at=now() - timedelta(hours=1))
+        self.assertEqual(len(campaigns.claim_batch(10)), 6)
+
+    def test_worker_command_drains_queue(self):
+        campaigns.create_campaign('MAGIC_LINK', 'INACTIVE_30_DAYS')
+        with mock.patch('a_main.management.commands.run_campaigns.MicrosoftGraphEmailSender',
+                        return_value=self.sender):
+            call_command('run_campaigns', once=True, batch_size=2)
+        self.assertEqual(self.sender.send_email.call_count, 3)
+        self.assertEqual(Campaign.objects.get().status, 'DONE')
+
+    def test_managers_page_queues_and_reports_progress(self):
+        self.client.force_login(self.manager)
+        response = self.client.post(reverse('campaign-create'),
+                                    {'kind': 'MAGIC_LINK', 'audience': 'ALL'})
+        self.assertRedirects(response, reverse('managers'), fetch_redirect_response=False)
+        campaign = Campaign.objects.get()
+        page = self.client.get(reverse('managers'))
+        self.assertContains(page, 'Queued 6 emails')
+        self.assertContains(page, 'All customers (6)')
+        progress = self.client.get(reverse('campaign-progress'), {'id': campaign.pk}).json()
+        self.assertEqual(progress['campaigns'][0]['total'], 6)
+        self.assertEqual(progress['campaigns'][0]['status'], 'QUEUED')
+
+
+class AppointmentReminderTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('rem', 'rem@example.com', first_name='Rem')
+        cls.customer = CustomerProfile.objects.create(user=user, interest='x')
+
+    def setUp(self):
+        self.at = now()
+        self.sender = mock.Mock()
+        self.sender.send_email.return_value = True
+
+    def book(self, **offset):
+        return Appointment.objects.create(customer=self.customer, date=self.at + timedelta(**offset))
+
+    def sent(self):
+        return set(AppointmentReminder.objects.values_list('appointment_id', 'kind'))
+
+    def test_each_window_gets_its_reminder_once(self):
+        tomorrow = self.book(hours=23)
+        soon = self.book(minutes=30)
+        self.book(days=3)
+        self.book(hours=-2)
+
+        self.assertEqual(reminders.send_due_reminders(sender=self.sender, at=self.at), 2)
+        # Booked at short notice: only the 1 hour reminder.
+        self.assertEqual(self.sent(), {(tomorrow.pk, '24H'), (soon.pk, '1H')})
+        text = self.sender.send_email.call_args_list[0].kwargs['text_message']
+        self.assertIn('your appointment tomorrow', text)
+
+        self.assertEqual(reminders.send_due_reminders(sender=self.sender, at=self.at), 0)
+        later = self.at + timedelta(hours=22, minutes=30)
+        self.assertEqual(reminders.send_due_reminders(sender=self.sender, at=later), 1)
+        self.assertIn((tomorrow.pk, '1H'), self.sent())
+
+    def test_queries_do_not_grow_with_batch(self):
+        self.book(hours=5)
+        with CaptureQueriesContext(connection) as one:
+            reminders.send_due_reminders(sender=self.sender, at=self.at)
+        for i in range(10):
+            self.book(hours=6, minutes=i)
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(reminders.send_due_reminders(sender=self.sender, at=self.at), 10)
+        self.assertEqual(len(one), len(many))
+
+    def test_failed_sends_are_retried(self):
+        appointment = self.book(minutes=20)
+        self.sender.send_email.side_effect = [Exception('down'), True]
+        self.assertEqual(reminders.send_due_reminders(sender=self.sender, at=self.at), 0)
+        self.assertFalse(AppointmentReminder.objects.exists())
+        self.assertEqual(reminders.send_due_reminders(sender=self.sender, at=self.at), 1)
+        self.assertEqual(self.sent(), {(appointment.pk, '1H')})
+
+    def test_scheduler_command(self):
+        for i in range(3):
+            self.book(hours=2 + i)
+        with mock.patch('a_main.management.commands.run_reminders.MicrosoftGraphEmailSender',
+                        return_value=self.sender):
+            call_command('run_reminders', once=True, batch_size=2)
+        self.assertEqual(self.sender.send_email.call_count, 3)
+
+
+class AppointmentStatusTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', is_staff=True)
+        customer = CustomerProfile.objects.create(
+            user=User.objects.create_user('cust', 'cust@example.com'), interest='x')
+        cls.appointments = [
+            Appointment.objects.create(customer=customer, date=now() - timedelta(days=7 * i))
+            for i in range(4)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def post(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def bulk(self, changes):
+        return self.post(reverse('appointment-bulk-update-status'), {'changes': changes})
+
+    def test_single_update_writes_only_that_field(self):
+        appointment = self.appointments[0]
+        url = reverse('appointment-update-status', kwargs={'pk': appointment.pk})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(url, {'field': 'paid', 'value': True})
+        self.assertEqual(response.json()['new_value'], True)
+        update = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "a_main_appointment"')]
+        self.assertEqual(len(update), 1)
+        self.assertNotIn('kp_notes', update[0])
+        appointment.refresh_from_db()
+        self.assertTrue(appointment.paid)
+        self.assertEqual(self.post(url, {'field': 'paid', 'value': 'yes'}).status_code, 400)
+
+    def test_permission_is_checked_before_lookup(self):
+        self.client.force_login(User.objects.create_user('plain'))
+        url = reverse('appointment-update-status', kwargs={'pk': 999999})
+        self.assertEqual(self.post(url, {'field': 'paid', 'value': True}).status_code, 403)
+        self.assertEqual(self.bulk([{'id': 1, 'field': 'paid', 'value': True}]).status_code, 403)
+
+    def test_bulk_update_groups_changes(self):
+        a, b, c, d = (appointment.pk for appointment in self.appointments)
+        changes = [
+            {'id': a, 'field': 'invoiced', 'value': True},
+            {'id': b, 'field': 'invoiced', 'value': True},
+            {'id': c, 'field': 'invoiced', 'value': True},
+            {'id': a, 'field': 'paid', 'value': True},
+            {'id': b, 'field': 'paid', 'value': True},
+            {'id': d, 'field': 'paid', 'value': False},
+            {'id': d, 'field': 'paid', 'value': True},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.bulk(changes)
+        self.assertEqual(response.json()['updated'], 4)
+        updates = [q for q in queries if q['sql'].startswith('UPDATE "a_main_appointment"')]
+        # invoiced=True and paid=True; d's second change replaced its first.
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(
+            set(Appointment.objects.values_list('pk', 'invoiced', 'paid')),
+            {(a, True, True), (b, True, True), (c, True, False), (d, False, True)})
+
+    def test_bulk_update_is_all_or_nothing(self):
+        pk = self.appointments[0].pk
+        response = self.bulk([{'id': pk, 'field': 'paid', 'value': True},
+                              {'id': pk, 'field': 'kp_notes', 'value': True}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Change 1', response.json()['message'])
+
+        response = self.bulk([{'id': pk, 'field': 'paid', 'value': True},
+                              {'id': 999999, 'field': 'paid', 'value': True}])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['missing'], [999999])
+        self.assertFalse(Appointment.objects.filter(paid=True).exists())
+
+
+class RollupTests(TestCase):
+
+    def setUp(self):
+        self.today = localdate()
+        self.noon = make_aware(datetime.combine(self.today, datetime.min.time())) + timedelta(hours=12)
+
+    def customer(self, name, **kwargs):
+        return CustomerProfile.objects.create(
+            user=User.objects.create_user(name), interest='x', **kwargs)
+
+    def rollup(self, day):
+        return DailyRollup.objects.values(*rollups.COUNT_FIELDS).get(day=day)
+
+    def test_writes_flag_days_and_refresh_recomputes_them(self):
+        alice = self.customer('alice', first_contact=self.noon)
+        bob = self.customer('bob', first_contact=self.noon - timedelta(days=3))
+        Contact.objects.create(name='A', email='a@example.com', subject='s', message='m',
+                               when_sent=self.noon)
+        Appointment.objects.create(customer=alice, date=self.noon, invoiced=True)
+        Appointment.objects.create(customer=bob, date=self.noon - timedelta(days=1))
+        Appointment.objects.create(customer=bob, date=self.noon + timedelta(hours=1),
+                                   invoiced=True, paid=True)
+
+        self.assertEqual(set(DailyRollup.objects.filter(dirty=True).values_list('day', flat=True)),
+                         {self.today, self.today - timedelta(days=1), self.today - timedelta(days=3)})
+        self.assertEqual(rollups.refresh(), 3)
+        self.assertFalse(DailyRollup.objects.filter(dirty=True).exists())
+        self.assertEqual(self.rollup(self.today), {
+            'appointments': 2, 'invoiced': 2, 'invoiced_unpaid': 1, 'contacts': 1,
+            'new_customers': 1, 'first_appointments': 1})
+
+        # Moving bob's first appointment changes two days' first appointments.
+        Appointment.objects.filter(customer=bob).order_by('date').first().delete()
+        rollups.refresh()
+        self.assertEqual(self.rollup(self.today)['first_appointments'], 2)
+        self.assertEqual(self.rollup(self.today - timedelta(days=1))['appointments'], 0)
+
+    def test_new_earlier_appointment_moves_the_first_appointment(self):
+        customer = self.customer('frank', first_contact=self.noon - timedelta(days=5))
+        Appointment.objects.create(customer=customer, date=self.noon)
+        rollups.refresh()
+        Appointment.objects.create(customer=customer, date=self.noon - timedelta(days=5))
+        self.assertTrue(DailyRollup.objects.get(day=self.today).dirty)
+        rollups.refresh()
+        self.assertEqual(self.rollup(self.today)['first_appointments'], 0)
+        self.assertEqual(self.rollup(self.today - timedelta(days=5))['first_appointments'], 1)
+
+    def test_bulk_status_update_flags_days(self):
+        appointment = Appointment.objects.create(
+            customer=self.customer('carol'), date=self.noon, invoiced=True)
+        rollups.refresh()
+        staff = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(staff)
+        self.client.post(reverse('appointment-bulk-update-status'), json.dumps(
+            {'changes': [{'id': appointment.pk, 'field': 'paid', 'value': True}]}),
+            content_type='application/json')
+        self.assertTrue(DailyRollup.objects.get(day=self.today).dirty)
+        rollups.refresh()
+        self.assertEqual(self.rollup(self.today)['invoiced_unpaid'], 0)
+
+    def test_rebuild_matches_incremental(self):
+        customer = self.customer('dave', first_contact=self.noon - timedelta(days=40))
+        for days in (40, 20, 2):
+            Appointment.objects.create(customer=customer, date=self.noon - timedelta(days=days))
+        rollups.refresh()
+        incremental = set(DailyRollup.objects.filter(appointments__gt=0).values_list(
+            'day', *rollups.COUNT_FIELDS))
+        DailyRollup.objects.all().delete()
+        self.assertEqual(rollups.rebuild(), 41)
+        self.assertEqual(set(DailyRollup.objects.filter(appointments__gt=0).values_list(
+            'day', *rollups.COUNT_FIELDS)), incremental)
+
+    def test_dashboard_reads_only_rollups(self):
+        customer = self.customer('erin', first_contact=self.noon)
+        Appointment.objects.bulk_create([
+            Appointment(customer=customer, date=self.noon - timedelta(days=i), invoiced=True)
+            for i in range(200)
+        ])
+        rollups.rebuild()
+        with self.assertNumQueries(2):
+            dashboard = rollups.dashboard(weeks=4)
+        self.assertEqual(len(dashboard['weeks']), 4)
+        self.assertEqual(dashboard['weeks'][1]['appointments'], 7)
+        self.assertEqual(dashboard['invoiced_unpaid'], 200)
+        self.assertEqual(dashboard['conversion'], 100.0)
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('boss')
+        cls.manager.groups.add(Group.objects.get_or_create(name=MANAGERS_GROUP)[0])
+        cls.superuser = User.objects.create_superuser('root', 'root@example.com', 'pw')
+        customer = CustomerProfile.objects.create(
+            user=User.objects.create_user('cust', 'cust@example.com', first_name='Cust'),
+            interest='=HYPERLINK("http://evil.example")')
+        Appointment.objects.bulk_create([
+            Appointment(customer=customer, date=now() - timedelta(days=i), paid=bool(i % 2))
+            for i in range(25)
+        ])
+
+    def setUp(self):
+        roles.forget_group_ids()
+
+    def read_csv(self, response):
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode()
+        return list(csv.reader(io.StringIO(content)))
+
+    def test_csv_streams_in_chunks_with_one_join(self):
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse('export', kwargs={'name': 'appointments'}))
+        self.assertIn('attachment; filename="appointments-', response['Content-Disposition'])
+        with mock.patch('a_main.exports.CHUNK_SIZE', 10), \
+                CaptureQueriesContext(connection) as queries:
+            rows = self.read_csv(response)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('JOIN "auth_user"', queries[0]['sql'])
+        self.assertEqual(rows[0], EXPORTS['appointments'].headers)
+        self.assertEqual(len(rows), 26)
+        self.assertEqual(rows[1][1:3], ['cust', 'cust@example.com'])
+
+    def test_formulas_are_neutralised(self):
+        self.client.force_login(self.manager)
+        rows = self.read_csv(self.client.get(reverse('export', kwargs={'name': 'customers'})))
+        self.assertEqual(rows[1][4], '\'=HYPERLINK("http://evil.example")')
+
+    def test_xlsx(self):
+        from openpyxl import load_workbook
+
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse('export', kwargs={'name': 'appointments'}),
+                                   {'format': 'xlsx'})
+        sheet = load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        self.assertEqual(sheet.max_row, 26)
+        self.assertEqual(sheet['B2'].value, 'cust')
+
+    def test_permissions_and_unknown_export(self):
+        self.client.force_login(User.objects.create_user('nobody'))
+        response = self.client.get(reverse('export', kwargs={'name': 'customers'}))
+        self.assertNotEqual(response.status_code, 200)
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse('export', kwargs={'name': 'users'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_admin_action_exports_selection(self):
+        self.client.force_login(self.superuser)
+        selected = list(Appointment.objects.filter(paid=True).values_list('pk', flat=True))
+        response = self.client.post(reverse('admin:a_main_appointment_changelist'), {
+            'action': 'export_csv', '_selected_action': selected})
+        rows = self.read_csv(response)
+        self.assertEqual(sorted(int(row[0]) for row in rows[1:]), sorted(selected))
+
+
+class AdminChangelistTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = User.objects.create_superuser('root', 'root@example.com', 'pw')
+
+    def setUp(self):
+        self.client.force_login(self.superuser)
+
+    def add_appointments(self, count):
+        for i in range(count):
+            customer = CustomerProfile.objects.create(
+                user=User.objects.create_user(f'admin-cust-{Appointment.objects.count()}'),
+                interest='x')
+            Appointment.objects.create(customer=customer, date=now() - timedelta(days=i))
+
+    def changelist_queries(self, model):
+        url = reverse(f'admin:a_main_{model}_changelist')
+        # Prime the session and role caches.
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for model in ('appointment', 'customerprofile', 'contentmedia', 'magiclinktoken'):
+            with self.subTest(model=model):
+                self.add_appointments(2)
+                make_content('CARD', 2)
+                MagicLinkToken.objects.issue(self.superuser.pk)
+                few = self.changelist_queries(model)
+                self.add_appointments(15)
+                make_content('CARD', 15)
+                for _ in range(15):
+                    MagicLinkToken.objects.issue(self.superuser.pk)
+                self.assertEqual(self.changelist_queries(model), few)
+
+    def test_previews_are_lazy_and_missing_sources_do_not_fail_saves(self):
+        content = make_content('CARD', 1, media_per_item=0)[0]
+        with self.assertLogs('a_main.models', 'WARNING'):
+            media = ContentMedia.objects.create(content=content, file='card/missing.jpg')
+        response = self.client.get(reverse('admin:a_main_contentmedia_changelist'))
+        self.assertContains(response, f'src="{media.thumbnail.url}" width="100" loading="lazy"')
+
+    def test_estimated_counts(self):
+        self.assertIsNone(estimated_count(Appointment.objects.all()))
+        self.add_appointments(3)
+        with mock.patch('a_main.pagination.estimated_count', return_value=50000):
+            self.assertEqual(EstimatedCountPaginator(Appointment.objects.all(), 10).count, 50000)
+        with mock.patch('a_main.pagination.estimated_count', return_value=500):
+            self.assertEqual(EstimatedCountPaginator(Appointment.objects.all(), 10).count, 3)
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('boss')
+        cls.manager.groups.add(Group.objects.get_or_create(name=MANAGERS_GROUP)[0])
+        cls.ann = CustomerProfile.objects.create(
+            user=User.objects.create_user('ann', 'ann@example.com', first_name='Ann'),
+            interest='Coaching', custnotes='Prefers mornings')
+        cls.bob = CustomerProfile.objects.create(
+            user=User.objects.create_user('bob', 'bob@example.com'), interest='Career')
+        Appointment.objects.create(customer=cls.bob, date=now(), kp_notes='Discussed mornings routine')
+        Contact.objects.create(name='Carl', email='carl@example.com', subject='Hello',
+                               message='Are mornings available?')
+
+    def setUp(self):
+        roles.forget_group_ids()
+
+    def test_fallback_matches_every_kind(self):
+        results = search.global_search('mornings')
+        self.assertEqual([c.pk for c in results['customers']], [self.ann.pk])
+        self.assertEqual(len(results['appointments']), 1)
+        self.assertEqual(len(results['messages']), 1)
+        self.assertEqual(search.global_search('bob@ex')['customers'], [self.bob])
+
+    def test_appointments_match_customer_names(self):
+        self.assertEqual(len(search.global_search('bob')['appointments']), 1)
+        # On Postgres the name match is a subquery next to the notes match.
+        with mock.patch.object(search, 'uses_postgres', return_value=True):
+            sql = str(search.search_appointments(Appointment.objects.all(), 'bob').query)
+        self.assertIn('IN (SELECT U0."id" FROM "auth_user" U0', sql)
+        self.assertIn('search_vector', sql)
+
+    def test_vector_sql(self):
+        self.assertEqual(
+            search._vector_sql(Appointment, 'NEW.'),
+            "setweight(to_tsvector('english', coalesce(NEW.kp_notes, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(NEW.fu_notes, '')), 'B')")
+        # Nothing to install outside Postgres.
+        with self.assertNumQueries(0):
+            search.install()
+
+    def test_search_page(self):
+        self.client.force_login(self.manager)
+        self.client.get(reverse('search'))
+        # session, user, then one query per kind
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('search'), {'q': 'mornings'})
+        self.assertContains(response, reverse('customers-update', args=[self.ann.pk]))
+        self.assertContains(response, 'Are mornings available?')
+        self.assertContains(self.client.get(reverse('managers')), f'action="{reverse("search")}"')
+
+    def test_admin_search_still_works(self):
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pw'))
+        response = self.client.get(reverse('admin:a_main_customerprofile_changelist'), {'q': 'Prefers'})
+        self.assertContains(response, 'ann')
+        self.assertNotContains(response, 'bob&#x27;s profile')
+
+
+class AppointmentHistoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('boss')
+        cls.manager.groups.add(Group.objects.get_or_create(name=MANAGERS_GROUP)[0])
+        cls.customer = CustomerProfile.objects.create(
+            user=User.objects.create_user('long', 'long@example.com'), interest='x')
+        at = now()
+        # Pairs share a date, so the id has to break ties.
+        Appointment.objects.bulk_create([
+            Appointment(customer=cls.customer, date=at - timedelta(days=i // 2),
+                        kp_notes=f"Note {i} " + "detail " * 500)
+            for i in range(60)
+        ])
+
+    def setUp(self):
+        roles.forget_group_ids()
+        self.client.force_login(self.manager)
+
+    def test_cursors_walk_the_whole_history_once(self):
+        response = self.client.get(reverse('customers-update', args=[self.customer.pk]))
+        self.assertEqual(len(response.context['appointments']), 25)
+        cursor = response.context['next_cursor']
+        self.assertContains(response, f'data-next="{cursor}"')
+        seen = [a.pk for a in response.context['appointments']]
+
+        url = reverse('customer-appointments', args=[self.customer.pk])
+        while cursor:
+            page = self.client.get(url, {'after': cursor}).json()
+            seen += [int(pk) for pk in re.findall(r'id="paid-(\d+)"', page['html'])]
+            cursor = page['next']
+        expected = list(Appointment.objects.filter(customer=self.customer)
+                        .order_by('-date', '-pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_pages_cost_the_same_at_any_depth_and_skip_notes(self):
+        url = reverse('customer-appointments', args=[self.customer.pk])
+        first = self.client.get(url).json()
+        with CaptureQueriesContext(connection) as shallow:
+            self.client.get(url, {'after': first['next']})
+        deep = Appointment.objects.filter(customer=self.customer).order_by('-date', '-pk')[54]
+        with CaptureQueriesContext(connection) as deeper:
+            page = self.client.get(url, {'after': encode_cursor(deep.date, deep.pk)}).json()
+        self.assertEqual(len(shallow), len(deeper))
+        self.assertIsNone(page['next'])
+        history = [q['sql'] for q in deeper if 'a_main_appointment' in q['sql']][0]
+        self.assertEqual(history.count('"kp_notes"'), history.count('SUBSTR("a_main_appointment"."kp_notes"'))
+        self.assertIn('Note 0', first['html'])
+        self.assertNotIn('detail detail detail detail detail', first['html'])
+
+    def test_bad_cursor_starts_over(self):
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        page = self.client.get(reverse('customer-appointments', args=[self.customer.pk]),
+                               {'after': 'not-a-cursor'}).json()
+        self.assertIsNotNone(page['next'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(SimpleTestCase):
+    """Routing decisions only; no replica connection is ever opened."""
+
+    def route(self, view, method='get', cookies=None, write=False, url_name='index',
+              namespace=''):
+        """Read aliases seen by ``view`` (before and after any write)."""
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = SimpleNamespace(url_name=url_name, namespace=namespace)
+        seen = []
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            seen.append(router.db_for_read(Content))
+            if write:
+                router.db_for_write(Contact)
+                seen.append(router.db_for_read(Content))
+            seen.append(router.db_for_read(Session))
+            return HttpResponse()
+
+        middleware = ReplicaMiddleware(get_response)
+        return seen, middleware(request)
+
+    def test_opted_in_safe_requests_read_from_a_replica(self):
+        seen, response = self.route(views.SearchView.as_view())
+        self.assertEqual(seen, ['replica1', 'default'])
+        self.assertNotIn(ReplicaMiddleware.PIN_COOKIE, response.cookies)
+        seen, _ = self.route(views.ExportView.as_view(), method='head')
+        self.assertEqual(seen[0], 'replica1')
+
+    def test_other_requests_read_from_the_primary(self):
+        self.assertEqual(self.route(views.ContactView.as_view())[0][0], 'default')
+        self.assertEqual(self.route(views.SearchView.as_view(), method='post')[0][0], 'default')
+        # Their ETag comes from the primary; see ConditionalContentMixin.
+        self.assertEqual(self.route(views.IndexView.as_view())[0][0], 'default')
+        self.assertEqual(self.route(views.FAQView.as_view())[0][0], 'default')
+        self.assertEqual(router.db_for_read(Content), 'default')
+
+    def test_admin_changelists_read_from_a_replica(self):
+        seen, _ = self.route(lambda request: None, namespace='admin',
+                             url_name='a_main_appointment_changelist')
+        self.assertEqual(seen[0], 'replica1')
+        seen, _ = self.route(lambda request: None, namespace='admin',
+                             url_name='a_main_appointment_change')
+        self.assertEqual(seen[0], 'default')
+
+    def test_a_write_pins_the_request_and_the_client_to_the_primary(self):
+        seen, response = self.route(views.SearchView.as_view(), write=True)
+        self.assertEqual(seen, ['replica1', 'default', 'default'])
+        self.assertIn(ReplicaMiddleware.PIN_COOKIE, response.cookies)
+
+        seen, _ = self.route(views.SearchView.as_view(),
+                             cookies={ReplicaMiddleware.PIN_COOKIE: '1'})
+        self.assertEqual(seen[0], 'default')
+
+
+class ReplicaStickinessTests(TestCase):
+
+    def test_contact_submission_pins_the_sender(self):
+        self.assertNotIn(ReplicaMiddleware.PIN_COOKIE, self.client.get(reverse('index')).cookies)
+        with mock.patch.object(MicrosoftGraphEmailSender, 'send_email', return_value=True):
+            response = self.client.post(reverse('contact'), {
+                'name': 'Jane', 'email': 'jane@example.com', 'subject': '[Coaching]',
+                'message': 'Hello there, I would like to know more.'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(ReplicaMiddleware.PIN_COOKIE, response.cookies)
+
+
+class ContentAPITests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.items = make_content('FAQ', 3, media_per_item=2)
+        make_content('FAQ', 1, enabled=False)
+        self.url = reverse('content-api', args=['faq'])
+
+    def test_document_lists_enabled_items_with_media(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['type'], 'FAQ')
+        self.assertEqual([item['id'] for item in body['items']],
+                         [item.pk for item in reversed(self.items)])
+        media = body['items'][0]['media']
+        self.assertEqual(len(media), 2)
+        self.assertTrue(media[0]['thumbnail'])
+        self.assertTrue(response['ETag'])
+        self.assertTrue(response['Last-Modified'])
+
+    def test_cached_and_conditional_requests_skip_the_database(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_sparse_fieldsets(self):
+        items = self.client.get(self.url, {'fields': 'title,id'}).json()['items']
+        self.assertEqual(list(items[0]), ['id', 'title'])
+        response = self.client.get(self.url, {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['message'])
+        self.assertEqual(self.client.get(reverse('content-api', args=['nope'])).status_code, 404)
+
+    def test_content_and_media_changes_give_a_new_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        item = self.items[0]
+        ContentMedia.objects.create(content=item, file='faq/new.jpg')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['items'][-1]['media']), 3)
+
+        etag = response['ETag']
+        Content.objects.get(pk=self.items[1].pk).delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['items']), 2)
+
+
+class ConditionalPageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_content('FAQ', 3)
+        make_content('CARD', 2)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_returning_visitor_gets_304_without_queries(self):
+        response = self.client.get(reverse('faq'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age=0', response['Cache-Control'])
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('faq'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        response = self.client.get(reverse('index'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_content_changes_invalidate_the_etag(self):
+        etag = self.client.get(reverse('about'))['ETag']
+        Content.objects.create(title='New Card', content_type='CARD')
+        response = self.client.get(reverse('about'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'New Card')
+
+    def test_logged_in_pages_have_their_own_etag(self):
+        anonymous = self.client.get(reverse('faq'))['ETag']
+        user = User.objects.create_user('visitor')
+        self.client.force_login(user)
+        response = self.client.get(reverse('faq'), HTTP_IF_NONE_MATCH=anonymous)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+        response = self.client.get(reverse('faq'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ConditionalPageReplicaTests(TransactionTestCase):
+    """Public reads go to the "replica" mirror, a second connection."""
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+
+    def test_new_etag_never_labels_an_old_body(self):
+        etag = self.client.get(reverse('faq'))['ETag']
+        Content.objects.create(title='Fresh Answer', content_type='FAQ')
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(reverse('faq'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'Fresh Answer')
+        self.assertEqual(len(replica), 0)
+
+
+class AnonymousFastPathTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_content('CARD', 2)
+        make_content('FAQ', 2)
+
+    def test_cookieless_pages_never_load_a_session_or_user(self):
+        for url_name in ('index', 'faq'):
+            with self.subTest(url_name=url_name):
+                response = self.client.get(reverse(url_name))
+                request = response.wsgi_request
+                self.assertFalse(request.session.accessed)
+                self.assertIs(request.user._wrapped, empty)
+                self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+                self.assertIn('Cookie', response['Vary'])
+                self.assertContains(response, 'Login')
+
+    @override_settings(PUBLIC_PAGE_SHARED_MAX_AGE=60)
+    def test_anonymous_pages_are_shareable_and_logged_in_ones_private(self):
+        response = self.client.get(reverse('faq'))
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('s-maxage=60', response['Cache-Control'])
+
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pw'))
+        response = self.client.get(reverse('faq'))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertContains(response, 'root')
+        self.assertContains(response, 'Django Admin')
+
+    def test_flash_messages_use_a_cookie_not_the_session(self):
+        response = self.client.get(reverse('magic-login', args=['not-a-token']))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('messages', response.cookies)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+
+class WorkerStartupTests(TestCase):
+
+    def test_production_worker_boots_without_heavy_sdks(self):
+        boot = startup.boot_worker()
+        self.assertTrue(boot['ok'], boot.get('error'))
+        self.assertEqual(boot['loaded'], [])
+
+    def test_lazy_modules_load_on_first_use(self):
+        module = lazy_import('colorsys')
+        self.assertEqual(module.rgb_to_hsv(0, 0, 0), (0.0, 0.0, 0.0))
+        self.assertIs(lazy_import('colorsys'), module)
+        with self.assertRaises(ModuleNotFoundError):
+            lazy_import('no_such_module_here')
+
+    def test_importtime_report_skips_interpreter_startup(self):
+        log = (
+            "import time:       400 |       2000 |   certifi\n"
+            "import time:       100 |       2500 | site\n"
+            "import time:       300 |       9000 |   django.conf\n"
+            "import time:       200 |       4000 |     django.utils\n"
+            "import time:       100 |      12000 | project.wsgi\n"
+        )
+        self.assertEqual(startup.top_imports(log), [['django', 9.0]])
@@ -1,7 +1,40 @@
 from django.urls import path
 from django.contrib.auth.views import LogoutView
 
-from .views import *
+from .views import (
+    AboutView,
+    AppointmentDeleteView,
+    AppointmentUpdateView,
+    CampaignCreateView,
+    CampaignProgressView,
+    ContactView,
+    ContentAPIView,
+    ContentCreateView,
+    ContentDeleteView,
+    ContentListView,
+    ContentUpdateView,
+    CustomLoginView,
+    CustomerAppointmentsView,
+    CustomersListView,
+    CustomersUpdateView,
+    ExportView,
+    FAQView,
+    FailedPermissionsView,
+    IndexView,
+    MagicLinkLoginView,
+    ManagersView,
+    PrivacyView,
+    SearchView,
+    SendFailView,
+    SentView,
+    TermsView,
+    UsersView,
+    bulk_update_appointment_status,
+    download_appointment_ics,
+    performance_metrics,
+    send_appointment_invite_view,
+    update_appointment_status,
+)
 
 appname = "a_main"
 
@@ -23,13 +56,22 @@ urlpatterns = [
     path('login/', CustomLoginView.as_view(), name='login'),
     path('managers/', ManagersView.as_view(), name='managers'),
     path('users/', UsersView.as_view(), name='users'),
+    path('campaigns/create/', CampaignCreateView.as_view(), name='campaign-create'),
+    path('campaigns/progress/', CampaignProgressView.as_view(), name='campaign-progress'),
+    path('exports/<str:name>/', ExportView.as_view(), name='export'),
+    path('search/', SearchView.as_view(), name='search'),
     path('customers/', CustomersListView.as_view(), name='customers-list'),
     path('customers/<int:pk>/update/',
          CustomersUpdateView.as_view(), name='customers-update'),
+    path('customers/<int:pk>/appointments/',
+         CustomerAppointmentsView.as_view(), name='customer-appointments'),
     path('appointments/<int:pk>/update/',
          AppointmentUpdateView.as_view(), name='appointment-update'),
     path('appointments/<int:pk>/delete/',
          AppointmentDeleteView.as_view(), name='appointment-delete'),
+    path('appointments/update_status/',
+         bulk_update_appointment_status,
+         name='appointment-bulk-update-status'),
     path('appointments/<int:pk>/update_status/',
          update_appointment_status,
          name='appointment-update-status'),
@@ -47,4 +89,7 @@ urlpatterns = [
          ContentDeleteView.as_view(), name='content-delete'),
     path('magic-login/<str:token>/',
          MagicLinkLoginView.as_view(), name='magic-login'),
+    path('api/content/<str:content_type>/',
+         ContentAPIView.as_view(), name='content-api'),
+    path('metrics/', performance_metrics, name='performance-metrics'),
 ]
@@ -1,5 +1,4 @@
 import logging
-from ics import Calendar, Event
 from datetime import timedelta
 from django.conf import settings
 from django.contrib import messages
@@ -8,144 +7,38 @@ import tempfile
 import os
 from typing import List, Optional
 
+from .emails import render_email
+from .lazy import lazy_import
 from .microsoft_graph import MicrosoftGraphEmailSender
 
+ics = lazy_import('ics')
+
 logger = logging.getLogger(__name__)
 
 
 def send_contact_email(context):
+    email_context = {
+        'name': context.name,
+        'email': context.email,
+        'interest': context.interest,
+        'message': context.instance.message,
+    }
+    host_email = render_email('a_main/contact/contact_host', email_context)
+    user_email = render_email('a_main/contact/contact_user', email_context)
+
     email_sender = MicrosoftGraphEmailSender()
     if email_sender.send_email(
         to_email=settings.EMAIL_HOST_USER,
         is_html=True,
         subject=f"{context.interest} - {context.name} - {context.email}",
-        message=f"""
-            <!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN" "http://www.w3.org/TR/html4/loose.dtd">
-            <html lang="en">
-                <head>
-                    <meta http-equiv="Content-Type" content="text/html; charset=UTF-8">
-                    <meta name="viewport" content="width=device-width, initial-scale=1">
-                    <meta http-equiv="X-UA-Compatible" content="IE=edge">
-                    <title>Message Received</title>
-                </head>
-                <body style="margin:0; padding:0; background-color:#F2F2F2; font-family: Arial, sans-serif; color:#333333;">
-                    <center>
-                        <!-- Main Wrapper -->
-                        <table width="100%" border="0" cellpadding="0" cellspacing="0" bgcolor="#F2F2F2">
-                            <tr>
-                                <td align="center" valign="top">
-                                    <!-- Header Section -->
-                                    <table width="600" border="0" cellpadding="0" cellspacing="0" style="max-width:600px;">
-                                        <tr>
-                                            <td align="center" valign="top" style="padding:20px 0;">
-                                                <img src="https://dyvlife.your-voyage.life/static/images/header_brand.png" width="200" height="auto" alt="Your-Voyage Logo" style="display:block; height:auto;">
-                                            </td>
-                                        </tr>
-                                    </table>
-
-                                    <!-- Content Section -->
-                                    <table width="600" border="0" cellpadding="0" cellspacing="0" bgcolor="#FFFFFF" style="max-width:600px; border-radius:4px; box-shadow:0 2px 4px rgba(0,0,0,0.1);">
-                                        <tr>
-                                            <td align="left" valign="top" style="padding:40px 30px;">
-                                                <h1 style="margin:0 0 20px 0; font-size:24px; color:#333333;">
-                                                {context.name} has reached out with the following interest: {context.interest}.
-                                                </h1>
-
-                                                <p style="margin:0 0 20px 0; font-size:16px; line-height:24px;">
-                                                    Hello {context.name},
-                                                </p>
-
-                                                <p style="margin:0 0 20px 0; font-size:16px; line-height:24px;">
-                                                    Here is what they had to say:\n\n{context.instance.message}.
-                                                </p>
-                                            </td>
-                                        </tr>
-                                    </table>
-
-                                    <!-- Footer Section -->
-                                    <table width="600" border="0" cellpadding="0" cellspacing="0" style="max-width:600px;">
-                                        <tr>
-                                            <td align="center" valign="top" style="padding:20px 0; color:#999999; font-size:12px;">
-                                                &copy; 2025 Your-Voyage.life All rights reserved.
-                                            </td>
-                                        </tr>
-                                    </table>
-                                </td>
-                            </tr>
-                        </table>
-                    </center>
-                </body>
-            </html>
-        """
+        message=host_email.html,
+        text_message=host_email.text,
     ) and email_sender.send_email(
         to_email=context.email,
         is_html=True,
         subject="Your-Voyage has Received Your Message",
-        message=f"""
-            <!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN" "http://www.w3.org/TR/html4/loose.dtd">
-            <html lang="en">
-                <head>
-                    <meta http-equiv="Content-Type" content="text/html; charset=UTF-8">
-                    <meta name="viewport" content="width=device-width, initial-scale=1">
-                    <meta http-equiv="X-UA-Compatible" content="IE=edge">
-                    <title>Message Received</title>
-                </head>
-                <body style="margin:0; padding:0; background-color:#F2F2F2; font-family: Arial, sans-serif; color:#333333;">
-                    <center>
-                        <!-- Main Wrapper -->
-                        <table width="100%" border="0" cellpadding="0" cellspacing="0" bgcolor="#F2F2F2">
-                            <tr>
-                                <td align="center" valign="top">
-                                    <!-- Header Section -->
-                                    <table width="600" border="0" cellpadding="0" cellspacing="0" style="max-width:600px;">
-                                        <tr>
-                                            <td align="center" valign="top" style="padding:20px 0;">
-                                                <img src="https://dyvlife.your-voyage.life/static/images/header_brand.png" width="200" height="auto" alt="Your-Voyage Logo" style="display:block; height:auto;">
-                                            </td>
-                                        </tr>
-                                    </table>
-
-                                    <!-- Content Section -->
-                                    <table width="600" border="0" cellpadding="0" cellspacing="0" bgcolor="#FFFFFF" style="max-width:600px; border-radius:4px; box-shadow:0 2px 4px rgba(0,0,0,0.1);">
-                                        <tr>
-                                            <td align="left" valign="top" style="padding:40px 30px;">
-                                                <h1 style="margin:0 0 20px 0; font-size:24px; color:#333333;">Message Received!</h1>
-
-                                                <p style="margin:0 0 20px 0; font-size:16px; line-height:24px;">
-                                                    Hello {context.name},
-                                                </p>
-
-                                                <p style="margin:0 0 20px 0; font-size:16px; line-height:24px;">
-                                                    Thank you for reaching out to Your-Voyage regarding {context.interest}.<br>
-                                                    We have received your message and will get back to you shortly.
-                                                </p>
-
-                                                <p style="margin:0 0 10px 0; font-size:16px; line-height:24px;">
-                                                    Best Regards,
-                                                </p>
-
-                                                <p style="margin:0; font-size:16px; line-height:24px;">
-                                                    Xiaoyang
-                                                </p>
-                                            </td>
-                                        </tr>
-                                    </table>
-
-                                    <!-- Footer Section -->
-                                    <table width="600" border="0" cellpadding="0" cellspacing="0" style="max-width:600px;">
-                                        <tr>
-                                            <td align="center" valign="top" style="padding:20px 0; color:#999999; font-size:12px;">
-                                                &copy; 2025 Your-Voyage.life All rights reserved.
-                                            </td>
-                                        </tr>
-                                    </table>
-                                </td>
-                            </tr>
-                        </table>
-                    </center>
-                </body>
-            </html>
-        """,
+        message=user_email.html,
+        text_message=user_email.text,
     ):
         return redirect('sent')
     else:
@@ -154,8 +47,8 @@ def send_contact_email(context):
 
 def generate_ics_for_appointment(appointment):
     """Generate ICS file content for an appointment."""
-    cal = Calendar()
-    event = Event()
+    cal = ics.Calendar()
+    event = ics.Event()
     event.name = f"Appointment with {appointment.customer.user.get_full_name() or appointment.customer.user.username}"
     event.begin = appointment.date
     event.end = appointment.date + \
@@ -174,71 +67,11 @@ def send_calendar_invite(request, appointment):
     ics_content = generate_ics_for_appointment(appointment)
 
     subject_template = f"Your-Voyage Appointment Confirmation: {appointment.date.strftime('%Y-%m-%d %H:%M')}"
-    body_template = f"""
-                <!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN" "http://www.w3.org/TR/html4/loose.dtd">
-            <html lang="en">
-                <head>
-                    <meta http-equiv="Content-Type" content="text/html; charset=UTF-8">
-                    <meta name="viewport" content="width=device-width, initial-scale=1">
-                    <meta http-equiv="X-UA-Compatible" content="IE=edge">
-                    <title>Message Received</title>
-                </head>
-                <body style="margin:0; padding:0; background-color:#F2F2F2; font-family: Arial, sans-serif; color:#333333;">
-                    <center>
-                        <!-- Main Wrapper -->
-                        <table width="100%" border="0" cellpadding="0" cellspacing="0" bgcolor="#F2F2F2">
-                            <tr>
-                                <td align="center" valign="top">
-                                    <!-- Header Section -->
-                                    <table width="600" border="0" cellpadding="0" cellspacing="0" style="max-width:600px;">
-                                        <tr>
-                                            <td align="center" valign="top" style="padding:20px 0;">
-                                                <img src="https://dyvlife.your-voyage.life/static/images/header_brand.png" width="200" height="auto" alt="Your-Voyage Logo" style="display:block; height:auto;">
-                                            </td>
-                                        </tr>
-                                    </table>
-
-                                    <!-- Content Section -->
-                                    <table width="600" border="0" cellpadding="0" cellspacing="0" bgcolor="#FFFFFF" style="max-width:600px; border-radius:4px; box-shadow:0 2px 4px rgba(0,0,0,0.1);">
-                                        <tr>
-                                            <td align="left" valign="top" style="padding:40px 30px;">
-                                                <h1 style="margin:0 0 20px 0; font-size:24px; color:#333333;">Appointment Confirmation</h1>
-
-                                                <p style="margin:0 0 20px 0; font-size:16px; line-height:24px;">
-                                                    Hello {user.get_full_name() or user.username},,
-                                                </p>
-
-                                                <p style="margin:0 0 20px 0; font-size:16px; line-height:24px;">
-                                                    This is a confirmation for your appointment on {appointment.date.strftime('%Y-%m-%d at %H:%M')}.<br>
-                                                    For your convienience, a calendar invite is attached.
-                                                </p>
-
-                                                <p style="margin:0 0 10px 0; font-size:16px; line-height:24px;">
-                                                    Best Regards,
-                                                </p>
-
-                                                <p style="margin:0; font-size:16px; line-height:24px;">
-                                                    Xiaoyang
-                                                </p>
-                                            </td>
-                                        </tr>
-                                    </table>
-
-                                    <!-- Footer Section -->
-                                    <table width="600" border="0" cellpadding="0" cellspacing="0" style="max-width:600px;">
-                                        <tr>
-                                            <td align="center" valign="top" style="padding:20px 0; color:#999999; font-size:12px;">
-                                                &copy; 2025 Your-Voyage.life All rights reserved.
-                                            </td>
-                                        </tr>
-                                    </table>
-                                </td>
-                            </tr>
-                        </table>
-                    </center>
-                </body>
-            </html>
-    """
+    body = render_email('a_main/contact/appt_confirmation', {
+        'name': user.get_full_name() or user.username,
+        'date': appointment.date,
+    })
+
     # Create email
     email_sender = MicrosoftGraphEmailSender()
 
@@ -255,7 +88,8 @@ def send_calendar_invite(request, appointment):
             success = email_sender.send_email(
                 to_email=user.email,
                 subject=subject_template,
-                message=body_template,
+                message=body.html,
+                text_message=body.text,
                 bcc_recipients=[settings.EMAIL_HOST_USER],
                 attachments=[temp_path],
                 is_html=True
@@ -276,34 +110,18 @@ def send_calendar_invite(request, appointment):
 
 
 def send_magic_link_email(request, context):
-    customer = context.customer
-    user = customer.user
-    subject_template = "Your Magic Login Link"
-    body_template = f'''
-    Hello {context.profile.user.username},
-
-    You requested a magic login link. Click the link below to access your account:
-
-    {context.login_url}
-
-    This link will expire in 24 hours.
-
-    If you didn't request this, please ignore this email.
-    '''
-
-    html_template = f'''
-    <p>Hello {context.profile.user.username},</p>
-    <p>You requested a magic login link. Click the button below to access your account:</p>
-    <p><a href="{context.login_url}" class="btn btn-primary">Login Now</a></p>
-    <p>This link will expire in 24 hours.</p>
-    <p>If you didn't request this, please ignore this email.</p>
-    '''
+    user = context['user']
+    body = render_email('a_main/email/magic_link', {
+        'name': user.get_full_name() or user.username,
+        'login_url': context['login_url'],
+    })
     email_sender = MicrosoftGraphEmailSender()
     if email_sender.send_email(
         to_email=user.email,
-        subject=subject_template,
-        message=body_template,
-        # attachments=ics_content
+        subject="Your Magic Login Link",
+        message=body.html,
+        text_message=body.text,
+        is_html=True,
     ):
         messages.success(request, "Magic link sent successfully!")
     else:
@@ -1,4 +1,11 @@
 import json
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models.functions import Substr
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, quote_etag
 from django.views.generic import TemplateView, CreateView, UpdateView, DetailView, ListView, View, DeleteView
 from django.contrib.auth.views import LoginView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
@@ -7,62 +14,39 @@ from django.shortcuts import redirect, get_object_or_404
 from django.urls import reverse_lazy, reverse
 from django.contrib import messages
 from django.contrib.auth import login
-from django.http import JsonResponse, HttpResponseRedirect, HttpResponse
+from django.contrib.auth.models import User
+from django.http import Http404, JsonResponse, HttpResponseRedirect, HttpResponse
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 
-from .models import CustomerProfile, Appointment, Content
-from .forms import *
+from .models import CustomerProfile, Appointment, Campaign, Content, ContentMedia, MagicLinkToken
+from .campaigns import audience_sizes, create_campaign
+from . import rollups
+from .forms import (AppointmentForm, CampaignForm, ContactForm, ContentCreateForm,
+                    ContentUpdateForm, CustomerUpdateForm, LoginForm)
+from .content import (API_FIELDS, build_content_elements, content_version, load_api_content,
+                      load_content, templates_stamp)
+from .exports import EXPORTS, export_response
+from .search import global_search
+from .pagination import keyset_page
 
 from .utils import send_calendar_invite, send_magic_link_email, generate_ics_for_appointment
+from .instrumentation import histograms
+from .roles import get_roles
+from .ratelimit import RateLimitMixin, Rule
 
 # ======================
 # CUSTOM MIXINS
 # ======================
 
 
-class UserGroupContextMixin:
-    """Adds user group information to context."""
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        # Pass cards in, mainly for the header.  Only need title and url
-        cards = Content.objects.filter(
-            content_type='CARD',
-            enabled=True
-        ).order_by('-created_at')
-
-        context['cards'] = [
-            {'id': card.id, 'title': card.title}
-            for card in cards
-        ]
-
-        user = self.request.user
-
-        if user.is_authenticated:
-            context['is_customer'] = user.groups.filter(
-                name='Customers Group').exists()
-            context['is_manager'] = user.groups.filter(
-                name='Managers Group').exists()
-            context['is_superuser'] = user.is_superuser
-            context['is_manager_or_superuser'] = context['is_manager'] or context['is_superuser']
-        else:
-            context['is_customer'] = False
-            context['is_manager'] = False
-            context['is_superuser'] = False
-            context['is_manager_or_superuser'] = False
-
-        return context
-
-
 class ManagerOrSuperuserRequiredMixin(UserPassesTestMixin):
     """Checks if user is manager or superuser."""
     permission_denied_message = "You must be a Manager or Superuser to access this page."
     login_url = 'login'
 
     def test_func(self):
-        user = self.request.user
-        return user.is_superuser or user.groups.filter(name='Managers Group').exists()
+        return get_roles(self.request).is_manager_or_superuser
 
     def handle_no_permission(self):
         if not self.request.user.is_authenticated:
@@ -73,28 +57,30 @@ class ManagerOrSuperuserRequiredMixin(UserPassesTestMixin):
 # ======================
 # AUTH VIEWS
 # ======================
-class MagicLinkLoginView(UserGroupContextMixin, View):
+class MagicLinkLoginView(RateLimitMixin, View):
+    ratelimit_rules = (
+        Rule('magic-login', 'ip', limit=10, window=300, methods=('GET',)),
+    )
+
     def get(self, request, token):
-        from .models import CustomerProfile
-        try:
-            profile = CustomerProfile.objects.get(
-                magic_link_token=token,
-                magic_link_expires__gt=now()
-            )
-            profile.magic_link_token = None
-            profile.magic_link_expires = None
-            profile.save()
-            login(request, profile.user)
-            return redirect('users')
-        except CustomerProfile.DoesNotExist:
+        user_id = MagicLinkToken.objects.consume(token)
+        if user_id is None:
             messages.error(request, "Invalid or expired login link.")
             return redirect('login')
+        # The first backend loads request.user the way later requests will.
+        login(request, User.objects.get(pk=user_id),
+              backend=settings.AUTHENTICATION_BACKENDS[0])
+        return redirect('users')
 
 
-class CustomLoginView(UserGroupContextMixin, LoginView):
+class CustomLoginView(RateLimitMixin, LoginView):
     form_class = LoginForm
     template_name = 'a_main/auth/login.html'
     redirect_authenticated_user = True
+    ratelimit_rules = (
+        Rule('login', 'ip', limit=20, window=300),
+        Rule('login', 'username', limit=10, window=300),
+    )
 
     def get_success_url(self):
         user = self.request.user
@@ -108,68 +94,103 @@ class CustomLoginView(UserGroupContextMixin, LoginView):
         if user.is_staff:
             pass
 
-        if user.groups.filter(name='Managers Group').exists():
+        roles = get_roles(self.request)
+        if roles.is_manager:
             return reverse_lazy('managers')
-        elif user.groups.filter(name='Customers Group').exists():
+        elif roles.is_customer:
             return reverse_lazy('users')
 
         return reverse_lazy('index')
 
 
-class FailedPermissionsView(UserGroupContextMixin, TemplateView):
+class FailedPermissionsView(TemplateView):
     template_name = "a_main/auth/no_permissions.html"
 
 
 # ======================
 # CORE VIEWS
 # ======================
-class IndexView(UserGroupContextMixin, TemplateView):
+class ConditionalContentMixin:
+    """
+    Answers conditional GETs of the public content pages before rendering.
+
+    The ETag combines the shared content version, the templates stamp (so
+    a deploy changing the pages invalidates it) and who is viewing, since
+    the header shows the user and their role links.  Last-Modified is only
+    sent to anonymous visitors, whose page depends on nothing else.  A
+    returning visitor costs at most the cache lookup of the version.
+
+    Anonymous pages may be kept by shared caches (nginx, a CDN) for
+    PUBLIC_PAGE_SHARED_MAX_AGE seconds; they vary on Cookie, and the proxy
+    should bypass its cache for requests carrying a session cookie.
+
+    The version is read from the primary, so these pages render from it
+    too: a replica that has not caught up would serve the old body under
+    the new ETag, and every later revalidation would keep it.  Renders are
+    rare anyway; most requests end in a 304 or a shared cache hit.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+
+        version, last_modified = content_version()
+        stamp = templates_stamp()
+        roles = get_roles(request)
+        viewer = 'anon'
+        if roles.is_authenticated:
+            flags = roles.as_context().values()
+            viewer = f"{roles.user_id}-{''.join('1' if flag else '0' for flag in flags)}"
+            last_modified = None
+        else:
+            last_modified = max(int(last_modified.timestamp()) if last_modified else 0, stamp)
+        etag = quote_etag(f"{version}.{stamp:x}.{viewer}")
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        if roles.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            # Browsers revalidate every time; shared caches may hold it briefly.
+            patch_cache_control(response, public=True, max_age=0,
+                                s_maxage=getattr(settings, 'PUBLIC_PAGE_SHARED_MAX_AGE', 0))
+        # The session middleware only adds this when the session was read,
+        # which the anonymous fast path avoids.
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+
+class IndexView(ConditionalContentMixin, TemplateView):
     template_name = "a_main/index.html"
 
     def get_context_data(self, **kwargs):
+        # Cards and banners come back from one content load.
+        content = load_content('CARD', 'BANNER')
         context = super().get_context_data(**kwargs)
-        # Cards are already passed into context via UserGroupContentMixin
-        # But need to override to get images and descriptions.
-        cards = Content.objects.filter(
-            content_type='CARD',
-            enabled=True
-        ).order_by('-created_at').order_by('order').prefetch_related('media_files')
-
-        card_data = []
-
-        for card in cards:
-            media_file = card.media_files.first()
-            card_data.append({
-                'id': card.id,
-                'title': card.title,
-                'description': card.description,
-                'image_url': media_file.file.url if media_file else None,
-            })
-        context['cards'] = card_data
-        # Still need to pass in banners and images
-        banners = Content.objects.filter(
-            content_type='BANNER',
-            enabled=True
-        ).order_by('-created_at').order_by('order').prefetch_related('media_files')
-
-        banner_data = []
-
-        for banner in banners:
-            media_file = banner.media_files.first()
-            banner_data.append({
-                'id': banner.id,
-                'title': banner.title,
-                'message': banner.description,
-                'image_url': media_file.file.url if media_file else None,
-            })
-        context['banners'] = banner_data
+        context['cards'] = content['CARD']
+        context['banners'] = content['BANNER']
         return context
 
 
-class ContactView(UserGroupContextMixin, CreateView):
+class ContactView(RateLimitMixin, CreateView):
     form_class = ContactForm
     template_name = "a_main/contact/contact.html"
     success_url = reverse_lazy('sent')
+    ratelimit_rules = (
+        Rule('contact', 'ip', limit=5, window=600),
+        Rule('contact', 'email', limit=3, window=3600),
+    )
+    honeypot_field = 'website'
+
+    def honeypot_response(self):
+        # Look exactly like a successful submission to the bot.
+        return HttpResponseRedirect(self.success_url)
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
@@ -185,51 +206,15 @@ class ContactView(UserGroupContextMixin, CreateView):
         return context
 
 
-class ContentView(UserGroupContextMixin, TemplateView):
-    model = Content
+class ContentView(ConditionalContentMixin, TemplateView):
     template_name = None
     context_type = None
-    context_object_name = 'content_items'
-
-    def get_queryset(self):
-        queryset = super().get_queryset()
-        return queryset.filter(
-            content_type=self.content_type,
-            enabled=True
-        ).order_by('order').prefetch_related('media_files')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-
-        content_items = Content.objects.filter(
-            content_type=self.context_type,
-            enabled=True
-        ).order_by('order').prefetch_related('media_files')
-
+        content_items = load_content(self.context_type)[self.context_type]
         # Flatten all content while tracking image positions
-        image_position = 0
-        content_elements = []
-
-        for item in content_items:
-            # Add images first with their alignment
-            for media in item.media_files.all():
-                if media.media_type == 'IMAGE':
-                    alignment = 'left' if image_position % 2 == 0 else 'right'
-                    content_elements.append({
-                        'type': 'image',
-                        'media': media,
-                        'alignment': alignment
-                    })
-                    image_position += 1
-
-            # Then add the text content
-            if item.title or item.description:
-                content_elements.append({
-                    'type': 'text',
-                    'item': item
-                })
-
-        context['content_elements'] = content_elements
+        context['content_elements'] = build_content_elements(content_items)
         return context
 
 
@@ -253,34 +238,120 @@ class PrivacyView(ContentView):
     template_name = "a_main/privacy.html"
 
 
-class SentView(UserGroupContextMixin, TemplateView):
+class SentView(TemplateView):
     template_name = "a_main/contact/message_sent.html"
 
 
-class SendFailView(UserGroupContextMixin, TemplateView):
+class SendFailView(TemplateView):
     template_name = "a_main/contact/message_send_fail.html"
 
 
 # ======================
 # ROLE-SPECIFIC VIEWS
 # ======================
-class UsersView(UserGroupContextMixin, LoginRequiredMixin, TemplateView):
+class UsersView(LoginRequiredMixin, TemplateView):
     login_url = 'login'
     template_name = "a_main/users/users.html"
 
 
-class ManagersView(ManagerOrSuperuserRequiredMixin, UserGroupContextMixin, TemplateView):
+class ManagersView(ManagerOrSuperuserRequiredMixin, TemplateView):
     template_name = "a_main/managers/managers.html"
+    use_replica = True
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # One query each: the form's audience counts and recent campaigns.
+        context.setdefault('campaign_form', CampaignForm(audience_sizes=audience_sizes()))
+        context['campaigns'] = Campaign.objects.select_related('created_by')[:10]
+        context['dashboard'] = rollups.dashboard()
+        context['exports'] = [('customers', 'Customers'), ('appointments', 'Appointments'),
+                              ('messages', 'Messages')]
+        return context
+
+
+# ======================
+# CAMPAIGN VIEWS
+# ======================
+class CampaignCreateView(ManagerOrSuperuserRequiredMixin, View):
+    """Queue a bulk email; run_campaigns sends it in the background."""
+
+    def post(self, request, *args, **kwargs):
+        form = CampaignForm(request.POST)
+        if form.is_valid():
+            campaign = create_campaign(
+                form.cleaned_data['kind'], form.cleaned_data['audience'],
+                created_by=request.user)
+            messages.success(
+                request, f"Queued {campaign.total} emails: {campaign}.")
+        else:
+            messages.error(request, "Could not queue the campaign.")
+        return redirect('managers')
+
+
+class CampaignProgressView(ManagerOrSuperuserRequiredMixin, View):
+    """Progress of the given (or the most recent) campaigns, for polling."""
+
+    def get(self, request, *args, **kwargs):
+        campaigns = Campaign.objects.only(
+            'status', 'total', 'sent', 'failed', 'finished_at')
+        ids = [int(pk) for pk in request.GET.getlist('id') if pk.isdigit()]
+        campaigns = campaigns.filter(pk__in=ids) if ids else campaigns[:10]
+        return JsonResponse({'campaigns': [
+            {
+                'id': campaign.pk,
+                'status': campaign.status,
+                'total': campaign.total,
+                'sent': campaign.sent,
+                'failed': campaign.failed,
+                'percent': campaign.percent,
+            }
+            for campaign in campaigns
+        ]})
+
+
+# ======================
+# EXPORT VIEWS
+# ======================
+class ExportView(ManagerOrSuperuserRequiredMixin, View):
+    """Download a whole table as CSV (streamed) or, with ?format=xlsx, XLSX."""
+    use_replica = True
+
+    def get(self, request, name, *args, **kwargs):
+        export = EXPORTS.get(name)
+        if export is None:
+            raise Http404("Unknown export")
+        # The CSV body streams after the request's routing has ended, so
+        # bind the queryset to the database chosen for this request now.
+        queryset = export.get_queryset()
+        queryset = queryset.using(router.db_for_read(queryset.model))
+        return export_response(export, request.GET.get('format', 'csv'), queryset)
+
+
+# ======================
+# SEARCH VIEWS
+# ======================
+class SearchView(ManagerOrSuperuserRequiredMixin, TemplateView):
+    """Search customers, appointment notes and messages at once."""
+    template_name = 'a_main/managers/search.html'
+    use_replica = True
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()[:200]
+        context['query'] = query
+        context['results'] = global_search(query) if query else None
+        return context
 
 
 # ======================
 # CUSTOMERS VIEWS
 # ======================
-class CustomersListView(ManagerOrSuperuserRequiredMixin, UserGroupContextMixin, ListView):
+class CustomersListView(ManagerOrSuperuserRequiredMixin, ListView):
     model = CustomerProfile
     paginate_by = 20
     template_name = 'a_main/managers/customers/customers-list.html'
     context_object_name = 'customers'
+    use_replica = True
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -317,17 +388,37 @@ class CustomersListView(ManagerOrSuperuserRequiredMixin, UserGroupContextMixin,
         return super().get(request, *args, **kwargs)
 
 
-class CustomersUpdateView(ManagerOrSuperuserRequiredMixin, UserGroupContextMixin, UpdateView):
+APPOINTMENT_PAGE_SIZE = 25
+
+
+def appointment_history(customer_id, cursor=None):
+    """
+    One page of a customer's appointments, newest first, and the cursor of
+    the next.  Only a preview of the notes is read; they can be long.
+    """
+    appointments = (
+        Appointment.objects
+        .filter(customer_id=customer_id)
+        .only('id', 'date', 'invoiced', 'paid')
+        .annotate(kp_preview=Substr('kp_notes', 1, 40), fu_preview=Substr('fu_notes', 1, 40))
+    )
+    return keyset_page(appointments, APPOINTMENT_PAGE_SIZE, cursor)
+
+
+class CustomersUpdateView(ManagerOrSuperuserRequiredMixin, UpdateView):
     model = CustomerProfile
     form_class = CustomerUpdateForm
     template_name = 'a_main/managers/customers/customers-update.html'
     success_url = reverse_lazy('customers-list')
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('user')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         customer = self.object
         context['title'] = f"Update Customer: {customer.user.get_full_name() or customer.user.username}"
-        context['appointments'] = customer.appointments.all().order_by('-date')
+        context['appointments'], context['next_cursor'] = appointment_history(customer.pk)
         context['appointment_form'] = AppointmentForm(
             initial={'customer': customer}
         )
@@ -362,62 +453,131 @@ class CustomersUpdateView(ManagerOrSuperuserRequiredMixin, UserGroupContextMixin
             return self.form_invalid(form)
 
 
+class CustomerAppointmentsView(ManagerOrSuperuserRequiredMixin, View):
+    """The next page of a customer's history as rendered rows, for scrolling."""
+
+    def get(self, request, pk, *args, **kwargs):
+        appointments, next_cursor = appointment_history(pk, request.GET.get('after'))
+        html = render_to_string('a_main/managers/customers/appointment_rows.html',
+                                {'appointments': appointments}, request=request)
+        return JsonResponse({'html': html, 'next': next_cursor})
+
+
 # ======================
 # CUSTOMER APPOINTMENT VIEWS
 # ======================
 
 
+APPOINTMENT_STATUS_FIELDS = ('invoiced', 'paid')
+
+# Most changes one bulk request may carry.
+MAX_STATUS_CHANGES = 500
+
+
+def _can_update_status(user):
+    return user.is_staff or user.is_superuser
+
+
+def _status_error(message, status):
+    return JsonResponse({'success': False, 'message': message}, status=status)
+
+
 @require_POST
 @login_required
 def update_appointment_status(request, pk):
+    # Verify permission first - user must be staff or superuser
+    if not _can_update_status(request.user):
+        return _status_error('Permission denied', 403)
     try:
-        # Parse JSON data from request body
         data = json.loads(request.body)
-        field = data.get('field')
-        value = data.get('value')
+    except json.JSONDecodeError:
+        return _status_error('Invalid JSON data', 400)
 
-        # Validate input
-        if field not in ['invoiced', 'paid']:
-            return JsonResponse({
-                'success': False,
-                'message': 'Invalid field'
-            }, status=400)
+    field = data.get('field')
+    value = data.get('value')
+    if field not in APPOINTMENT_STATUS_FIELDS:
+        return _status_error('Invalid field', 400)
+    if not isinstance(value, bool):
+        return _status_error('Invalid value', 400)
 
-        # Get appointment
-        appointment = Appointment.objects.get(pk=pk)
+    try:
+        # date too: the rollup signal flags that day.
+        appointment = Appointment.objects.only('pk', 'date', field).get(pk=pk)
+    except Appointment.DoesNotExist:
+        return _status_error('Appointment not found', 404)
 
-        # Verify permission - user must be staff or superuser
-        if not request.user.is_staff and not request.user.is_superuser:
-            return JsonResponse({
-                'success': False,
-                'message': 'Permission denied'
-            }, status=403)
+    setattr(appointment, field, value)
+    appointment.save(update_fields=[field, 'updated_at'])
 
-        # Update the field
-        setattr(appointment, field, value)
-        appointment.save()
+    return JsonResponse({
+        'success': True,
+        'message': f'Appointment {field} status updated successfully',
+        'new_value': value
+    })
 
-        return JsonResponse({
-            'success': True,
-            'message': f'Appointment {field} status updated successfully',
-            'new_value': value
-        })
 
-    except Appointment.DoesNotExist:
-        return JsonResponse({
-            'success': False,
-            'message': 'Appointment not found'
-        }, status=404)
-    except json.JSONDecodeError:
-        return JsonResponse({
-            'success': False,
-            'message': 'Invalid JSON data'
-        }, status=400)
-    except Exception as e:
-        return JsonResponse({
-            'success': False,
-            'message': str(e)
-        }, status=500)
+@require_POST
+@login_required
+def bulk_update_appointment_status(request):
+    """
+    Apply ``{"changes": [{"id", "field", "value"}, ...]}`` in one go.
+
+    Every change is validated before anything is written.  Changes are
+    then grouped by field and value, so the whole request costs one
+    existence check, at most one UPDATE per group and one rollup flag, in
+    one transaction.
+    """
+    if not _can_update_status(request.user):
+        return _status_error('Permission denied', 403)
+    try:
+        changes = json.loads(request.body).get('changes')
+    except (json.JSONDecodeError, AttributeError):
+        return _status_error('Invalid JSON data', 400)
+    if not isinstance(changes, list) or not changes:
+        return _status_error('Expected a list of changes', 400)
+    if len(changes) > MAX_STATUS_CHANGES:
+        return _status_error(f'At most {MAX_STATUS_CHANGES} changes per request', 400)
+
+    # (id, field) -> value; a later change to the same field wins.
+    latest = {}
+    for index, change in enumerate(changes):
+        if not isinstance(change, dict):
+            return _status_error(f'Change {index}: expected an object', 400)
+        pk, field, value = change.get('id'), change.get('field'), change.get('value')
+        if not isinstance(pk, int) or isinstance(pk, bool):
+            return _status_error(f'Change {index}: invalid id', 400)
+        if field not in APPOINTMENT_STATUS_FIELDS:
+            return _status_error(f'Change {index}: invalid field', 400)
+        if not isinstance(value, bool):
+            return _status_error(f'Change {index}: invalid value', 400)
+        latest[pk, field] = value
+
+    groups = {}
+    for (pk, field), value in latest.items():
+        groups.setdefault((field, value), []).append(pk)
+
+    ids = {pk for pk, _ in latest}
+    with transaction.atomic():
+        dates = dict(Appointment.objects.filter(pk__in=ids).values_list('pk', 'date'))
+        missing = sorted(ids - dates.keys())
+        if missing:
+            return JsonResponse({
+                'success': False,
+                'message': 'Appointment not found',
+                'missing': missing,
+            }, status=404)
+        updated_at = now()
+        for (field, value), pks in groups.items():
+            Appointment.objects.filter(pk__in=pks).update(
+                **{field: value, 'updated_at': updated_at})
+        # update() sends no signals; flag the rollup days here.
+        rollups.mark_dirty_at(*dates.values())
+
+    return JsonResponse({
+        'success': True,
+        'message': f'{len(latest)} appointment status changes applied',
+        'updated': len(ids),
+    })
 
 
 def send_appointment_invite_view(request, pk):
@@ -440,7 +600,7 @@ def download_appointment_ics(request, pk):
     return response
 
 
-class AppointmentUpdateView(ManagerOrSuperuserRequiredMixin, UserGroupContextMixin, UpdateView):
+class AppointmentUpdateView(ManagerOrSuperuserRequiredMixin, UpdateView):
     model = Appointment
     form_class = AppointmentForm
     template_name = 'a_main/managers/customers/appointment-update.html'
@@ -456,7 +616,7 @@ class AppointmentUpdateView(ManagerOrSuperuserRequiredMixin, UserGroupContextMix
         return context
 
 
-class AppointmentDeleteView(ManagerOrSuperuserRequiredMixin, UserGroupContextMixin, DeleteView):
+class AppointmentDeleteView(ManagerOrSuperuserRequiredMixin, DeleteView):
     model = Appointment
     template_name = 'a_main/managers/customers/appointment-confirm-delete.html'
 
@@ -474,7 +634,7 @@ class AppointmentDeleteView(ManagerOrSuperuserRequiredMixin, UserGroupContextMix
 # ======================
 
 
-class ContentListView(ManagerOrSuperuserRequiredMixin, UserGroupContextMixin, ListView):
+class ContentListView(ManagerOrSuperuserRequiredMixin, ListView):
     model = Content
     template_name = 'a_main/managers/content/content-list.html'
     context_object_name = 'contents'
@@ -523,7 +683,7 @@ class ContentListView(ManagerOrSuperuserRequiredMixin, UserGroupContextMixin, Li
         return context
 
 
-class ContentDeleteView(ManagerOrSuperuserRequiredMixin, UserGroupContextMixin, DeleteView):
+class ContentDeleteView(ManagerOrSuperuserRequiredMixin, DeleteView):
     model = Content
     template_name = None  # Disable template rendering completely
 
@@ -540,7 +700,7 @@ class ContentDeleteView(ManagerOrSuperuserRequiredMixin, UserGroupContextMixin,
         return f"{url}?type={content_type}" if content_type else url
 
 
-class ContentCreateView(ManagerOrSuperuserRequiredMixin, UserGroupContextMixin, CreateView):
+class ContentCreateView(ManagerOrSuperuserRequiredMixin, CreateView):
     model = Content
     form_class = ContentCreateForm
     template_name = 'a_main/managers/content/content-create.html'
@@ -579,7 +739,7 @@ class ContentCreateView(ManagerOrSuperuserRequiredMixin, UserGroupContextMixin,
         return context
 
 
-class ContentUpdateView(ManagerOrSuperuserRequiredMixin, UserGroupContextMixin, UpdateView):
+class ContentUpdateView(ManagerOrSuperuserRequiredMixin, UpdateView):
     model = Content
     form_class = ContentUpdateForm
     template_name = 'a_main/managers/content/content-update.html'
@@ -616,3 +776,68 @@ class ContentUpdateView(ManagerOrSuperuserRequiredMixin, UserGroupContextMixin,
             context['existing_media'] = self.object.media_files.first()
 
         return context
+
+
+# ======================
+# API VIEWS
+# ======================
+class ContentAPIView(View):
+    """
+    Read-only JSON of the enabled content of one type, e.g. /api/content/faq/.
+
+    ``?fields=id,title,media`` limits each item to the listed fields.
+    Responses carry an ETag and Last-Modified, and a matching conditional
+    request gets a 304 straight from the cached document.  Not routed to a
+    replica: a cache miss must not refill the cache from a lagging copy.
+    """
+
+    def get(self, request, content_type, *args, **kwargs):
+        content_type = content_type.upper()
+        if content_type not in dict(Content.CONTENT_TYPES):
+            raise Http404("Unknown content type")
+
+        fields = API_FIELDS
+        if request.GET.get('fields'):
+            requested = set(request.GET['fields'].split(','))
+            unknown = requested - set(API_FIELDS)
+            if unknown:
+                return JsonResponse({
+                    'success': False,
+                    'message': f"Unknown fields: {', '.join(sorted(unknown))}",
+                }, status=400)
+            fields = [field for field in API_FIELDS if field in requested]
+
+        document = load_api_content(content_type)
+        etag = quote_etag(document['version'])
+        last_modified = document['last_modified']
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = JsonResponse({
+                'type': content_type,
+                'items': [{field: item[field] for field in fields}
+                          for item in document['items']],
+            })
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        # Clients and proxies may keep it but must check back every time.
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+
+# ======================
+# MONITORING VIEWS
+# ======================
+
+
+def performance_metrics(request):
+    """Per-URL-name latency histograms for this worker, Prometheus format."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorization = request.headers.get('Authorization', '')
+    if not (request.user.is_superuser or
+            (token and constant_time_compare(authorization, f'Bearer {token}'))):
+        return HttpResponse(status=403)
+    return HttpResponse(histograms.render_prometheus(),
+                        content_type='text/plain; version=0.0.4')
@@ -0,0 +1,50 @@
+import logging
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+
+logger = logging.getLogger('a_main.performance')
+
+TEMPLATE_EXTENSIONS = ('.html', '.txt')
+
+
+def template_names(app_label):
+    """Names of every template shipped in an app's templates directory."""
+    root = os.path.join(apps.get_app_config(app_label).path, 'templates')
+    for directory, _, files in os.walk(root):
+        for filename in sorted(files):
+            if filename.endswith(TEMPLATE_EXTENSIONS):
+                path = os.path.join(directory, filename)
+                yield os.path.relpath(path, root).replace(os.sep, '/')
+
+
+def warm_templates(app_labels=None):
+    """
+    Compile the templates of ``app_labels`` into the cached loader.
+
+    Meant to run once per worker at startup so the first requests do not
+    pay for loading and parsing.  Names are resolved like at request time,
+    so a template overridden by an earlier app is compiled in its
+    overriding version.  Returns the number of templates compiled.
+    """
+    if app_labels is None:
+        app_labels = getattr(settings, 'TEMPLATE_WARMUP_APPS', ())
+    start = time.perf_counter()
+    compiled = 0
+    for engine in engines.all():
+        if not hasattr(engine, 'engine'):
+            continue  # Not a DjangoTemplates backend.
+        for app_label in app_labels:
+            for name in template_names(app_label):
+                try:
+                    engine.get_template(name)
+                except (TemplateDoesNotExist, TemplateSyntaxError) as exc:
+                    logger.warning('Template warm-up skipped %s: %s', name, exc)
+                else:
+                    compiled += 1
+    logger.info('Warmed %d templates in %.1f ms',
+                compiled, (time.perf_counter() - start) * 1000)
+    return compiled
@@ -0,0 +1,242 @@
+# a_stripe/checkout.py
+import hashlib
+import json
+import time
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.timezone import now
+
+from a_main.instrumentation import timed
+from a_stripe.models import CheckoutSession, Coupon, Price
+from a_stripe.utils import stripe_client
+
+# Limits of a single cart, well inside Stripe's own.
+MAX_LINE_ITEMS = 20
+MAX_QUANTITY = 99
+
+# A cached session is dropped this long before Stripe expires it, so no
+# one is sent to a page that closes while they fill it in.
+EXPIRY_MARGIN = timedelta(minutes=5)
+
+# items: [(Price, quantity)] in price id order.
+Cart = namedtuple('Cart', ['items', 'coupon', 'currency', 'mode', 'amount_subtotal', 'digest'])
+
+
+class CheckoutError(Exception):
+    """The cart cannot be checked out; the message is safe to show."""
+
+
+def build_cart(price_ids, coupon_code=''):
+    """
+    Validate a cart against the local catalog.
+
+    ``price_ids`` may repeat a price to buy more than one.  Prices and the
+    coupon are read from our own tables, which the Stripe signals and
+    webhooks keep in step with Stripe, so a cart costs no API call.
+    """
+    quantities = Counter(price_id for price_id in price_ids if price_id)
+    if not quantities:
+        raise CheckoutError("Your cart is empty.")
+    if len(quantities) > MAX_LINE_ITEMS or max(quantities.values()) > MAX_QUANTITY:
+        raise CheckoutError("Your cart is too large.")
+
+    prices = {
+        price.pk: price
+        for price in Price.objects
+        .filter(pk__in=quantities, active=True, product__active=True)
+        .select_related('product')
+    }
+    if len(prices) < len(quantities):
+        raise CheckoutError("Some items in your cart are no longer available.")
+    currencies = {price.currency for price in prices.values()}
+    if len(currencies) > 1:
+        raise CheckoutError("Items priced in different currencies cannot be bought together.")
+    currency = currencies.pop()
+
+    items = [(prices[price_id], quantities[price_id]) for price_id in sorted(quantities)]
+    coupon = find_coupon(coupon_code, items, currency) if coupon_code else None
+    recurring = any(price.recurring or price.recurring_interval for price, _ in items)
+    amounts = [price.unit_amount for price, _ in items]
+    subtotal = (None if None in amounts
+                else sum(price.unit_amount * quantity for price, quantity in items))
+    return Cart(
+        items=items,
+        coupon=coupon,
+        currency=currency,
+        mode='subscription' if recurring else 'payment',
+        amount_subtotal=subtotal,
+        digest=cart_digest(items, coupon),
+    )
+
+
+def find_coupon(code, items, currency):
+    """The active coupon ``code`` if it applies to ``items``."""
+    coupon = (
+        Coupon.objects
+        .filter(code__iexact=code.strip(), active=True)
+        .prefetch_related('valid_for_prices', 'valid_for_products')
+        .first()
+    )
+    if coupon is None or (coupon.redeem_by and coupon.redeem_by <= now()):
+        raise CheckoutError("This coupon is not valid.")
+    if (coupon.discount_type == Coupon.DiscountType.FIXED
+            and (coupon.currency or '').lower() != currency.lower()):
+        raise CheckoutError("This coupon is not valid for your currency.")
+    valid_prices = {price.pk for price in coupon.valid_for_prices.all()}
+    valid_products = {product.pk for product in coupon.valid_for_products.all()}
+    if valid_prices or valid_products:
+        if not any(price.pk in valid_prices or price.product_id in valid_products
+                   for price, _ in items):
+            raise CheckoutError("This coupon does not apply to your cart.")
+    return coupon
+
+
+def cart_digest(items, coupon=None):
+    """A stable name for a cart: its prices, quantities and coupon."""
+    payload = json.dumps({
+        'items': [[price.pk, quantity] for price, quantity in items],
+        'coupon': coupon.pk if coupon else None,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cache_key(user_id, digest):
+    return f"stripe:checkout:{user_id}:{digest}"
+
+
+def session_window(at=None):
+    """
+    The idempotency window for ``at`` and the expiry of sessions made in it.
+
+    Sessions last STRIPE_CHECKOUT_SESSION_TTL from the start of a window
+    half as long, so a new one has at least half its lifetime left.  Both
+    follow from the clock alone, so a retry inside the window sends Stripe
+    the same parameters under the same idempotency key.
+    """
+    ttl = settings.STRIPE_CHECKOUT_SESSION_TTL
+    width = ttl // 2
+    window = int(at if at is not None else time.time()) // width
+    return window, window * width + ttl
+
+
+def forget_session(user_id, digest):
+    cache.delete(cache_key(user_id, digest))
+
+
+def checkout_session(user, cart, success_url, cancel_url):
+    """
+    An open Checkout Session for ``user``'s ``cart``, created if need be.
+
+    Refreshing the page or submitting the cart twice reuses the cached
+    session, then the stored one, so Stripe is called at most once per
+    cart.  Concurrent submissions that both miss share an idempotency key,
+    and Stripe hands them the same session.  Completed and expired
+    sessions are dropped from the cache by record_session_statuses and
+    refresh_session, and count towards the key, so buying the same cart
+    again gets a new session.
+    """
+    key = cache_key(user.pk, cart.digest)
+    session = cache.get(key)
+    if session is None:
+        session = (
+            CheckoutSession.objects
+            .filter(user=user, cart=cart.digest, status=CheckoutSession.Status.OPEN,
+                    expires_at__gt=now() + EXPIRY_MARGIN)
+            .first()
+        )
+    if session is None:
+        session = _create_session(user, cart, success_url, cancel_url)
+    remaining = session.expires_at - now() - EXPIRY_MARGIN
+    if remaining.total_seconds() > 0:
+        cache.set(key, session, timeout=int(remaining.total_seconds()))
+    return session
+
+
+def _create_session(user, cart, success_url, cancel_url):
+    window, expires_at = session_window()
+    closed = (CheckoutSession.objects.filter(user=user, cart=cart.digest)
+              .exclude(status=CheckoutSession.Status.OPEN).count())
+    params = {
+        'mode': cart.mode,
+        'line_items': [{'price': price.pk, 'quantity': quantity}
+                       for price, quantity in cart.items],
+        'success_url': success_url,
+        'cancel_url': cancel_url,
+        'client_reference_id': str(user.pk),
+        'expires_at': expires_at,
+        'metadata': {'cart': cart.digest, 'user': str(user.pk)},
+    }
+    if user.email:
+        params['customer_email'] = user.email
+    if cart.coupon:
+        params['discounts'] = [{'coupon': cart.coupon.pk}]
+
+    with timed('stripe'):
+        stripe_session = stripe_client().checkout.sessions.create(
+            params=params,
+            options={'idempotency_key': f"checkout:{user.pk}:{cart.digest}:{window}:{closed}"},
+        )
+    session, _ = CheckoutSession.objects.get_or_create(
+        id=stripe_session.id,
+        defaults={
+            'user': user,
+            'cart': cart.digest,
+            'line_items': params['line_items'],
+            'coupon': cart.coupon,
+            'mode': cart.mode,
+            'currency': cart.currency,
+            'amount_subtotal': stripe_session.get('amount_subtotal', cart.amount_subtotal),
+            'url': stripe_session.url,
+            'expires_at': datetime.fromtimestamp(
+                stripe_session.get('expires_at') or expires_at, timezone.utc),
+        },
+    )
+    return session
+
+
+def refresh_session(session):
+    """
+    Bring a stored session's status up to date with Stripe.
+
+    Only open sessions are fetched; once complete or expired a session no
+    longer changes.
+    """
+    if session.status != CheckoutSession.Status.OPEN:
+        return session
+    with timed('stripe'):
+        stripe_session = stripe_client().checkout.sessions.retrieve(session.pk)
+    if stripe_session.status != session.status:
+        session.status = stripe_session.status
+        session.save(update_fields=['status'])
+        forget_session(session.user_id, session.cart)
+    return session
+
+
+def record_session_statuses(stripe_sessions):
+    """
+    Close stored sessions that Stripe reports complete or expired.
+
+    ``stripe_sessions`` are Checkout Session objects, as dicts, from
+    webhook or API events; a buyer who paid but never came back to the
+    success page must not be sent to the same session again.
+    """
+    closing = {
+        stripe_session['id']: stripe_session['status']
+        for stripe_session in stripe_sessions
+        if stripe_session.get('status') in (CheckoutSession.Status.COMPLETE,
+                                            CheckoutSession.Status.EXPIRED)
+    }
+    if not closing:
+        return
+    sessions = list(CheckoutSession.objects
+                    .filter(pk__in=closing, status=CheckoutSession.Status.OPEN)
+                    .only('pk', 'user_id', 'cart'))
+    for status in set(closing.values()):
+        CheckoutSession.objects.filter(
+            pk__in=[session.pk for session in sessions if closing[session.pk] == status],
+        ).update(status=status)
+    for session in sessions:
+        forget_session(session.user_id, session.cart)
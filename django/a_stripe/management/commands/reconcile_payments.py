@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from a_stripe import reconciliation
+
+
+class Command(BaseCommand):
+    help = ('Mark appointments invoiced and paid from Stripe invoice and payment '
+            'events.  Run from cron; each run only applies events not seen before.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--fetch', action='store_true',
+                            help='Also pull events since the last checkpoint from the Stripe API, '
+                                 'for accounts without webhooks or to backfill missed ones')
+
+    def handle(self, *args, **options):
+        if options['fetch']:
+            received = reconciliation.fetch_events()
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'Fetched {received} events')
+        outcome = reconciliation.reconcile(options['batch_size'])
+        if options['verbosity'] >= 1:
+            self.stdout.write(
+                f"Applied {outcome['events']} events: {outcome['invoiced']} invoiced, "
+                f"{outcome['paid']} paid, {outcome['unmatched']} unknown appointments")
@@ -140,3 +140,75 @@ class Coupon(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+
+
+class CheckoutSession(models.Model):
+    """A Stripe Checkout Session created for one user's cart"""
+
+    class Status(models.TextChoices):
+        OPEN = 'open', _('Open')
+        COMPLETE = 'complete', _('Complete')
+        EXPIRED = 'expired', _('Expired')
+
+    # Matches Stripe ID format (cs_...)
+    id = models.CharField(max_length=255, primary_key=True)
+    user = models.ForeignKey(
+        'auth.User', related_name='checkout_sessions', on_delete=models.CASCADE)
+    # Digest of the line items and coupon, see checkout.Cart
+    cart = models.CharField(max_length=64)
+    line_items = models.JSONField(default=list)
+    coupon = models.ForeignKey(
+        Coupon, null=True, blank=True, on_delete=models.SET_NULL)
+    mode = models.CharField(max_length=20)
+    currency = models.CharField(max_length=3)
+    amount_subtotal = models.PositiveIntegerField(null=True, blank=True)
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.OPEN)
+    url = models.URLField(max_length=2000, blank=True)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.id} ({self.get_status_display()})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', 'cart', 'status'])]
+
+
+class StripeEvent(models.Model):
+    """
+    A Stripe event that can mark appointments invoiced or paid.
+
+    Webhooks and the reconciliation job's API pulls both store events
+    here, deduplicated by id; reconcile_payments applies unprocessed ones.
+    """
+    # Matches Stripe ID format (evt_...)
+    id = models.CharField(max_length=255, primary_key=True)
+    type = models.CharField(max_length=100)
+    created = models.DateTimeField()
+    # The event's data.object: the invoice, payment intent or session
+    data = models.JSONField(default=dict)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.type} {self.id}"
+
+    class Meta:
+        ordering = ['-created']
+        indexes = [
+            # The reconciliation job's queue.
+            models.Index(fields=['created', 'id'], condition=models.Q(processed_at__isnull=True),
+                         name='stripeevent_pending_idx'),
+        ]
+
+
+class ReconciliationCheckpoint(models.Model):
+    """How far back the next API pull of a source has to look"""
+    name = models.CharField(max_length=50, primary_key=True)
+    created = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.created}"
@@ -0,0 +1,190 @@
+# a_stripe/reconciliation.py
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from a_main import rollups
+from a_main.instrumentation import timed
+from a_main.models import Appointment
+from a_stripe.checkout import record_session_statuses
+from a_stripe.models import ReconciliationCheckpoint, StripeEvent
+from a_stripe.utils import stripe_client
+
+# Events whose object says an appointment was invoiced or paid.
+EVENT_TYPES = {
+    'invoice.finalized',
+    'invoice.marked_uncollectible',
+    'invoice.paid',
+    'invoice.payment_succeeded',
+    'payment_intent.succeeded',
+    'checkout.session.completed',
+    'checkout.session.async_payment_succeeded',
+    # Only closes the stored session; see checkout.record_session_statuses.
+    'checkout.session.expired',
+}
+
+# Metadata key on invoices, their lines, payment intents and Checkout
+# Sessions listing the appointment ids they bill, comma separated.
+METADATA_KEY = 'appointments'
+
+CHECKPOINT = 'events'
+
+# Stripe keeps events for 30 days; a first pull cannot look further back.
+EVENT_RETENTION = timedelta(days=30)
+
+PAGE_SIZE = 100
+
+
+def appointment_ids(obj):
+    """The appointment ids in the metadata of ``obj`` and its lines."""
+    sources = [obj.get('metadata') or {}]
+    sources += [line.get('metadata') or {}
+                for line in (obj.get('lines') or {}).get('data', [])]
+    ids = set()
+    for metadata in sources:
+        for value in str(metadata.get(METADATA_KEY, '')).split(','):
+            if value.strip().isdigit():
+                ids.add(int(value))
+    return ids
+
+
+def billing_state(obj):
+    """
+    ``(invoiced, paid)`` as shown by a Stripe object, or None when it
+    shows neither.
+
+    Flags are only ever set: a voided invoice or a refund is left to the
+    managers, who may have been paid some other way.
+    """
+    kind = obj.get('object')
+    if kind == 'invoice':
+        if obj.get('status') == 'paid':
+            return True, True
+        if obj.get('status') in ('open', 'uncollectible'):
+            return True, False
+    elif kind == 'payment_intent':
+        if obj.get('status') == 'succeeded':
+            return True, True
+    elif kind == 'checkout.session':
+        if obj.get('payment_status') in ('paid', 'no_payment_required'):
+            return True, True
+    return None
+
+
+def store_events(events):
+    """
+    Queue Stripe events, as dicts, for reconciliation.
+
+    Events seen before, through the other source, are ignored; so are
+    types that cannot change an appointment.  Checkout Sessions they
+    report complete or expired are closed right away rather than on the
+    next reconciliation run.
+    """
+    rows = [
+        StripeEvent(
+            id=event['id'],
+            type=event['type'],
+            created=datetime.fromtimestamp(event['created'], timezone.utc),
+            data=event['data']['object'],
+        )
+        for event in events if event.get('type') in EVENT_TYPES
+    ]
+    StripeEvent.objects.bulk_create(rows, ignore_conflicts=True)
+    record_session_statuses([row.data for row in rows
+                             if row.data.get('object') == 'checkout.session'])
+    return len(rows)
+
+
+def fetch_events():
+    """
+    Pull the events created since the checkpoint from the Stripe API.
+
+    For accounts without webhooks, and to backfill any a webhook missed.
+    The checkpoint moves to the newest event seen once every page is
+    stored, so an interrupted pull starts over; the second it stops at is
+    fetched again next time and its events are ignored as duplicates.
+    """
+    checkpoint = ReconciliationCheckpoint.objects.filter(name=CHECKPOINT).first()
+    since = checkpoint.created if checkpoint else now() - EVENT_RETENTION
+    params = {
+        'types': sorted(EVENT_TYPES),
+        'created': {'gte': int(since.timestamp())},
+        'limit': PAGE_SIZE,
+    }
+    newest, received = since, 0
+    while True:
+        with timed('stripe'):
+            page = stripe_client().events.list(params=params).last_response.data
+        events = page['data']
+        received += store_events(events)
+        if events:
+            newest = max(newest, datetime.fromtimestamp(
+                max(event['created'] for event in events), timezone.utc))
+        if not events or not page.get('has_more'):
+            break
+        # Newest first; carry on below the last one.
+        params['starting_after'] = events[-1]['id']
+    ReconciliationCheckpoint.objects.update_or_create(
+        name=CHECKPOINT, defaults={'created': newest})
+    return received
+
+
+def reconcile_batch(batch_size=500):
+    """
+    Apply one batch of unprocessed events, oldest first.
+
+    The batch costs the same handful of queries whatever its size: the
+    events, the appointments they name, one UPDATE per flag, the rollup
+    flags and marking the events processed, all in one transaction.  On
+    Postgres concurrent runs skip each other's locked events.
+    """
+    outcome = Counter()
+    with transaction.atomic():
+        pending = StripeEvent.objects.filter(processed_at__isnull=True).order_by('created', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        events = list(pending.only('id', 'data')[:batch_size])
+        if not events:
+            return outcome
+
+        invoiced, paid = set(), set()
+        for event in events:
+            state = billing_state(event.data)
+            if state is not None:
+                (paid if state[1] else invoiced).update(appointment_ids(event.data))
+        invoiced -= paid
+
+        appointments = {
+            pk: (date, is_invoiced, is_paid)
+            for pk, date, is_invoiced, is_paid in Appointment.objects
+            .filter(pk__in=invoiced | paid)
+            .values_list('pk', 'date', 'invoiced', 'paid')
+        }
+        to_invoice = [pk for pk in invoiced
+                      if pk in appointments and not appointments[pk][1]]
+        to_pay = [pk for pk in paid
+                  if pk in appointments and not all(appointments[pk][1:])]
+        at = now()
+        if to_invoice:
+            Appointment.objects.filter(pk__in=to_invoice).update(invoiced=True, updated_at=at)
+        if to_pay:
+            Appointment.objects.filter(pk__in=to_pay).update(invoiced=True, paid=True, updated_at=at)
+        # update() sends no signals; flag the rollup days here.
+        rollups.mark_dirty_at(*(appointments[pk][0] for pk in to_invoice + to_pay))
+        StripeEvent.objects.filter(pk__in=[event.pk for event in events]).update(processed_at=at)
+
+    outcome.update(events=len(events), invoiced=len(to_invoice), paid=len(to_pay),
+                   unmatched=len((invoiced | paid) - appointments.keys()))
+    return outcome
+
+
+def reconcile(batch_size=500):
+    """Apply every unprocessed event; returns the totals of all batches."""
+    total = Counter()
+    while True:
+        outcome = reconcile_batch(batch_size)
+        if not outcome:
+            return total
+        total.update(outcome)
@@ -1,10 +1,10 @@
 # a_stripe/management/commands/sync_products.py
 from django.core.management.base import BaseCommand
 from django.conf import settings
-import stripe
+from a_main.lazy import lazy_import
 from a_stripe.models import Product, Price
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+stripe = lazy_import('stripe')
 
 
 class Command(BaseCommand):
@@ -12,7 +12,7 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         # Sync Products
-        for stripe_product in stripe.Product.list().auto_paging_iter():
+        for stripe_product in stripe.Product.list(api_key=settings.STRIPE_SECRET_KEY).auto_paging_iter():
             product, _ = Product.objects.update_or_create(
                 id=stripe_product.id,
                 defaults={
@@ -24,7 +24,8 @@ class Command(BaseCommand):
             )
 
             # Sync Prices for each product
-            for stripe_price in stripe.Price.list(product=stripe_product.id).auto_paging_iter():
+            for stripe_price in stripe.Price.list(
+                    product=stripe_product.id, api_key=settings.STRIPE_SECRET_KEY).auto_paging_iter():
                 Price.objects.update_or_create(
                     id=stripe_price.id,
                     defaults={
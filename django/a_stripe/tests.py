@@ -1,3 +1,387 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+
+from a_main.models import Appointment, CustomerProfile, DailyRollup
+from . import reconciliation
+from .checkout import CheckoutError, build_cart, checkout_session
+from .models import (
+    CheckoutSession, Coupon, Price, Product, ReconciliationCheckpoint, StripeEvent)
+
+# Events recorded from GET /v1/events, oldest first.
+RECORDED_EVENTS = json.loads((Path(__file__).parent / 'testdata' / 'events.json').read_text())
+
+
+class StripeStub(BaseHTTPRequestHandler):
+    """
+    Just enough of the Stripe API for Checkout and the event list.
+
+    Records every request and, like Stripe, replays the first response to
+    a repeated idempotency key.  Lists ``server.events`` newest first.
+    """
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        params = {key: values[0] for key, values in parse_qs(body).items()}
+        self.server.calls.append(('POST', self.path, params, self.headers.get('Idempotency-Key')))
+        if self.path != '/v1/checkout/sessions':
+            return self.reply(404, {'error': {'type': 'invalid_request_error', 'message': 'Not found'}})
+        key = self.headers.get('Idempotency-Key')
+        if key not in self.server.replies:
+            number = len(self.server.sessions) + 1
+            session = {
+                'id': f"cs_test_{number}",
+                'object': 'checkout.session',
+                'url': f"https://checkout.stripe.com/c/pay/cs_test_{number}",
+                'status': 'open',
+                'mode': params.get('mode'),
+                'client_reference_id': params.get('client_reference_id'),
+                'expires_at': int(params['expires_at']),
+                'amount_subtotal': None,
+            }
+            self.server.sessions[session['id']] = session
+            self.server.replies[key] = session
+        self.reply(200, self.server.replies[key])
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values if key.startswith('types') else values[0]
+                 for key, values in parse_qs(url.query).items()}
+        self.server.calls.append(('GET', url.path, query, None))
+        if url.path == '/v1/events':
+            return self.list_events(query)
+        session = self.server.sessions.get(self.path.rpartition('/')[2])
+        if session is None:
+            return self.reply(404, {'error': {'type': 'invalid_request_error', 'message': 'No such session'}})
+        self.reply(200, session)
+
+    def list_events(self, query):
+        types = {value for key, values in query.items() if key.startswith('types') for value in values}
+        since = int(query.get('created[gte]', 0))
+        events = [event for event in reversed(self.server.events)
+                  if event['type'] in types and event['created'] >= since]
+        if 'starting_after' in query:
+            ids = [event['id'] for event in events]
+            events = events[ids.index(query['starting_after']) + 1:]
+        limit = int(query.get('limit', 10))
+        self.reply(200, {'object': 'list', 'url': '/v1/events',
+                         'data': events[:limit], 'has_more': len(events) > limit})
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StripeStubTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = ThreadingHTTPServer(('127.0.0.1', 0), StripeStub)
+        cls.stub.calls, cls.stub.sessions, cls.stub.replies, cls.stub.events = [], {}, {}, []
+        threading.Thread(target=cls.stub.serve_forever, daemon=True).start()
+        cls.settings_override = override_settings(
+            STRIPE_API_BASE=f"http://127.0.0.1:{cls.stub.server_address[1]}")
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.stub.shutdown()
+        cls.stub.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.stub.calls.clear()
+        self.stub.sessions.clear()
+        self.stub.replies.clear()
+        self.stub.events[:] = RECORDED_EVENTS
+        # bulk_create: the catalog signals would call Stripe for real.
+        Product.objects.bulk_create([
+            Product(id='prod_session', name="Coaching session"),
+            Product(id='prod_plan', name="Monthly plan"),
+            Product(id='prod_retired', name="Retired", active=False),
+        ])
+        Price.objects.bulk_create([
+            Price(id='price_session', product_id='prod_session', unit_amount=5000),
+            Price(id='price_plan', product_id='prod_plan', unit_amount=9900,
+                  recurring={'interval': 'month'}, recurring_interval='month'),
+            Price(id='price_euro', product_id='prod_session', unit_amount=4500, currency='eur'),
+            Price(id='price_retired', product_id='prod_retired', unit_amount=100),
+        ])
+        self.coupon = Coupon.objects.create(
+            id='co_spring', code='SPRING', discount_value=10)
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+
+    def stripe_calls(self, method='POST'):
+        return [call for call in self.stub.calls if call[0] == method]
+
+
+class CartTests(StripeStubTestCase):
+
+    def test_cart_is_priced_from_the_local_catalog(self):
+        with self.assertNumQueries(1):
+            cart = build_cart(['price_session', 'price_session'])
+        self.assertEqual([(price.pk, quantity) for price, quantity in cart.items],
+                         [('price_session', 2)])
+        self.assertEqual(cart.amount_subtotal, 10000)
+        self.assertEqual(cart.mode, 'payment')
+        self.assertEqual(build_cart(['price_plan']).mode, 'subscription')
+        self.assertEqual(self.stub.calls, [])
+
+    def test_digest_ignores_order_but_not_contents(self):
+        digest = build_cart(['price_session', 'price_plan']).digest
+        self.assertEqual(build_cart(['price_plan', 'price_session']).digest, digest)
+        self.assertNotEqual(build_cart(['price_plan']).digest, digest)
+        self.assertNotEqual(build_cart(['price_session', 'price_plan'], 'spring').digest, digest)
+
+    def test_invalid_carts_are_refused(self):
+        for price_ids in ([], ['price_missing'], ['price_retired'],
+                          ['price_session', 'price_euro'], ['price_session'] * 100):
+            with self.subTest(price_ids=price_ids[:2]), self.assertRaises(CheckoutError):
+                build_cart(price_ids)
+
+    def test_coupons_must_be_valid_for_the_cart(self):
+        self.assertEqual(build_cart(['price_session'], 'spring').coupon, self.coupon)
+        with self.assertRaises(CheckoutError):
+            build_cart(['price_session'], 'WINTER')
+        self.coupon.valid_for_products.add('prod_plan')
+        with self.assertRaises(CheckoutError):
+            build_cart(['price_session'], 'SPRING')
+        Coupon.objects.filter(pk=self.coupon.pk).update(redeem_by=now() - timedelta(days=1))
+        with self.assertRaises(CheckoutError):
+            build_cart(['price_plan'], 'SPRING')
+
+
+class CheckoutSessionTests(StripeStubTestCase):
+
+    def test_one_outbound_call_then_cached(self):
+        cart = build_cart(['price_session', 'price_session'], 'SPRING')
+        session = checkout_session(self.user, cart, 'https://x/ok', 'https://x/cancel')
+        self.assertEqual(len(self.stripe_calls()), 1)
+        _, path, params, key = self.stripe_calls()[0]
+        self.assertEqual(path, '/v1/checkout/sessions')
+        self.assertEqual(params['line_items[0][price]'], 'price_session')
+        self.assertEqual(params['line_items[0][quantity]'], '2')
+        self.assertEqual(params['discounts[0][coupon]'], 'co_spring')
+        self.assertEqual(params['metadata[cart]'], cart.digest)
+        self.assertTrue(key.startswith(f"checkout:{self.user.pk}:{cart.digest}:"))
+        self.assertEqual(CheckoutSession.objects.get().pk, session.pk)
+
+        with self.assertNumQueries(0):
+            again = checkout_session(self.user, cart, 'https://x/ok', 'https://x/cancel')
+        self.assertEqual(again.pk, session.pk)
+        self.assertEqual(len(self.stripe_calls()), 1)
+
+    def test_stored_session_survives_a_cache_flush(self):
+        cart = build_cart(['price_session'])
+        session = checkout_session(self.user, cart, 'https://x/ok', 'https://x/cancel')
+        cache.clear()
+        self.assertEqual(
+            checkout_session(self.user, cart, 'https://x/ok', 'https://x/cancel').pk, session.pk)
+        self.assertEqual(len(self.stripe_calls()), 1)
+
+    def test_lost_race_reuses_the_session_stripe_made(self):
+        # Both requests missed the cache; Stripe replays by idempotency key.
+        cart = build_cart(['price_session'])
+        first = checkout_session(self.user, cart, 'https://x/ok', 'https://x/cancel')
+        cache.clear()
+        CheckoutSession.objects.all().delete()
+        second = checkout_session(self.user, cart, 'https://x/ok', 'https://x/cancel')
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual(len(self.stub.sessions), 1)
+
+    def test_expiring_and_completed_sessions_are_replaced(self):
+        cart = build_cart(['price_session'])
+        session = checkout_session(self.user, cart, 'https://x/ok', 'https://x/cancel')
+        cache.clear()
+        self.stub.replies.clear()
+        CheckoutSession.objects.filter(pk=session.pk).update(expires_at=now() + timedelta(minutes=1))
+        fresh = checkout_session(self.user, cart, 'https://x/ok', 'https://x/cancel')
+        self.assertNotEqual(fresh.pk, session.pk)
+        self.assertEqual(len(self.stripe_calls()), 2)
+
+    def test_session_paid_without_returning_is_not_reused(self):
+        # The buyer paid and closed the tab; only the webhook tells us.
+        cart = build_cart(['price_session'])
+        session = checkout_session(self.user, cart, 'https://x/ok', 'https://x/cancel')
+        reconciliation.store_events([{
+            'id': 'evt_completed', 'type': 'checkout.session.completed', 'created': int(time.time()),
+            'data': {'object': {'id': session.pk, 'object': 'checkout.session',
+                                'status': 'complete', 'payment_status': 'paid', 'metadata': {}}},
+        }])
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'complete')
+
+        # Same cart, same idempotency window: still a new session.
+        fresh = checkout_session(self.user, cart, 'https://x/ok', 'https://x/cancel')
+        self.assertNotEqual(fresh.pk, session.pk)
+        keys = [key for _, _, _, key in self.stripe_calls()]
+        self.assertEqual(len(set(keys)), 2)
+
+
+class CheckoutViewTests(StripeStubTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def test_checkout_redirects_to_stripe(self):
+        response = self.client.post(reverse('checkout'), {'price': ['price_session']})
+        session = CheckoutSession.objects.get()
+        self.assertRedirects(response, session.url, fetch_redirect_response=False)
+        _, _, params, _ = self.stripe_calls()[0]
+        self.assertTrue(params['success_url'].endswith(
+            f"{reverse('checkout-success')}?session_id={{CHECKOUT_SESSION_ID}}"))
+
+        # A refresh of the form post is served from the cache.
+        self.client.post(reverse('checkout'), {'price': ['price_session']})
+        self.assertEqual(len(self.stripe_calls()), 1)
+
+    def test_ajax_errors_are_json(self):
+        response = self.client.post(
+            reverse('checkout'), {'price': ['price_missing']},
+            headers={'x-requested-with': 'XMLHttpRequest'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+        self.assertEqual(self.stub.calls, [])
+
+    def test_success_page_refreshes_status(self):
+        self.client.post(reverse('checkout'), {'price': ['price_session']})
+        session = CheckoutSession.objects.get()
+        self.stub.sessions[session.pk]['status'] = 'complete'
+        response = self.client.get(reverse('checkout-success'), {'session_id': session.pk})
+        self.assertContains(response, "Thank you for your order")
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'complete')
+        self.assertIsNone(cache.get(f"stripe:checkout:{self.user.pk}:{session.cart}"))
+
+    def test_success_page_is_private(self):
+        self.client.post(reverse('checkout'), {'price': ['price_session']})
+        session = CheckoutSession.objects.get()
+        self.client.force_login(User.objects.create_user('other', 'other@example.com', 'pw'))
+        response = self.client.get(reverse('checkout-success'), {'session_id': session.pk})
+        self.assertEqual(response.status_code, 404)
+
+    def test_checkout_requires_login(self):
+        self.client.logout()
+        response = self.client.post(reverse('checkout'), {'price': ['price_session']})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.stub.calls, [])
+
+
+def event_time(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+class ReconciliationTests(StripeStubTestCase):
+
+    def setUp(self):
+        super().setUp()
+        customer = CustomerProfile.objects.create(user=self.user, interest='x')
+        self.noon = now().replace(hour=12, minute=0, second=0, microsecond=0)
+        for pk in (101, 102, 103, 104, 105):
+            Appointment.objects.create(pk=pk, customer=customer, date=self.noon - timedelta(days=pk - 100))
+        # Start just before the recording.
+        ReconciliationCheckpoint.objects.create(
+            name=reconciliation.CHECKPOINT, created=event_time(RECORDED_EVENTS[0]['created'] - 60))
+
+    def flags(self):
+        return {pk: (invoiced, paid) for pk, invoiced, paid
+                in Appointment.objects.values_list('pk', 'invoiced', 'paid')}
+
+    def test_fetch_pages_through_events_since_the_checkpoint(self):
+        with mock.patch.object(reconciliation, 'PAGE_SIZE', 2):
+            received = reconciliation.fetch_events()
+        self.assertEqual(received, 6)
+        self.assertNotIn('evt_1QproductCreated', StripeEvent.objects.values_list('id', flat=True))
+        pages = self.stripe_calls('GET')
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(pages[1][2]['starting_after'], RECORDED_EVENTS[-2]['id'])
+        self.assertEqual(ReconciliationCheckpoint.objects.get().created,
+                         event_time(RECORDED_EVENTS[-1]['created']))
+
+    def test_reconcile_marks_matched_appointments(self):
+        reconciliation.fetch_events()
+        DailyRollup.objects.update(dirty=False)
+        outcome = reconciliation.reconcile()
+        self.assertEqual(outcome, {'events': 6, 'invoiced': 1, 'paid': 3, 'unmatched': 1})
+        self.assertEqual(self.flags(), {
+            101: (True, True), 102: (True, True), 103: (True, True),
+            104: (True, False), 105: (False, False)})
+        self.assertFalse(StripeEvent.objects.filter(processed_at__isnull=True).exists())
+        self.assertEqual(DailyRollup.objects.filter(dirty=True).count(), 4)
+
+    def test_batches_cost_the_same_queries(self):
+        reconciliation.fetch_events()
+        with self.assertNumQueries(8):
+            # savepoint, events, appointments, two updates, rollups, events, release
+            reconciliation.reconcile_batch(batch_size=500)
+        StripeEvent.objects.update(processed_at=None)
+        Appointment.objects.update(invoiced=False, paid=False)
+        with self.assertNumQueries(8):
+            reconciliation.reconcile_batch(batch_size=3)
+
+    def test_next_run_only_applies_new_events(self):
+        call_command('reconcile_payments', '--fetch', stdout=StringIO())
+        Appointment.objects.filter(pk=101).update(paid=False)
+        out = StringIO()
+        call_command('reconcile_payments', '--fetch', stdout=out)
+        self.assertIn('Applied 0 events', out.getvalue())
+        # The checkpoint second is listed again; its event is a duplicate.
+        self.assertEqual(self.stripe_calls('GET')[-1][2]['created[gte]'],
+                         str(RECORDED_EVENTS[-1]['created']))
+        self.assertFalse(Appointment.objects.get(pk=101).paid)
+
+        paid = dict(RECORDED_EVENTS[-1], id='evt_1QsessionPaidLater', created=RECORDED_EVENTS[-1]['created'] + 60)
+        paid['data'] = {'object': dict(paid['data']['object'], payment_status='paid')}
+        self.stub.events.append(paid)
+        out = StringIO()
+        call_command('reconcile_payments', '--fetch', stdout=out)
+        self.assertIn('Applied 1 events: 0 invoiced, 1 paid', out.getvalue())
+        self.assertEqual(self.flags()[105], (True, True))
+
+    def test_webhook_events_are_queued_once(self):
+        payload = json.dumps(RECORDED_EVENTS[3])
+        timestamp = int(time.time())
+        signature = hmac.new(settings.STRIPE_WEBHOOK_SECRET.encode(),
+                             f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+        for _ in range(2):
+            response = self.client.post(
+                reverse('stripe_webhook'), payload, content_type='application/json',
+                HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}")
+            self.assertEqual(response.status_code, 200)
+        reconciliation.fetch_events()
+        self.assertEqual(StripeEvent.objects.count(), 6)
+        self.assertEqual(reconciliation.reconcile()['paid'], 3)
+
+    def test_webhook_without_signature_is_refused(self):
+        response = self.client.post(
+            reverse('stripe_webhook'), json.dumps(RECORDED_EVENTS[3]),
+            content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
@@ -1,7 +1,10 @@
 # a_stripe/urls.py
 from django.urls import path
-from . import webhooks
+from . import views, webhooks
 
 urlpatterns = [
     path('webhook/', webhooks.stripe_webhook, name='stripe_webhook'),
+    path('checkout/', views.CheckoutView.as_view(), name='checkout'),
+    path('checkout/success/', views.CheckoutSuccessView.as_view(), name='checkout-success'),
+    path('checkout/cancel/', views.CheckoutCancelView.as_view(), name='checkout-cancel'),
 ]
@@ -1,29 +1,56 @@
 # a_stripe/utils.py
-import stripe
+import functools
+
 from django.conf import settings
 from a_stripe.models import Product
+from a_main.instrumentation import timed
+from a_main.lazy import lazy_import
+
+# Imported on the first Stripe call; the key is passed per call so that
+# setting it does not import the SDK at startup.
+stripe = lazy_import('stripe')
+
+
+@functools.cache
+def _client(api_key, api_base):
+    return stripe.StripeClient(
+        api_key,
+        base_addresses={'api': api_base} if api_base else {},
+        max_network_retries=2,
+    )
+
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+def stripe_client():
+    """
+    A StripeClient for STRIPE_SECRET_KEY, shared by the whole process so
+    its HTTP connections are reused.  STRIPE_API_BASE points it elsewhere,
+    e.g. at stripe-mock or a test stub.
+    """
+    return _client(settings.STRIPE_SECRET_KEY, getattr(settings, 'STRIPE_API_BASE', ''))
 
 
 def create_stripe_product(django_product):
     """Create a Stripe product from Django model"""
-    return stripe.Product.create(
-        id=str(django_product.id),
-        name=django_product.name,
-        description=django_product.description,
-        metadata=django_product.metadata
-    )
+    with timed('stripe'):
+        return stripe.Product.create(
+            id=str(django_product.id),
+            name=django_product.name,
+            description=django_product.description,
+            metadata=django_product.metadata,
+            api_key=settings.STRIPE_SECRET_KEY,
+        )
 
 
 def create_stripe_price(django_price):
     """Create a Stripe price from Django model"""
-    return stripe.Price.create(
-        product=str(django_price.product.id),
-        unit_amount=django_price.unit_amount,
-        currency=django_price.currency,
-        recurring={
-            'interval': django_price.recurring_interval,
-            'interval_count': django_price.recurring_interval_count
-        } if django_price.recurring_interval else None
-    )
+    with timed('stripe'):
+        return stripe.Price.create(
+            product=str(django_price.product.id),
+            unit_amount=django_price.unit_amount,
+            currency=django_price.currency,
+            recurring={
+                'interval': django_price.recurring_interval,
+                'interval_count': django_price.recurring_interval_count
+            } if django_price.recurring_interval else None,
+            api_key=settings.STRIPE_SECRET_KEY,
+        )
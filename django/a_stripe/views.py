@@ -1,3 +1,80 @@
-from django.shortcuts import render
+# a_stripe/views.py
+import logging
 
-# Create your views here.
+from django.contrib import messages
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse
+from django.views import View
+from django.views.generic import TemplateView
+
+from a_main.lazy import lazy_import
+from a_stripe.checkout import CheckoutError, build_cart, checkout_session, refresh_session
+from a_stripe.models import CheckoutSession
+
+logger = logging.getLogger(__name__)
+
+stripe = lazy_import('stripe')
+
+
+class CheckoutView(LoginRequiredMixin, View):
+    """
+    Send the user to Stripe Checkout for the posted cart.
+
+    The cart is one ``price`` per item (repeated for a larger quantity) and
+    an optional ``coupon`` code.  AJAX callers get the session URL as JSON.
+    """
+    http_method_names = ['post']
+
+    def post(self, request, *args, **kwargs):
+        ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+        try:
+            cart = build_cart(request.POST.getlist('price'), request.POST.get('coupon', ''))
+            session = checkout_session(
+                request.user, cart,
+                success_url=request.build_absolute_uri(reverse('checkout-success'))
+                + '?session_id={CHECKOUT_SESSION_ID}',
+                cancel_url=request.build_absolute_uri(reverse('checkout-cancel')),
+            )
+        except CheckoutError as e:
+            return self.failed(request, str(e), 400, ajax)
+        except stripe.StripeError:
+            logger.exception('Creating a Checkout Session failed')
+            return self.failed(
+                request, "Checkout is unavailable right now, please try again shortly.", 502, ajax)
+        if ajax:
+            return JsonResponse({'success': True, 'url': session.url})
+        return redirect(session.url)
+
+    def failed(self, request, message, status, ajax):
+        if ajax:
+            return JsonResponse({'success': False, 'message': message}, status=status)
+        messages.error(request, message)
+        return redirect('index')
+
+
+class CheckoutSuccessView(LoginRequiredMixin, TemplateView):
+    template_name = 'a_stripe/checkout_success.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        session = get_object_or_404(
+            CheckoutSession, pk=self.request.GET.get('session_id', ''), user=self.request.user)
+        try:
+            session = refresh_session(session)
+        except stripe.StripeError:
+            # Stripe will tell us by webhook; the page can say it is pending.
+            logger.exception('Refreshing Checkout Session %s failed', session.pk)
+        context['title'] = "Thank you"
+        context['session'] = session
+        return context
+
+
+class CheckoutCancelView(LoginRequiredMixin, TemplateView):
+    template_name = 'a_stripe/checkout_cancel.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['title'] = "Checkout cancelled"
+        return context
@@ -1,27 +1,30 @@
 # a_stripe/webhooks.py
 import json
-import stripe
+
 from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
+from a_main.lazy import lazy_import
 from a_stripe.models import Product, Price
+from a_stripe.reconciliation import EVENT_TYPES, store_events
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+stripe = lazy_import('stripe')
 
 
 @csrf_exempt
 def stripe_webhook(request):
     payload = request.body
-    sig_header = request.META['HTTP_STRIPE_SIGNATURE']
-    event = None
+    sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
+    if not sig_header:
+        return HttpResponse(status=400)
 
     try:
         event = stripe.Webhook.construct_event(
             payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
         )
-    except ValueError as e:
+    except ValueError:
         return HttpResponse(status=400)
-    except stripe.error.SignatureVerificationError as e:
+    except stripe.error.SignatureVerificationError:
         return HttpResponse(status=400)
 
     # Handle events
@@ -37,7 +40,7 @@ def stripe_webhook(request):
 
     elif event['type'] == 'price.created':
         price = event['data']['object']
-        Product.objects.filter(id=price.product).exists():
+        if Product.objects.filter(id=price.product).exists():
             Price.objects.update_or_create(
                 id=price.id,
                 defaults={
@@ -47,4 +50,8 @@ def stripe_webhook(request):
                 }
             )
 
+    elif event['type'] in EVENT_TYPES:
+        # Applied by reconcile_payments, in batches.
+        store_events([json.loads(payload)])
+
     return HttpResponse(status=200)
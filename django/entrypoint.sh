@@ -9,6 +9,7 @@ chmod -R 775 /project/staticfiles /project/mediafiles
 python manage.py makemigrations --noinput
 python manage.py migrate --noinput
 python manage.py createcachetable
+python manage.py merge_legacy_groups
 python manage.py collectstatic --noinput
 
 if [ "$DJANGO_SUPERUSER_USERNAME" ]
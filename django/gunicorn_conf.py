@@ -2,7 +2,7 @@
 # screen gunicorn -c gunicorn_conf.py project.wsgi:application
 bind = '0.0.0.0:8000'
 worker_class = 'sync'
-loglevel = 'debug'
+loglevel = 'info'
 accesslog = '/var/log/gunicorn/django_access_log'
 acceslogformat ="%(h)s %(l)s %(u)s %(t)s %(r)s %(s)s %(b)s %(f)s %(a)s"
 errorlog =  '/var/log/gunicorn/django_error_log'
@@ -6,7 +6,5 @@ def get_secret(secret_id, backup=None):
 # Keep at the end
 if get_secret('PIPELINE') == 'production':
     from .production import *
-    print("Loading production environment settings...")
 else:
-    from .development import *
-    print("Loading development environment settings...")
\ No newline at end of file
+    from .development import *
\ No newline at end of file
@@ -3,8 +3,6 @@ import mimetypes
 from os import sys
 from decouple import config
 
-print("Development environment settings loaded.")
-
 mimetypes.add_type("text/css", ".css", True)
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -34,13 +32,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'a_main.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'a_main.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'a_main.middleware.ProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'project.urls'
@@ -56,6 +57,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'a_main.context_processors.header',
             ],
         },
     },
@@ -63,13 +65,67 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'project.wsgi.application'
 
+# PERFORMANCE INSTRUMENTATION
+# Server-Timing headers expose db/render/outbound timings to the browser.
+PERFORMANCE_SERVER_TIMING = config(
+    "PERFORMANCE_SERVER_TIMING", default=True, cast=bool)
+# Bearer token allowing a scraper to read /metrics/ without a session.
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+# Superuser-only ?_profile=sample|cprofile: at most (count, per seconds)
+# profiled requests site-wide, optionally kept in PROFILER_ROOT.
+PROFILER_RATE_LIMIT = (config("PROFILER_RATE_LIMIT_COUNT", default=10, cast=int),
+                       config("PROFILER_RATE_LIMIT_SECONDS", default=3600, cast=int))
+PROFILER_ROOT = config("PROFILER_ROOT", default="")
+
+# RATE LIMITING
+# Contact, login and magic-link views; counters live in the default cache.
+RATELIMIT_ENABLED = config("RATELIMIT_ENABLED", default=True, cast=bool)
+# The dev server is hit directly, so X-Forwarded-For is not trusted.
+RATELIMIT_PROXY_HOPS = config("RATELIMIT_PROXY_HOPS", default=0, cast=int)
+
+# ANONYMOUS TRAFFIC
+# Flash messages ride in a cookie, so showing one never writes a session.
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+# No shared cache in front of the dev server.
+PUBLIC_PAGE_SHARED_MAX_AGE = 0
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'a_main.performance': {
+            'handlers': ['console'],
+            'level': config("PERFORMANCE_LOG_LEVEL",
+                            default='WARNING' if "test" in sys.argv else 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # A second connection to the same database, so tests can route reads
+    # to a "replica"; nothing reads from it unless listed below.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+# READ REPLICAS
+# None in development; see production.py.
+DATABASE_ROUTERS = ['a_main.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+
 # EMAIL CONFIG
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = config("EMAIL_HOST")
@@ -78,6 +134,8 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = config("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = config("EMAIL_HOST_USER")
+# Absolute base for links and images in outgoing emails.
+EMAIL_SITE_URL = config("EMAIL_SITE_URL", default="https://dyvlife.your-voyage.life")
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -104,6 +162,17 @@ USE_TZ = True
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# AUTHENTICATION BACKENDS
+# Loads request.user with its role version, see a_main.roles.
+# ModelBackend stays listed so sessions logged in before RoleVersionBackend
+# keep working; their role checks just load the version separately, and a
+# failed login is checked twice.  It can go once SESSION_COOKIE_AGE has
+# passed since the deploy.
+AUTHENTICATION_BACKENDS = [
+    'a_main.roles.RoleVersionBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 # LOGIN\OUT REDIRECTION
 LOGIN_URL = 'login'  # Where to redirect if the user is not authenticated
 # Where to redirect after login, use 'protected' if you want to redirect to the break out the login view, see urls.py
@@ -253,3 +322,7 @@ JAZZMIN_UI_TWEAKS = {
 STRIPE_PUBLIC_KEY = config('STRIPE_PK')
 STRIPE_SECRET_KEY = config('STRIPE_SK')
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WH')
+# Another API host for the Stripe client, e.g. stripe-mock in development.
+STRIPE_API_BASE = config('STRIPE_API_BASE', default='')
+# Lifetime of a Checkout Session; Stripe allows 30 minutes to 24 hours.
+STRIPE_CHECKOUT_SESSION_TTL = config('STRIPE_CHECKOUT_SESSION_TTL', default=3600, cast=int)
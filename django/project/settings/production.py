@@ -1,9 +1,7 @@
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import mimetypes
 
-print("Production environment settings loaded.")
-
 mimetypes.add_type("text/css", ".css", True)
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -36,13 +34,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'a_main.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'a_main.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'a_main.middleware.ProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'project.urls'
@@ -51,13 +52,21 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Explicit so it is obvious templates are parsed once per
+            # worker; project/wsgi.py fills the cache at startup.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'a_main.context_processors.header',
             ],
         },
     },
@@ -65,9 +74,43 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'project.wsgi.application'
 
+# Apps whose templates are precompiled when a worker starts.
+TEMPLATE_WARMUP_APPS = ('a_main', 'jazzmin')
+
+# PERFORMANCE INSTRUMENTATION
+# Server-Timing headers expose db/render/outbound timings and query counts
+# to every visitor (and shared caches), so they are off here; operators
+# have the structured log and the /metrics/ histograms.
+PERFORMANCE_SERVER_TIMING = config(
+    "PERFORMANCE_SERVER_TIMING", default=False, cast=bool)
+# Bearer token allowing a scraper to read /metrics/ without a session.
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+# Superuser-only ?_profile=sample|cprofile: at most (count, per seconds)
+# profiled requests site-wide, optionally kept in PROFILER_ROOT.
+PROFILER_RATE_LIMIT = (config("PROFILER_RATE_LIMIT_COUNT", default=10, cast=int),
+                       config("PROFILER_RATE_LIMIT_SECONDS", default=3600, cast=int))
+PROFILER_ROOT = config("PROFILER_ROOT", default="")
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'a_main.performance': {
+            'handlers': ['console'],
+            'level': config("PERFORMANCE_LOG_LEVEL", default='INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': f"django.db.backends.{config("DATABASE_ENGINE")}",
+        'ENGINE': f"django.db.backends.{config('DATABASE_ENGINE')}",
         'NAME': config("DATABASE_NAME"),
         'USER': config("DATABASE_USERNAME"),
         "PASSWORD": config("DATABASE_PASSWORD"),
@@ -76,6 +119,52 @@ DATABASES = {
     }
 }
 
+# READ REPLICAS
+# Comma-separated replica hosts, reached with the primary's credentials.
+# Public pages, reporting and admin changelists read from them; writes and
+# any client that wrote in the last REPLICA_STICKY_SECONDS use the primary.
+DATABASE_REPLICAS = []
+for number, host in enumerate(config("DATABASE_REPLICA_ADDRS", default="", cast=Csv()), 1):
+    alias = f"replica{number}"
+    DATABASES[alias] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['a_main.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = config("REPLICA_STICKY_SECONDS", default=15, cast=int)
+
+# CACHE CONFIG
+# Shared between gunicorn workers so invalidations (e.g. role changes) are
+# seen by every worker.  The table is created by `createcachetable` in
+# entrypoint.sh.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+    },
+    # Rate limit counters: in-process, so a hit costs no query.
+    'ratelimit': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ratelimit',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+}
+
+# RATE LIMITING
+# Contact, login and magic-link views.  Counters live in each worker's
+# 'ratelimit' cache, so a client spread over all workers gets up to
+# workers x limit; point RATELIMIT_CACHE at a shared Redis or memcached
+# cache, never the DatabaseCache, for site-wide counts.
+RATELIMIT_CACHE = config("RATELIMIT_CACHE", default='ratelimit')
+RATELIMIT_ENABLED = config("RATELIMIT_ENABLED", default=True, cast=bool)
+# nginx appends the client address to X-Forwarded-For; trust that one hop.
+RATELIMIT_PROXY_HOPS = config("RATELIMIT_PROXY_HOPS", default=1, cast=int)
+
+# ANONYMOUS TRAFFIC
+# Flash messages ride in a cookie, so showing one never writes a session.
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+# How long nginx may serve a public page to cookieless visitors before
+# revalidating it; see nginx.conf.
+PUBLIC_PAGE_SHARED_MAX_AGE = config("PUBLIC_PAGE_SHARED_MAX_AGE", default=60, cast=int)
+
 # EMAIL CONFIG
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = config("EMAIL_HOST")
@@ -84,6 +173,8 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = config("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = config("EMAIL_HOST_USER")
+# Absolute base for links and images in outgoing emails.
+EMAIL_SITE_URL = config("EMAIL_SITE_URL", default="https://dyvlife.your-voyage.life")
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -110,6 +201,17 @@ USE_TZ = True
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# AUTHENTICATION BACKENDS
+# Loads request.user with its role version, see a_main.roles.
+# ModelBackend stays listed so sessions logged in before RoleVersionBackend
+# keep working; their role checks just load the version separately, and a
+# failed login is checked twice.  It can go once SESSION_COOKIE_AGE has
+# passed since the deploy.
+AUTHENTICATION_BACKENDS = [
+    'a_main.roles.RoleVersionBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 # Authentication settings
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'protected'  # Where to redirect after login
@@ -247,3 +349,7 @@ JAZZMIN_UI_TWEAKS = {
 STRIPE_PUBLIC_KEY = config('STRIPE_PK')
 STRIPE_SECRET_KEY = config('STRIPE_SK')
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WH')
+# Another API host for the Stripe client, e.g. stripe-mock in development.
+STRIPE_API_BASE = config('STRIPE_API_BASE', default='')
+# Lifetime of a Checkout Session; Stripe allows 30 minutes to 24 hours.
+STRIPE_CHECKOUT_SESSION_TTL = config('STRIPE_CHECKOUT_SESSION_TTL', default=3600, cast=int)
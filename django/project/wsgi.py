@@ -1,7 +1,11 @@
 import os
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', f"{os.getenv('PROJECT_NAME', 'project')}.settings")
 
 application = get_wsgi_application()
 
+if getattr(settings, 'TEMPLATE_WARMUP_APPS', None):
+    from a_main.warmup import warm_templates
+    warm_templates()